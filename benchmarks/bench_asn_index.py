@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compare the asn index of PfxTable with filtering a full table scan.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import tracemalloc
+
+from common import fill_table, random_ipv4_records, report, timeit
+
+from _rtrlib import ffi, lib
+from rtrlib import PfxTable
+
+RECORDS = 100000
+ASNS = 1000
+
+
+def scan_for_asns(table, asns):
+    result = dict((asn, []) for asn in asns)
+
+    def callback(record, data):
+        if record.asn in data:
+            data[record.asn].append((record.prefix, record.min_len, record.max_len))
+
+    handle = ffi.new_handle((callback, result))
+    lib.pfx_table_for_each_ipv4_record(table.pfx_table, lib.pfx_table_callback, handle)
+    return result
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    asns = random.Random(2).sample(sorted(set(r[0] for r in records)), ASNS)
+
+    plain = PfxTable()
+    fill_table(plain, records)
+
+    tracemalloc.start()
+    indexed = PfxTable(asn_index=True)
+    fill_table(indexed, records)
+    index_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    scanned = scan_for_asns(plain, asns)
+    looked_up = indexed.records_for_asns(asns)
+    for asn in asns:
+        assert sorted(scanned[asn]) == sorted((r.prefix, r.min_len, r.max_len)
+                                              for r in looked_up[asn])
+
+    print('{} records, {} asns, index uses {:.1f} bytes per record'.format(
+        RECORDS, ASNS, float(index_size) / RECORDS))
+    report('records_for_asn (index)',
+           timeit(lambda: [indexed.records_for_asn(asn) for asn in asns]),
+           ASNS)
+    report('records_for_asns (index, batched)',
+           timeit(lambda: indexed.records_for_asns(asns)),
+           ASNS)
+    report('full scan, filtered for all asns at once',
+           timeit(lambda: scan_for_asns(plain, asns)),
+           ASNS)
+    report('full scan per asn (10 asns)',
+           timeit(lambda: [scan_for_asns(plain, [asn]) for asn in asns[:10]], 1),
+           10)
+
+    plain.close()
+    indexed.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Route Monitoring messages per second a BMP collector parses, validates
+and delivers, replayed by local clients standing in for routers.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+import time
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes
+
+from rtrlib import PfxTable
+from rtrlib.bmp import BMPCollector, BMPReplayClient, route_monitoring
+
+RECORDS = 100000
+MESSAGES = 50000
+PREFIXES = 4
+ROUTERS = 4
+
+
+def messages(routes, count):
+    result = []
+    for i in range(count):
+        chunk = routes[i * PREFIXES % len(routes):][:PREFIXES]
+        result.append(route_monitoring('192.0.2.%d' % (i % 250 + 1), 65000,
+                                       [65000, chunk[0][0]],
+                                       [(prefix, mask_len) for _, prefix, mask_len in chunk]))
+    return result
+
+
+def run(name, table, encoded, batch_size):
+    collector = BMPCollector(table, batch_size=batch_size, maxsize=100)
+    collector.start()
+    received = [0]
+
+    def consume():
+        while received[0] < len(encoded) * PREFIXES:
+            received[0] += len(collector.get())
+
+    def replay(part):
+        with BMPReplayClient(*collector.address) as client:
+            for i in range(0, len(part), 1000):
+                client.send(part[i:i + 1000])
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.time()
+    routers = [threading.Thread(target=replay, args=(encoded[i::ROUTERS],))
+               for i in range(ROUTERS)]
+    for router in routers:
+        router.start()
+    for router in routers:
+        router.join()
+    consumer.join()
+    elapsed = time.time() - start
+    collector.stop()
+
+    stats = collector.stats()
+    print('{:36} {:10.0f} messages/s {:10.0f} routes/s {:6} batches'.format(
+        name, len(encoded) / elapsed, stats['validated'] / elapsed, stats['batches']))
+
+
+def main():
+    table = PfxTable()
+    fill_table(table, random_ipv4_records(RECORDS))
+    encoded = messages(random_ipv4_routes(MESSAGES * PREFIXES // 10), MESSAGES)
+
+    print('{} messages with {} prefixes from {} routers, {} records'.format(
+        MESSAGES, PREFIXES, ROUTERS, RECORDS))
+    for batch_size in (1, 100, 1000):
+        run('batch_size={}'.format(batch_size), table, encoded, batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Full table passes with one ValidationResult per route compared with
+compact result codes, freshly allocated and written into a reused buffer
+for prepared routes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import tracemalloc
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from rtrlib import PfxTable
+from rtrlib.batch import prepare_routes
+
+RECORDS = 100000
+ROUTES = 200000
+
+
+def allocated(function):
+    """Return the peak number of bytes allocated by python during function."""
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    table = PfxTable()
+    fill_table(table, random_ipv4_records(RECORDS))
+    routes = random_ipv4_routes(ROUTES)
+    prepared = prepare_routes(routes)
+    out = bytearray(len(routes))
+
+    passes = [
+        ('validate', lambda: [table.validate(*route) for route in routes]),
+        ('validate_codes', lambda: table.validate_codes(routes)),
+        ('validate_codes (prepared, out)',
+         lambda: table.validate_codes(prepared, out=out)),
+    ]
+
+    print('{} records, {} routes per row'.format(RECORDS, ROUTES))
+    for name, function in passes:
+        report(name, timeit(function), len(routes))
+        print('    peak python allocations: {:.1f} MiB'.format(allocated(function) / 2.0 ** 20))
+
+
+if __name__ == '__main__':
+    main()
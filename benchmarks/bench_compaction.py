@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Analysis and compaction of a table where a share of the records are
+more specifics of other records of the same ASN, with the savings report
+and a check of the minimal table against random routes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import socket
+import struct
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, timeit
+
+from rtrlib import PfxTable
+from rtrlib.compaction import analyze, compact, verify
+
+RECORDS = 100000
+MORE_SPECIFICS = 30000
+
+
+def more_specifics(records, count, seed=2):
+    rnd = random.Random(seed)
+    extra = set()
+    wide = [record for record in records if record[2] <= 22]
+    while len(extra) < count:
+        asn, prefix, min_len, max_len = rnd.choice(wide)
+        length = rnd.randint(min_len, 24)
+        addr = struct.unpack('!I', socket.inet_aton(prefix))[0]
+        addr |= rnd.getrandbits(32 - min_len) & ~((1 << (32 - length)) - 1)
+        extra.add((asn, socket.inet_ntoa(struct.pack('!I', addr & 0xFFFFFFFF)),
+                   length, rnd.randint(length, 24)))
+    return sorted(extra)
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    table = PfxTable()
+    fill_table(table, records + more_specifics(records, MORE_SPECIFICS))
+
+    print('analyze {:.3f} s'.format(timeit(lambda: analyze(table.snapshot()), repeat=1)))
+    minimal, report = compact(table)
+    for key, value in sorted(report.as_dict().items()):
+        print('{:20} {}'.format(key, value))
+
+    mismatches, before, after = verify(table.pfx_table, minimal.pfx_table,
+                                       random_ipv4_routes(500000))
+    print('random routes: {} mismatches, {:.3f} s -> {:.3f} s'.format(
+        len(mismatches), before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compare PfxTable.covering/more_specifics with a full table scan that is
+filtered in Python.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import ipaddress
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from _rtrlib import ffi, lib
+from rtrlib import PfxTable
+
+RECORDS = 100000
+QUERIES = 200
+
+
+def scan(table):
+    records = []
+
+    def callback(record, data):
+        data.append((record.asn, record.prefix, record.min_len, record.max_len))
+
+    handle = ffi.new_handle((callback, records))
+    lib.pfx_table_for_each_ipv4_record(table.pfx_table, lib.pfx_table_callback, handle)
+    return records
+
+
+def scan_covering(table, prefix, mask_len):
+    network = ipaddress.ip_network('{}/{}'.format(prefix, mask_len), strict=False)
+    return [record for record in scan(table)
+            if network.subnet_of(ipaddress.ip_network('{}/{}'.format(record[1], record[2])))]
+
+
+def scan_more_specifics(table, prefix, mask_len):
+    network = ipaddress.ip_network('{}/{}'.format(prefix, mask_len), strict=False)
+    return [record for record in scan(table)
+            if ipaddress.ip_network('{}/{}'.format(record[1], record[2])).subnet_of(network)]
+
+
+def as_tuples(records):
+    return sorted((r.asn, r.prefix, r.min_len, r.max_len) for r in records)
+
+
+def main():
+    table = PfxTable()
+    fill_table(table, random_ipv4_records(RECORDS))
+    covering_queries = [route[1:] for route in random_ipv4_routes(QUERIES)]
+    specific_queries = [(prefix, 12) for prefix, _ in covering_queries]
+
+    for prefix, mask_len in covering_queries[:5]:
+        assert as_tuples(table.covering(prefix, mask_len)) == \
+            sorted(scan_covering(table, prefix, mask_len))
+    for prefix, mask_len in specific_queries[:5]:
+        assert as_tuples(table.more_specifics(prefix, mask_len)) == \
+            sorted(scan_more_specifics(table, prefix, mask_len))
+
+    print('{} records, {} queries'.format(RECORDS, QUERIES))
+    report('covering (trie walk)',
+           timeit(lambda: [table.covering(*q) for q in covering_queries]),
+           QUERIES)
+    report('more_specifics /12 (trie walk)',
+           timeit(lambda: [table.more_specifics(*q) for q in specific_queries]),
+           QUERIES)
+    report('covering (scan and filter, 5 queries)',
+           timeit(lambda: [scan_covering(table, *q) for q in covering_queries[:5]], 1),
+           5)
+    report('more_specifics /12 (scan and filter, 5 queries)',
+           timeit(lambda: [scan_more_specifics(table, *q) for q in specific_queries[:5]], 1),
+           5)
+
+    table.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Requests per second and latency of the validation daemon, with single
+route requests and with batched validate_many calls from several client
+processes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes
+
+from rtrlib import PfxTable
+from rtrlib.daemon import ValidationClient, ValidationServer
+
+RECORDS = 100000
+ROUTES = 2000
+CLIENTS = 4
+BATCH_SIZE = 500
+
+
+def single_client(path, routes, queue):
+    latencies = []
+    with ValidationClient(path) as client:
+        for route in routes:
+            start = time.time()
+            client.validate(*route)
+            latencies.append(time.time() - start)
+    queue.put(latencies)
+
+
+def batch_client(path, routes, queue):
+    with ValidationClient(path) as client:
+        start = time.time()
+        client.validate_codes(routes * 10, BATCH_SIZE)
+        queue.put([time.time() - start])
+
+
+def run(name, target, path, routes, requests):
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=target, args=(path, routes, queue))
+                 for _ in range(CLIENTS)]
+
+    start = time.time()
+    for process in processes:
+        process.start()
+    latencies = sorted(sum((queue.get() for _ in processes), []))
+    elapsed = time.time() - start
+    for process in processes:
+        process.join()
+
+    p99 = latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0]
+    print('{:42} {:10.0f} routes/s   p50 {:8.3f} ms   p99 {:8.3f} ms'.format(
+        name, requests / elapsed,
+        latencies[len(latencies) // 2] * 1000, p99 * 1000))
+
+
+def main():
+    table = PfxTable()
+    fill_table(table, random_ipv4_records(RECORDS))
+    routes = random_ipv4_routes(ROUTES)
+
+    tmp_dir = tempfile.mkdtemp()
+    server = ValidationServer(table, os.path.join(tmp_dir, 'sock'))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    with ValidationClient(server.path) as client:
+        assert [r.state for r in client.validate_many(routes[:200])] == \
+            [table.validate(*route).state for route in routes[:200]]
+
+    print('{} records, {} client processes'.format(RECORDS, CLIENTS))
+    try:
+        run('validate (one route per request)', single_client,
+            server.path, routes, CLIENTS * ROUTES)
+        run('validate_codes ({} routes per request)'.format(BATCH_SIZE), batch_client,
+            server.path, routes, CLIENTS * ROUTES * 10)
+    finally:
+        server.shutdown()
+        thread.join()
+        server.close()
+        shutil.rmtree(tmp_dir)
+        table.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Time to write a large table as a JSON or CSV ROA export, formatted in
+C in chunks compared with building the JSON from PFXRecord objects.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import io
+import json
+
+from common import random_ipv4_records, report, timeit
+
+from rtrlib import PfxTable
+
+RECORDS = 500000
+
+
+def naive_export(table):
+    roas = [{'asn': 'AS{}'.format(record.asn),
+             'prefix': '{}/{}'.format(record.prefix, record.min_len),
+             'maxLength': record.max_len,
+             'ta': 'rtr'}
+            for record in table.snapshot()]
+    return json.dumps({'roas': roas}).encode('utf8')
+
+
+def main():
+    table = PfxTable()
+    table.reload(random_ipv4_records(RECORDS))
+
+    print('{} records per row'.format(RECORDS))
+    report('json of PFXRecord objects', timeit(lambda: naive_export(table), repeat=1),
+           RECORDS)
+    for file_format, compression in (('json', None), ('csv', None), ('json', 'gzip')):
+        report('export {} {}'.format(file_format, compression or ''),
+               timeit(lambda: table.export(io.BytesIO(), file_format, compression), repeat=1),
+               RECORDS)
+
+
+if __name__ == '__main__':
+    main()
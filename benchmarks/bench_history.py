@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Storage and point-in-time query latency of a history store after a month
+of synthetic churn on top of an initial table.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import time
+
+from common import random_ipv4_records, random_ipv4_routes, report
+
+from rtrlib.history import HistoryStore
+
+RECORDS = 100000
+DAYS = 30
+UPDATES_PER_HOUR = 2000
+QUERIES = 2000
+
+
+def main():
+    records = random_ipv4_records(RECORDS * 2)
+    present = records[:RECORDS]
+    spare = records[RECORDS:]
+    rnd = random.Random(3)
+
+    history = HistoryStore()
+    start = time.time()
+    for record in present:
+        history.add_update(0.0, True, *record)
+
+    # every update withdraws a random record and announces a spare one
+    end = DAYS * 86400.0
+    step = 3600.0 / UPDATES_PER_HOUR
+    now = 0.0
+    while now < end:
+        now += step * 2
+        i = rnd.randrange(len(present))
+        j = rnd.randrange(len(spare))
+        present[i], spare[j] = spare[j], present[i]
+        history.add_update(now, False, *spare[j])
+        history.add_update(now, True, *present[i])
+    ingest = time.time() - start
+
+    stats = history.stats()
+    print('{} initial records, {} days, {} updates per hour'.format(
+        RECORDS, DAYS, UPDATES_PER_HOUR))
+    print('{deltas} deltas, {checkpoints} checkpoints, {0:.1f} MiB, '
+          '{1:.1f} bytes per delta'.format(stats['bytes'] / 2.0 ** 20,
+                                          float(stats['bytes']) / stats['deltas'], **stats))
+    report('ingest', ingest, stats['updates'])
+
+    routes = random_ipv4_routes(QUERIES)
+    times = [rnd.uniform(0, end) for _ in routes]
+    latencies = []
+    for timestamp, route in zip(times, routes):
+        start = time.time()
+        history.validate_at(timestamp, *route)
+        latencies.append(time.time() - start)
+    latencies.sort()
+    report('validate_at', sum(latencies), QUERIES)
+    print('validate_at p50 {:.3f} ms p99 {:.3f} ms'.format(
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+
+    start = time.time()
+    table = history.table_at(end / 2)
+    report('table_at (rebuild the table)', time.time() - start, RECORDS)
+    table.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Validation of prefixes announced by many origins (MOAS): one lookup per
+route against one lookup per distinct prefix, for a full batch and for
+the origins of single prefixes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+
+from common import fill_table, random_ipv4_records, report, timeit
+
+from rtrlib import PfxTable
+from rtrlib.batch import prepare_routes, validate_routes
+
+RECORDS = 200000
+PREFIXES = 100000
+ORIGINS = 10
+SINGLE = 10000
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    table = PfxTable()
+    fill_table(table, records)
+
+    rnd = random.Random(3)
+    announced = [(asn, prefix, max_len) for asn, prefix, _, max_len in
+                 rnd.sample(records, PREFIXES)]
+    routes = []
+    for asn, prefix, mask_len in announced:
+        routes.append((asn, prefix, mask_len))
+        routes.extend((rnd.randint(1, 65000), prefix, mask_len) for _ in range(ORIGINS - 1))
+    rnd.shuffle(routes)
+    prepared = prepare_routes(routes)
+
+    assert (validate_routes(table.pfx_table, prepared, group=True) ==
+            validate_routes(table.pfx_table, prepared))
+    report('batch, one lookup per route', timeit(
+        lambda: validate_routes(table.pfx_table, prepared)), len(routes))
+    report('batch grouped by prefix', timeit(
+        lambda: validate_routes(table.pfx_table, prepared, group=True)), len(routes))
+
+    single = [(prefix, mask_len, [asn] + [rnd.randint(1, 65000) for _ in range(ORIGINS - 1)])
+              for asn, prefix, mask_len in announced[:SINGLE]]
+
+    def per_origin():
+        for prefix, mask_len, asns in single:
+            for asn in asns:
+                table.validate(asn, prefix, mask_len)
+
+    def origins():
+        for prefix, mask_len, asns in single:
+            table.validate_origins(prefix, mask_len, asns)
+
+    report('validate per origin', timeit(per_origin), SINGLE * ORIGINS)
+    report('validate_origins', timeit(origins), SINGLE * ORIGINS)
+    table.close()
+
+
+if __name__ == '__main__':
+    main()
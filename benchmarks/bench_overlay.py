@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Time to find the routes that change state when ROAs are issued or
+revoked: a what-if overlay with a route index against copying the table,
+applying the changes and revalidating every route.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import time
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from rtrlib import PfxTable
+from rtrlib.batch import prepare_routes, validate_routes
+from rtrlib.overlay import RouteIndex, WhatIfOverlay
+
+RECORDS = 100000
+ROUTES = 1000000
+
+
+def copy_and_revalidate(table, prepared, added, removed):
+    before = validate_routes(table.pfx_table, prepared, flags=False)
+    changed = table.copy()
+    changed.reload_changes(added, removed)
+    after = validate_routes(changed.pfx_table, prepared, flags=False)
+    changed.close()
+    return sum(1 for old, new in zip(before, after) if old != new)
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    routes = random_ipv4_routes(ROUTES)
+    rnd = random.Random(2)
+    # ROAs for announced routes, the random records rarely match an origin
+    issued = [(asn, prefix, mask_len, mask_len) for asn, prefix, mask_len in
+              rnd.sample(routes, 2000)]
+    table = PfxTable()
+    fill_table(table, records + issued[1000:])
+
+    start = time.time()
+    index = RouteIndex(routes)
+    report('build route index (once)', time.time() - start, ROUTES)
+    prepared = prepare_routes(routes)
+
+    scenarios = [
+        ('issue 100 ROAs', issued[:100], []),
+        ('revoke 100 ROAs', [], issued[1000:1100]),
+        ('revoke one /8', [], [next(r for r in records if r[2] == 8)]),
+        ('revoke 100 random records', [], rnd.sample(records, 100)),
+    ]
+    for name, added, removed in scenarios:
+        overlay = WhatIfOverlay(table)
+        for record in added:
+            overlay.add_record(*record)
+        for record in removed:
+            overlay.remove_record(*record)
+
+        changes = overlay.impact(index)
+        expected = copy_and_revalidate(table, prepared, added, removed)
+        assert len(changes) == expected, (len(changes), expected)
+
+        report('{}: overlay ({} changes)'.format(name, len(changes)),
+               timeit(lambda: overlay.impact(index)), ROUTES)
+        report('{}: copy and revalidate'.format(name),
+               timeit(lambda: copy_and_revalidate(table, prepared, added, removed), 1),
+               ROUTES)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Per call cost of PfxTable.validate and a Validator handle with and
+without the coverage prefilter, for routes of which about half are not
+found.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from rtrlib import PfxTable
+
+RECORDS = 100000
+CALLS = 50000
+
+
+def main():
+    # without the /8 records, they would cover most of the address space
+    records = [record for record in random_ipv4_records(RECORDS) if record[2] > 8]
+    plain = PfxTable()
+    fill_table(plain, records)
+    filtered = PfxTable(prefilter=True)
+    fill_table(filtered, records)
+
+    # announced prefixes of the records mixed with random routes
+    rnd = random.Random(2)
+    routes = ([(asn, prefix, min_len) for asn, prefix, min_len, _ in
+               rnd.sample(records, CALLS // 2)] +
+              random_ipv4_routes(CALLS // 2))
+    rnd.shuffle(routes)
+
+    def run(validate):
+        def loop():
+            for asn, prefix, mask_len in routes:
+                validate(asn, prefix, mask_len)
+        return loop
+
+    filtered.prefilter.lookups = filtered.prefilter.filtered = 0
+    run(filtered.validate)()
+    stats = filtered.prefilter.stats()
+    not_found = sum(1 for route in routes if plain.validate(*route).not_found)
+
+    print('{} records, {} calls per row, {:.1%} not found, {:.1%} filtered'.format(
+        RECORDS, CALLS, float(not_found) / CALLS, stats['hit_rate']))
+    report('PfxTable.validate', timeit(run(plain.validate)), CALLS)
+    report('PfxTable.validate (prefilter)', timeit(run(filtered.validate)), CALLS)
+    report('validator', timeit(run(plain.validator().validate)), CALLS)
+    report('validator (prefilter)', timeit(run(filtered.validator(prefilter=True).validate)),
+           CALLS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Replay speed of an update log into a PfxTable and through the update
+callback path of an RTRManager. A log file can be passed as argument,
+otherwise a synthetic log with a full load and churn is written first.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+
+from common import random_ipv4_records, report, timeit
+
+from _rtrlib import ffi
+from rtrlib import PfxTable, RTRManager
+from rtrlib.records import PFXRecord, create_pfx_record
+from rtrlib.update_log import UpdateLogWriter, replay_update_log
+
+RECORDS = 100000
+CHURN = 20000
+
+
+def write_log(path):
+    socket = ffi.new('struct rtr_socket *')
+    records = random_ipv4_records(RECORDS)
+    with UpdateLogWriter(path) as log:
+        for record in records:
+            log.pfx_update(PFXRecord(create_pfx_record(*record, socket=socket)), True)
+        for record in records[:CHURN]:
+            log.pfx_update(PFXRecord(create_pfx_record(*record, socket=socket)), False)
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tmp_dir, 'updates.log')
+        if len(sys.argv) == 1:
+            write_log(path)
+
+        count = replay_update_log(path, PfxTable())
+        print('{} updates, {} bytes'.format(count, os.path.getsize(path)))
+
+        report('replay into PfxTable',
+               timeit(lambda: replay_update_log(path, PfxTable())), count)
+
+        def replay_manager():
+            updates = []
+            mgr = RTRManager('localhost', 8282,
+                             pfx_update_callback=lambda r, a, d: updates.append(a))
+            replay_update_log(path, mgr)
+
+        report('replay into RTRManager with callback', timeit(replay_manager), count)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
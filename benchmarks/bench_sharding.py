@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Validation throughput and latency of reader threads while a writer
+thread updates the records, with one table and with sharded tables.
+
+The writer either removes and adds every record one by one, or resets
+the table like rtrlib on a cache reset: pfx_table_src_remove removes
+all records of the socket with one call, then the records are added
+again. rtrlib holds the write lock of a table for the whole
+pfx_table_src_remove, a sharded table is reset shard by shard.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+import time
+
+from _rtrlib import ffi, lib
+
+from common import random_ipv4_records, random_ipv4_routes
+
+from rtrlib import PfxTable
+from rtrlib.sharding import ShardedPfxTable
+
+RECORDS = 100000
+READERS = 4
+BATCH = 100
+DURATION = 2.0
+
+
+def reader(table, routes, stop, results):
+    validator = table.validator()
+    latencies = []
+    while not stop.is_set():
+        for i in range(0, len(routes), BATCH):
+            start = time.time()
+            for asn, prefix, mask_len in routes[i:i + BATCH]:
+                validator.validate(asn, prefix, mask_len)
+            latencies.append(time.time() - start)
+            if stop.is_set():
+                break
+    results.append(latencies)
+
+
+def writer(table, records, stop, counts):
+    updates = 0
+    while not stop.is_set():
+        for record in records:
+            table.remove_record(*record)
+            table.add_record(*record)
+            updates += 2
+            if stop.is_set():
+                break
+    counts.append(updates)
+
+
+def reset_writer(table, records, stop, counts):
+    if isinstance(table, ShardedPfxTable):
+        tables = [shard.pfx_table for shard in table.ipv4_shards + table.ipv6_shards]
+    else:
+        tables = [table.pfx_table]
+    updates = 0
+    while not stop.is_set():
+        # the records of PfxTable.add_record have no socket
+        for pfx_table in tables:
+            lib.pfx_table_src_remove(pfx_table, ffi.NULL)
+        for record in records:
+            table.add_record(*record)
+        updates += 2 * len(records)
+    counts.append(updates)
+
+
+def run(name, table, records, routes, write=None):
+    stop = threading.Event()
+    results = []
+    counts = []
+    threads = [threading.Thread(target=reader, args=(table, routes, stop, results))
+               for _ in range(READERS)]
+    if write is not None:
+        threads.append(threading.Thread(target=write, args=(table, records, stop, counts)))
+
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(sum(results, []))
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print('{:36} {:10.0f} routes/s {:9.0f} updates/s   p50 {:7.3f} ms   p99 {:7.3f} ms'
+          '   max {:7.3f} ms'.format(
+              name, len(latencies) * BATCH / DURATION, sum(counts) / DURATION,
+              latencies[len(latencies) // 2] * 1000, p99 * 1000, latencies[-1] * 1000))
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    routes = random_ipv4_routes(10000)
+
+    table = PfxTable()
+    table.reload(records)
+    sharded = ShardedPfxTable(16)
+    sharded.reload(records)
+
+    print('{} records, {} reader threads, latency per {} routes'.format(
+        RECORDS, READERS, BATCH))
+    for name, pfx_table in (('one table', table), ('16 shards', sharded)):
+        run(name, pfx_table, records, routes)
+        run(name + ' (with writer)', pfx_table, records, routes, writer)
+        run(name + ' (with resets)', pfx_table, records, routes, reset_writer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Per call cost of RTRManager.validate (pfx_table_validate, reasons on
+demand) compared with RTRManager.explain (pfx_table_validate_r with a
+malloc'd reason array) for valid, invalid and not found routes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from common import random_ipv4_records, random_ipv4_routes, report, timeit
+
+from _rtrlib import lib
+from rtrlib import RTRManager
+from rtrlib.records import create_pfx_record
+
+RECORDS = 100000
+CALLS = 20000
+
+
+def main():
+    mgr = RTRManager('localhost', 8282)
+    socket = mgr.rtr_socketp[0]
+    records = random_ipv4_records(RECORDS)
+    for asn, prefix, min_len, max_len in records:
+        lib.pfx_table_add(mgr.pfx_table,
+                          create_pfx_record(asn, prefix, min_len, max_len, socket))
+
+    sample = records[:CALLS]
+    routes = {
+        'valid': [(asn, prefix, min_len) for asn, prefix, min_len, _ in sample],
+        'invalid': [(asn + 1, prefix, min_len) for asn, prefix, min_len, _ in sample],
+        'not found': [route for route in random_ipv4_routes(CALLS * 5)
+                      if mgr.validate(*route).not_found][:CALLS],
+    }
+
+    for name, batch in sorted(routes.items()):
+        assert [mgr.validate(*r).state for r in batch[:100]] == \
+            [mgr.explain(*r).state for r in batch[:100]]
+
+    print('{} records, {} calls per row'.format(RECORDS, CALLS))
+    for name, batch in sorted(routes.items()):
+        report('validate ({})'.format(name),
+               timeit(lambda: [mgr.validate(*r) for r in batch]), len(batch))
+        report('explain ({})'.format(name),
+               timeit(lambda: [mgr.explain(*r) for r in batch]), len(batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Per call cost of PfxTable.validate, PfxTable.validate_r and
+RTRManager.validate compared with a Validator handle with reused
+buffers, for str and bytes prefixes.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from _rtrlib import lib
+from rtrlib import PfxTable, RTRManager
+from rtrlib.records import create_pfx_record
+
+RECORDS = 100000
+CALLS = 50000
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    table = PfxTable()
+    fill_table(table, records)
+
+    mgr = RTRManager('localhost', 8282)
+    socket = mgr.rtr_socketp[0]
+    for record in records:
+        lib.pfx_table_add(mgr.pfx_table, create_pfx_record(*record, socket=socket))
+
+    routes = random_ipv4_routes(CALLS)
+    byte_routes = [(asn, prefix.encode('ascii'), mask_len) for asn, prefix, mask_len in routes]
+    table_validator = table.validator()
+    mgr_validator = mgr.validator()
+
+    def run(validate, batch):
+        def loop():
+            for asn, prefix, mask_len in batch:
+                validate(asn, prefix, mask_len)
+        return loop
+
+    cases = [
+        ('PfxTable.validate', run(table.validate, routes)),
+        ('PfxTable.validate_r', run(table.validate_r, routes)),
+        ('RTRManager.validate', run(mgr.validate, routes)),
+        ('PfxTable.validator().validate', run(table_validator.validate, routes)),
+        ('RTRManager.validator().validate', run(mgr_validator.validate, routes)),
+        ('validator (bytes prefixes)', run(table_validator.validate, byte_routes)),
+    ]
+
+    print('{} records, {} calls per row'.format(RECORDS, CALLS))
+    for name, function in cases:
+        report(name, timeit(function), CALLS)
+
+
+if __name__ == '__main__':
+    main()
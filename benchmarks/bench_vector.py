@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Throughput of the numpy engine compared with the C trie for a large
+batch of IPv4 routes, both from already converted arrays.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import socket
+import struct
+
+import numpy as np
+
+from common import fill_table, random_ipv4_records, random_ipv4_routes, report, timeit
+
+from rtrlib import PfxTable
+from rtrlib.batch import prepare_routes
+from rtrlib.vector import VectorEngine
+
+RECORDS = 100000
+ROUTES = 1000000
+
+
+def main():
+    records = random_ipv4_records(RECORDS)
+    table = PfxTable()
+    fill_table(table, records)
+
+    routes = random_ipv4_routes(ROUTES // 2) + [(asn, prefix, min_len)
+                                                for asn, prefix, min_len, _ in records]
+    routes = (routes * (ROUTES // len(routes) + 1))[:ROUTES]
+
+    report('build engine', timeit(lambda: VectorEngine.from_table(table), repeat=1),
+           RECORDS)
+    engine = VectorEngine.from_table(table)
+
+    asns = np.array([asn for asn, _, _ in routes], dtype=np.uint32)
+    addresses = np.array([struct.unpack('!I', socket.inet_aton(prefix))[0]
+                          for _, prefix, _ in routes], dtype=np.uint64)
+    mask_lens = np.array([mask_len for _, _, mask_len in routes], dtype=np.uint8)
+    prepared = prepare_routes(routes)
+    out = np.empty(ROUTES, dtype=np.uint8)
+
+    assert (engine.validate_ipv4(asns, addresses, mask_lens) ==
+            table.validate_codes(prepared)).all()
+
+    print('{} records, {} routes per row'.format(RECORDS, ROUTES))
+    report('C trie (prepared routes)',
+           timeit(lambda: table.validate_codes(prepared, out=out)), ROUTES)
+    report('vector engine',
+           timeit(lambda: engine.validate_ipv4(asns, addresses, mask_lens, out=out)), ROUTES)
+
+
+if __name__ == '__main__':
+    main()
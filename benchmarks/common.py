@@ -0,0 +1,71 @@
+# -*- coding: utf8 -*-
+"""
+benchmarks.common
+-----------------
+
+Helpers shared by the benchmark scripts
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def random_ipv4_records(count, seed=0):
+    """
+    Generate (asn, prefix, min_len, max_len) tuples with a prefix length
+    distribution roughly following the global ROA set.
+    """
+    rnd = random.Random(seed)
+    lengths = [8] + [16] * 4 + [20] * 10 + [22] * 20 + [24] * 65
+    records = set()
+    while len(records) < count:
+        min_len = rnd.choice(lengths)
+        addr = rnd.getrandbits(32) & ~((1 << (32 - min_len)) - 1) & 0xFFFFFFFF
+        prefix = socket.inet_ntoa(struct.pack('!I', addr))
+        max_len = min(32, min_len + rnd.choice((0, 0, 0, 2, 8)))
+        records.add((rnd.randint(1, 65000), prefix, min_len, max_len))
+    return sorted(records)
+
+
+def random_ipv4_routes(count, seed=1):
+    """Generate (asn, prefix, mask_len) tuples."""
+    rnd = random.Random(seed)
+    routes = []
+    for _ in range(count):
+        mask_len = rnd.choice((16, 20, 22, 24, 24, 24))
+        addr = rnd.getrandbits(32) & ~((1 << (32 - mask_len)) - 1) & 0xFFFFFFFF
+        routes.append((rnd.randint(1, 65000),
+                       socket.inet_ntoa(struct.pack('!I', addr)),
+                       mask_len))
+    return routes
+
+
+def fill_table(table, records):
+    """Add all record tuples to a PfxTable."""
+    for record in records:
+        table.add_record(*record)
+
+
+def timeit(function, repeat=3):
+    """Return the best wall clock time of repeat calls to function."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, seconds, operations):
+    """Print one result line."""
+    print('{:45} {:10.3f} ms {:12.0f} ops/s'.format(
+        name, seconds * 1000, operations / seconds if seconds else 0))
@@ -11,6 +11,12 @@ ffibuilder = FFI()
 with open(path.join(BASEDIR, "rtrlib.cdef")) as file_obj:
     ffibuilder.cdef(file_obj.read())
 
+with open(path.join(BASEDIR, "rtrlib_ext.cdef")) as file_obj:
+    ffibuilder.cdef(file_obj.read())
+
+with open(path.join(BASEDIR, "rtrlib_ext.c")) as file_obj:
+    EXT_SOURCE = file_obj.read()
+
 ffibuilder.cdef("""
         extern "Python" void rtr_mgr_status_callback(const struct rtr_mgr_group *, enum rtr_mgr_status, const struct rtr_socket *, void *);
         extern "Python" void pfx_update_callback(struct pfx_table *pfx_table, const struct pfx_record record, const bool added);
@@ -59,7 +65,7 @@ ffibuilder.set_source("_rtrlib",
                               struct rtr_socket rtr_socket;
                               void *data;
                       };
-                      """,
+                      """ + EXT_SOURCE,
                       libraries=['rtr'])
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.asn_index
+----------------
+
+Index of the prefixes every ASN is authorised to originate
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from .records import PFXRecord, create_pfx_record
+
+
+class AsnIndex(object):
+    r"""
+    Maps origin ASNs to the records that authorise them.
+
+    The index is kept up to date incrementally, it never has to scan the \
+    pfx table. Every record is stored as a (prefix, min_len, max_len) \
+    tuple in a per ASN dict. On a 64-bit CPython 3 this takes about \
+    150 bytes per record plus 250 bytes per ASN, e.g. 90 MB for \
+    500,000 records of 50,000 ASNs. benchmarks/bench_asn_index.py \
+    measures it for a synthetic table.
+
+    Updates may arrive from the rtrlib thread, all access is serialized \
+    with a lock.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(sum(entries.values())
+                       for entries in self._index.values())
+
+    def copy(self):
+        """
+        Return an independent copy of the index.
+
+        :rtype: AsnIndex
+        """
+        copy = AsnIndex()
+        with self._lock:
+            copy._index = dict((asn, dict(entries))
+                               for asn, entries in self._index.items())
+        return copy
+
+    def add(self, asn, prefix, min_len, max_len):
+        """Add a record to the index."""
+        key = (prefix, min_len, max_len)
+        with self._lock:
+            entries = self._index.setdefault(asn, {})
+            entries[key] = entries.get(key, 0) + 1
+
+    def remove(self, asn, prefix, min_len, max_len):
+        """Remove a record from the index."""
+        key = (prefix, min_len, max_len)
+        with self._lock:
+            entries = self._index.get(asn)
+            if not entries or key not in entries:
+                return
+            if entries[key] > 1:
+                entries[key] -= 1
+            else:
+                del entries[key]
+                if not entries:
+                    del self._index[asn]
+
+    def update(self, record, added):
+        """
+        Apply a pfx update.
+
+        Has the signature of a pfx update listener.
+
+        :param PFXRecord record: the affected record
+        :param bool added: True if the record was added
+        """
+        if added:
+            self.add(record.asn, record.prefix, record.min_len, record.max_len)
+        else:
+            self.remove(record.asn, record.prefix, record.min_len, record.max_len)
+
+    def records_for_asn(self, asn):
+        """
+        Return all records for asn.
+
+        :param int asn: autonomous system number
+        :rtype: list of :class:`.PFXRecord`
+        """
+        with self._lock:
+            keys = list(self._index.get(asn, ()))
+
+        return [PFXRecord(create_pfx_record(asn, *key)) for key in keys]
+
+    def records_for_asns(self, asns):
+        """
+        Return the records for several ASNs at once.
+
+        :param asns: autonomous system numbers
+        :type asns: iterable of int
+        :rtype: dict mapping every asn to a list of :class:`.PFXRecord`
+        """
+        with self._lock:
+            keys = dict((asn, list(self._index.get(asn, ()))) for asn in asns)
+
+        return dict((asn, [PFXRecord(create_pfx_record(asn, *key))
+                           for key in asn_keys])
+                    for asn, asn_keys in keys.items())
@@ -0,0 +1,192 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.batch
+------------
+
+Validation of many routes with one call into the extension
+
+Results are compact result codes, one byte per route, instead of \
+:class:`.ValidationResult` objects. They are returned as a bytearray or \
+written into a caller supplied buffer, e.g. a bytearray, an \
+``array.array('b')`` or a numpy ``int8`` array. Together with \
+:func:`prepare_routes` repeated passes over the same routes allocate \
+nothing::
+
+    routes = prepare_routes(all_routes)
+    codes = bytearray(len(routes))
+    while True:
+        validate_routes(pfx_table, routes, out=codes)
+
+Prefixes announced by several origins (MOAS) need the covering records \
+only once. :func:`validate_origins` validates any number of origins of \
+one prefix with one lookup, ``validate_routes(..., group=True)`` sorts \
+the routes by prefix first and looks up every distinct prefix once.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from _rtrlib import ffi, lib
+
+from .exceptions import IpConversionException, PFXException
+from .util import ip_str_to_addr, is_integer, to_bytestr
+
+
+STATE_MASK = 0x3
+"""Bits of a result code that hold the pfxv_state"""
+
+AS_INVALID = 0x4
+"""Set for invalid routes if a covering record has another asn"""
+
+LENGTH_INVALID = 0x8
+"""Set for invalid routes if the prefix is longer than a covering max_len"""
+
+ALL_BITS = STATE_MASK | AS_INVALID | LENGTH_INVALID
+
+
+class PreparedRoutes(object):
+    r"""
+    Routes converted to the arrays the extension validates.
+
+    Created by :func:`prepare_routes`, the conversion of the prefix \
+    strings is done once for any number of validations.
+    """
+
+    def __init__(self, asns, prefixes, mask_lens):
+        self.asns = asns
+        self.prefixes = prefixes
+        self.mask_lens = mask_lens
+
+    def __len__(self):
+        return len(self.asns)
+
+
+def prepare_routes(routes):
+    """
+    Convert routes for :func:`validate_routes`.
+
+    :param routes: (asn, prefix, mask_len) tuples
+    :type routes: sequence of tuples
+    :rtype: PreparedRoutes
+    """
+    routes_len = len(routes)
+    asns = ffi.new('uint32_t[]', routes_len)
+    prefixes = ffi.new('struct lrtr_ip_addr[]', routes_len)
+    mask_lens = ffi.new('uint8_t[]', routes_len)
+
+    for i, (asn, prefix, mask_len) in enumerate(routes):
+        if not is_integer(asn):
+            raise TypeError("asn must be integer not %s" % type(asn))
+        if not is_integer(mask_len):
+            raise TypeError("mask_len must be integer not %s" % type(mask_len))
+
+        if lib.lrtr_ip_str_to_addr(to_bytestr(prefix), prefixes + i) != 0:
+            raise IpConversionException("String could not be converted")
+        asns[i] = asn
+        mask_lens[i] = mask_len
+
+    return PreparedRoutes(asns, prefixes, mask_lens)
+
+
+def _result_buffer(out, length):
+    if out is None:
+        return bytearray(length)
+    view = memoryview(out)
+    if view.readonly:
+        raise TypeError("out must be a writable buffer")
+    if view.itemsize != 1:
+        raise TypeError("out must have one byte per item not %d" % view.itemsize)
+    if len(view) < length:
+        raise ValueError("out is smaller than the number of results")
+    return out
+
+
+def validate_routes(pfx_table, routes, out=None, flags=True, group=False):
+    r"""
+    Validate routes against pfx_table.
+
+    Every result code holds the :class:`.PfxvState` value of the route in \
+    its lower two bits (see :data:`STATE_MASK`), invalid routes \
+    additionally have :data:`AS_INVALID` and :data:`LENGTH_INVALID` set \
+    like :py:attr:`.ValidationResult.as_invalid` and \
+    :py:attr:`.ValidationResult.length_invalid`.
+
+    The table is read locked once for all routes, callers should pass \
+    routes in batches of a few thousand. With group set the routes are \
+    sorted by prefix and the trie is walked once per distinct prefix, \
+    which pays off if many prefixes are announced by several origins.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param routes: (asn, prefix, mask_len) tuples or prepared routes
+    :type routes: sequence of tuples or PreparedRoutes
+    :param out: writable buffer with one byte per item and at least \
+        len(routes) items the codes are written to, a new bytearray if None
+    :param bool flags: if False only the pfxv_state values are returned
+    :param bool group: look up every distinct prefix once
+    :return: out or the new bytearray, one result code per route
+    :rtype: bytearray
+
+    :raises PFXException: if a mask_len is too long for its prefix
+    """
+    if not isinstance(routes, PreparedRoutes):
+        routes = prepare_routes(routes)
+    routes_len = len(routes)
+
+    out = _result_buffer(out, routes_len)
+
+    validate = lib.pfx_table_validate_grouped if group else lib.pfx_table_validate_batch
+    ret = validate(pfx_table,
+                   routes.asns,
+                   routes.prefixes,
+                   routes.mask_lens,
+                   routes_len,
+                   ffi.cast('uint8_t *', ffi.from_buffer(out)),
+                   ALL_BITS if flags else STATE_MASK)
+
+    if ret == lib.PFX_ERROR:
+        raise PFXException("An error occurred during validation")
+
+    return out
+
+
+def validate_origins(pfx_table, prefix, mask_len, asns, out=None, flags=True):
+    r"""
+    Validate one prefix announced by several origins against pfx_table.
+
+    The covering records of the prefix are looked up once and every asn \
+    is validated against them, the result codes are those of \
+    :func:`validate_routes` for the routes (asn, prefix, mask_len).
+
+    :param cdata pfx_table: struct pfx_table *
+    :param str prefix: ip address
+    :param int mask_len: length of the subnet mask
+    :param asns: origin asns
+    :type asns: sequence of int
+    :param out: writable buffer with one byte per item and at least \
+        len(asns) items the codes are written to, a new bytearray if None
+    :param bool flags: if False only the pfxv_state values are returned
+    :return: out or the new bytearray, one result code per asn
+    :rtype: bytearray
+
+    :raises PFXException: if mask_len is too long for prefix
+    """
+    if not is_integer(mask_len):
+        raise TypeError("mask_len must be integer not %s" % type(mask_len))
+    for asn in asns:
+        if not is_integer(asn):
+            raise TypeError("asn must be integer not %s" % type(asn))
+
+    asns_len = len(asns)
+    out = _result_buffer(out, asns_len)
+
+    ret = lib.pfx_table_validate_origins(pfx_table,
+                                         ip_str_to_addr(prefix),
+                                         mask_len,
+                                         ffi.new('uint32_t[]', list(asns)),
+                                         asns_len,
+                                         ffi.cast('uint8_t *', ffi.from_buffer(out)),
+                                         ALL_BITS if flags else STATE_MASK)
+
+    if ret == lib.PFX_ERROR:
+        raise PFXException("An error occurred during validation")
+
+    return out
@@ -0,0 +1,642 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.bmp
+----------
+
+Validate the routes routers announce over BMP (RFC 7854)
+
+Routers connect to a :class:`BMPCollector` over TCP. The BGP UPDATEs of \
+Route Monitoring messages are parsed, IPv4 NLRI and IPv4 and IPv6 \
+unicast MP_REACH_NLRI announcements are validated in batches against \
+the origin AS of their AS_PATH and handed to the consumer as \
+:class:`AnnotatedRoute` objects. All other message types are skipped.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import socket
+import struct
+import threading
+
+from six.moves import queue, socketserver
+
+from _rtrlib import ffi, lib
+
+from .batch import STATE_MASK, PreparedRoutes, validate_routes
+from .dispatch import OverflowPolicy
+from .rtr_manager import PfxvState
+from .util import StoppableThread
+
+
+LOG = logging.getLogger(__name__)
+
+_COMMON = struct.Struct('!BIB')
+_PEER = struct.Struct('!BB8s16sIIII')
+_BGP = struct.Struct('!16sHB')
+_AFI_SAFI = struct.Struct('!HBB')
+_IPV4 = struct.Struct('!I')
+_IPV6 = struct.Struct('!4I')
+
+VERSION = 3
+
+ROUTE_MONITORING = 0
+STATISTICS_REPORT = 1
+PEER_DOWN = 2
+PEER_UP = 3
+INITIATION = 4
+TERMINATION = 5
+ROUTE_MIRRORING = 6
+
+_PEER_IPV6 = 0x80
+_PEER_AS2 = 0x20
+
+_BGP_UPDATE = 2
+_ATTR_EXTENDED = 0x10
+_ATTR_ORIGIN = 1
+_ATTR_AS_PATH = 2
+_ATTR_NEXT_HOP = 3
+_ATTR_MP_REACH = 14
+_ATTR_MP_UNREACH = 15
+_AS_SET = 1
+_AS_SEQUENCE = 2
+
+
+class BMPError(ValueError):
+    """A BMP message or its BGP UPDATE is malformed."""
+
+
+class AnnotatedRoute(object):
+    r"""
+    An announcement received over BMP with its validation result.
+
+    :ivar str peer_address: address of the BGP peer of the router
+    :ivar int peer_asn: AS of the BGP peer
+    :ivar float timestamp: time the router received the route
+    :ivar str prefix: announced prefix
+    :ivar int mask_len: length of the announced prefix
+    :ivar int origin: origin AS, 0 if the AS_PATH ends with an AS_SET
+    :ivar int code: result code as described in :mod:`rtrlib.batch`
+    """
+
+    __slots__ = ('peer_address', 'peer_asn', 'timestamp', 'prefix', 'mask_len',
+                 'origin', 'code')
+
+    def __init__(self, peer_address, peer_asn, timestamp, prefix, mask_len, origin, code):
+        self.peer_address = peer_address
+        self.peer_asn = peer_asn
+        self.timestamp = timestamp
+        self.prefix = prefix
+        self.mask_len = mask_len
+        self.origin = origin
+        self.code = code
+
+    @property
+    def state(self):
+        """:class:`.PfxvState` of the route."""
+        return PfxvState(self.code & STATE_MASK)
+
+    def __str__(self):
+        return "{}/{} AS{} {} (peer {} AS{})".format(self.prefix, self.mask_len,
+                                                    self.origin, self.state.name,
+                                                    self.peer_address, self.peer_asn)
+
+
+def _address_str(version, address):
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, bytes(address[:4]))
+    return socket.inet_ntop(socket.AF_INET6, bytes(address))
+
+
+def _nlri(data, version, routes):
+    size = 4 if version == 4 else 16
+    pos = 0
+    while pos < len(data):
+        mask_len = data[pos]
+        length = (mask_len + 7) // 8
+        if mask_len > size * 8 or pos + 1 + length > len(data):
+            raise BMPError("invalid prefix in NLRI")
+        routes.append((version, bytes(data[pos + 1:pos + 1 + length].ljust(16, b'\0')),
+                       mask_len))
+        pos += 1 + length
+
+
+def _count_nlri(data):
+    count = 0
+    pos = 0
+    while pos < len(data):
+        pos += 1 + (data[pos] + 7) // 8
+        count += 1
+    if pos > len(data):
+        raise BMPError("invalid prefix in NLRI")
+    return count
+
+
+def _origin(data, as2, peer_asn):
+    # RFC 6811: the last AS of a final AS_SEQUENCE, none for a final AS_SET
+    origin = peer_asn
+    size = 2 if as2 else 4
+    pos = 0
+    while pos < len(data):
+        if pos + 2 > len(data):
+            raise BMPError("truncated AS_PATH")
+        segment_type, count = data[pos], data[pos + 1]
+        end = pos + 2 + count * size
+        if end > len(data):
+            raise BMPError("truncated AS_PATH")
+        if segment_type == _AS_SET:
+            origin = 0
+        elif segment_type == _AS_SEQUENCE and count:
+            last = data[end - size:end]
+            origin = struct.unpack('!H' if as2 else '!I', bytes(last))[0]
+        pos = end
+    return origin
+
+
+def parse_update(update, as2=False, peer_asn=0):
+    r"""
+    Parse the announcements of a BGP UPDATE message.
+
+    :param bytes update: BGP message with its 19 byte header
+    :param bool as2: the AS_PATH has 2 byte ASNs
+    :param int peer_asn: origin of routes with an empty AS_PATH
+    :return: origin AS, list of (ip version, address padded to 16 bytes, \
+        mask_len) tuples of the announced unicast prefixes and number of \
+        withdrawn prefixes
+    :rtype: tuple
+
+    :raises BMPError: if the message is malformed
+    """
+    data = bytearray(update)
+    if len(data) < _BGP.size + 4:
+        raise BMPError("truncated BGP message")
+    _, length, message_type = _BGP.unpack_from(bytes(data))
+    if message_type != _BGP_UPDATE:
+        raise BMPError("not a BGP UPDATE")
+    if length < _BGP.size + 4 or length > len(data):
+        raise BMPError("invalid BGP message length %d" % length)
+
+    pos = _BGP.size
+    withdrawn_len = data[pos] << 8 | data[pos + 1]
+    pos += 2
+    if pos + withdrawn_len + 2 > length:
+        raise BMPError("truncated withdrawn routes")
+    withdrawn = _count_nlri(data[pos:pos + withdrawn_len])
+    pos += withdrawn_len
+    attributes_len = data[pos] << 8 | data[pos + 1]
+    pos += 2
+    attributes_end = pos + attributes_len
+    if attributes_end > length:
+        raise BMPError("truncated path attributes")
+
+    routes = []
+    as_path = None
+    while pos < attributes_end:
+        header_len = 4 if data[pos] & _ATTR_EXTENDED else 3
+        if pos + header_len > attributes_end:
+            raise BMPError("truncated path attribute header")
+        attribute_type = data[pos + 1]
+        if header_len == 4:
+            attribute_len = data[pos + 2] << 8 | data[pos + 3]
+        else:
+            attribute_len = data[pos + 2]
+        pos += header_len
+        if pos + attribute_len > attributes_end:
+            raise BMPError("path attribute %d overruns the attributes" % attribute_type)
+        value = data[pos:pos + attribute_len]
+        pos += attribute_len
+
+        if attribute_type == _ATTR_AS_PATH:
+            as_path = value
+        elif attribute_type == _ATTR_MP_REACH and len(value) >= 5:
+            afi, safi, next_hop_len = struct.unpack_from('!HBB', bytes(value[:4]))
+            if 5 + next_hop_len > len(value):
+                raise BMPError("truncated MP_REACH_NLRI")
+            if afi in (1, 2) and safi == 1:
+                _nlri(value[5 + next_hop_len:], 4 if afi == 1 else 6, routes)
+        elif attribute_type == _ATTR_MP_UNREACH and len(value) >= 3:
+            withdrawn += _count_nlri(value[3:])
+
+    _nlri(data[attributes_end:length], 4, routes)
+    origin = _origin(as_path, as2, peer_asn) if as_path is not None else peer_asn
+    return origin, routes, withdrawn
+
+
+def read_message(stream):
+    """
+    Read one BMP message from a file like object.
+
+    :return: message type and the message after the common header, \
+        None at the end of the stream
+    :rtype: tuple of int and bytes
+
+    :raises BMPError: if the message is truncated or not BMP version 3
+    """
+    header = stream.read(_COMMON.size)
+    if not header:
+        return None
+    if len(header) < _COMMON.size:
+        raise BMPError("truncated BMP header")
+    version, length, message_type = _COMMON.unpack(header)
+    if version != VERSION or length < _COMMON.size:
+        raise BMPError("not a BMP version 3 message")
+    body = stream.read(length - _COMMON.size)
+    if len(body) < length - _COMMON.size:
+        raise BMPError("truncated BMP message")
+    return message_type, body
+
+
+def encode_message(message_type, body):
+    """
+    Return a BMP message with its common header.
+
+    :param int message_type: e.g. :data:`ROUTE_MONITORING`
+    :param bytes body: the message after the common header
+    :rtype: bytes
+    """
+    return _COMMON.pack(VERSION, _COMMON.size + len(body), message_type) + body
+
+
+def _encode_prefix(prefix, mask_len):
+    family = socket.AF_INET6 if ':' in prefix else socket.AF_INET
+    return struct.pack('!B', mask_len) + socket.inet_pton(family, prefix)[:(mask_len + 7) // 8]
+
+
+def _encode_attribute(attribute_type, value):
+    if len(value) > 255:
+        return struct.pack('!BBH', 0x40 | _ATTR_EXTENDED, attribute_type, len(value)) + value
+    return struct.pack('!BBB', 0x40, attribute_type, len(value)) + value
+
+
+def route_monitoring(peer_address, peer_asn, as_path, prefixes, timestamp=0.0):
+    r"""
+    Return a Route Monitoring message announcing prefixes.
+
+    IPv4 prefixes are sent as NLRI, IPv6 prefixes as MP_REACH_NLRI. \
+    Used by tests and benchmarks to stand in for a router.
+
+    :param str peer_address: IPv4 or IPv6 address of the peer
+    :param int peer_asn: AS of the peer
+    :param as_path: ASNs of one AS_SEQUENCE, the origin last
+    :type as_path: list of int
+    :param prefixes: (prefix, mask_len) tuples
+    :param float timestamp: time the route was received
+    :rtype: bytes
+    """
+    ipv4 = b''.join(_encode_prefix(prefix, mask_len)
+                    for prefix, mask_len in prefixes if ':' not in prefix)
+    ipv6 = b''.join(_encode_prefix(prefix, mask_len)
+                    for prefix, mask_len in prefixes if ':' in prefix)
+
+    attributes = (_encode_attribute(_ATTR_ORIGIN, b'\x00') +
+                  _encode_attribute(_ATTR_AS_PATH,
+                                    struct.pack('!BB', _AS_SEQUENCE, len(as_path)) +
+                                    b''.join(struct.pack('!I', asn) for asn in as_path)))
+    if ipv4:
+        attributes += _encode_attribute(_ATTR_NEXT_HOP, b'\x00' * 4)
+    if ipv6:
+        attributes += _encode_attribute(_ATTR_MP_REACH,
+                                        _AFI_SAFI.pack(2, 1, 16) + b'\x00' * 17 + ipv6)
+
+    body = struct.pack('!HH', 0, len(attributes)) + attributes + ipv4
+    update = _BGP.pack(b'\xff' * 16, _BGP.size + len(body), _BGP_UPDATE) + body
+
+    ipv6_peer = ':' in peer_address
+    address = socket.inet_pton(socket.AF_INET6 if ipv6_peer else socket.AF_INET,
+                               peer_address).rjust(16, b'\x00')
+    peer = _PEER.pack(0, _PEER_IPV6 if ipv6_peer else 0, b'\x00' * 8, address,
+                      peer_asn, 0, int(timestamp), int(timestamp % 1 * 1000000))
+    return encode_message(ROUTE_MONITORING, peer + update)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        collector = self.server.collector
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except BMPError as err:
+                LOG.warning("Closing BMP session of %s: %s", self.client_address, err)
+                collector._count('errors')
+                return
+            if message is None:
+                return
+            collector._receive(*message)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BMPCollector(object):
+    r"""
+    BMP station that validates the announcements of its routers.
+
+    Every router connection is read by its own thread, which parses the \
+    Route Monitoring messages and queues their announcements. A worker \
+    thread validates them in batches of up to batch_size routes with \
+    one call into the extension and queues the :class:`AnnotatedRoute` \
+    lists for :py:meth:`get`. Both queues are bounded: the announcement \
+    queue stops reading from the routers when it is full, the result \
+    queue applies overflow.
+
+    :param source: object with a pfx_table attribute, \
+        e.g. :class:`.RTRManager` or :class:`.PfxTable`
+    :param str host: address to listen on
+    :param int port: port to listen on, 0 for any free port, see \
+        :py:attr:`address`
+    :param int batch_size: maximum number of routes per validation
+    :param int maxsize: maximum number of queued messages and of \
+        queued result batches
+    :param OverflowPolicy overflow: what to do with a result batch if \
+        the consumer does not keep up
+    :param float flush_interval: seconds a started batch waits for more \
+        announcements
+    """
+
+    def __init__(self,
+                 source,
+                 host='127.0.0.1',
+                 port=0,
+                 batch_size=1000,
+                 maxsize=1000,
+                 overflow=OverflowPolicy.block,
+                 flush_interval=0.05):
+        if not isinstance(overflow, OverflowPolicy):
+            raise TypeError("overflow must be an OverflowPolicy")
+
+        self._source = source
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._flush_interval = flush_interval
+        self._announcements = queue.Queue(maxsize)
+        self._results = queue.Queue(maxsize)
+
+        self._server = _TCPServer((host, port), _Handler)
+        self._server.collector = self
+        self._server_thread = None
+        self._worker = None
+
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('messages', 'route_monitoring', 'announcements',
+                                     'withdrawals', 'validated', 'batches', 'dropped',
+                                     'errors'), 0)
+
+    @property
+    def address(self):
+        """(host, port) the collector listens on."""
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Start accepting routers and validating."""
+        self._worker = StoppableThread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+        self._server_thread = threading.Thread(target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+
+    def stop(self):
+        r"""
+        Stop accepting routers, validate the queued announcements and \
+        stop the worker.
+
+        Result batches that do not fit into the result queue any more \
+        once the collector is stopping are dropped, even with \
+        OverflowPolicy.block, and counted as dropped.
+        """
+        if self._server_thread is not None:
+            self._server.shutdown()
+            self._server_thread.join()
+            self._server_thread = None
+        self._server.server_close()
+
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker.join()
+            self._worker = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+    def get(self, timeout=None):
+        """
+        Return the next batch of validated announcements.
+
+        :param float timeout: seconds to wait, None to wait forever
+        :rtype: list of :class:`AnnotatedRoute`
+
+        :raises queue.Empty: if no batch arrived in time
+        """
+        return self._results.get(timeout=timeout)
+
+    def stats(self):
+        r"""
+        Return the counters.
+
+        messages counts all received BMP messages, route_monitoring the \
+        Route Monitoring messages among them. dropped counts result \
+        batches discarded by the overflow policy or by :py:meth:`stop`, \
+        errors the closed connections and unparsable UPDATEs.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key, count=1):
+        with self._lock:
+            self._stats[key] += count
+
+    def _receive(self, message_type, body):
+        if message_type != ROUTE_MONITORING:
+            self._count('messages')
+            return
+
+        try:
+            if len(body) < _PEER.size:
+                raise BMPError("truncated per-peer header")
+            (_, flags, _, address, peer_asn, _,
+             seconds, microseconds) = _PEER.unpack_from(body)
+            origin, routes, withdrawn = parse_update(body[_PEER.size:],
+                                                     bool(flags & _PEER_AS2),
+                                                     peer_asn)
+        except BMPError as err:
+            LOG.debug("Skipping Route Monitoring message: %s", err)
+            with self._lock:
+                self._stats['messages'] += 1
+                self._stats['errors'] += 1
+            return
+
+        with self._lock:
+            self._stats['messages'] += 1
+            self._stats['route_monitoring'] += 1
+            self._stats['announcements'] += len(routes)
+            self._stats['withdrawals'] += withdrawn
+
+        if routes:
+            peer = (_address_str(6 if flags & _PEER_IPV6 else 4,
+                                 address if flags & _PEER_IPV6 else address[12:]),
+                    peer_asn,
+                    seconds + microseconds / 1000000.0)
+            self._announcements.put((peer, origin, routes))
+
+    def _next_batch(self):
+        try:
+            messages = [self._announcements.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        count = len(messages[0][2])
+        while count < self._batch_size:
+            try:
+                messages.append(self._announcements.get_nowait())
+            except queue.Empty:
+                break
+            count += len(messages[-1][2])
+        return messages
+
+    def _run(self):
+        thread = threading.current_thread()
+        while True:
+            messages = self._next_batch()
+            if not messages:
+                # stop once the queued announcements are validated
+                if thread.stopped():
+                    return
+                continue
+            try:
+                self._emit(self._validate(messages), thread)
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Validation of BMP announcements failed")
+                self._count('errors')
+
+    def _validate(self, messages):
+        count = sum(len(routes) for _, _, routes in messages)
+        asns = ffi.new('uint32_t[]', count)
+        prefixes = ffi.new('struct lrtr_ip_addr[]', count)
+        mask_lens = ffi.new('uint8_t[]', count)
+
+        i = 0
+        for _, origin, routes in messages:
+            for version, address, mask_len in routes:
+                prefix = prefixes[i]
+                if version == 4:
+                    prefix.ver = lib.LRTR_IPV4
+                    prefix.u.addr4.addr = _IPV4.unpack_from(address)[0]
+                else:
+                    prefix.ver = lib.LRTR_IPV6
+                    prefix.u.addr6.addr = _IPV6.unpack(address)
+                asns[i] = origin
+                mask_lens[i] = mask_len
+                i += 1
+
+        codes = validate_routes(self._source.pfx_table,
+                                PreparedRoutes(asns, prefixes, mask_lens))
+
+        results = []
+        i = 0
+        for (peer_address, peer_asn, timestamp), origin, routes in messages:
+            for version, address, mask_len in routes:
+                results.append(AnnotatedRoute(peer_address, peer_asn, timestamp,
+                                              _address_str(version, address), mask_len,
+                                              origin, codes[i]))
+                i += 1
+
+        with self._lock:
+            self._stats['validated'] += count
+            self._stats['batches'] += 1
+        return results
+
+    def _emit(self, results, thread):
+        if self._overflow is OverflowPolicy.block:
+            # a stopping collector must not wait for a consumer forever
+            while True:
+                try:
+                    self._results.put(results, timeout=self._flush_interval)
+                    return
+                except queue.Full:
+                    if thread.stopped():
+                        self._count('dropped')
+                        return
+        while True:
+            try:
+                self._results.put_nowait(results)
+                return
+            except queue.Full:
+                if self._overflow is OverflowPolicy.drop_new:
+                    self._count('dropped')
+                    return
+            try:
+                self._results.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+
+
+class BMPReplayClient(object):
+    r"""
+    Sends BMP messages to a collector like a router.
+
+    Stands in for a router in tests and benchmarks, e.g. to replay a \
+    capture of the BMP messages of a router.
+
+    :param str host: address of the collector
+    :param int port: port of the collector
+    :param float timeout: socket timeout in seconds
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self._socket = socket.create_connection((host, port), timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def send(self, messages):
+        """
+        Send encoded BMP messages.
+
+        :param messages: encoded messages, e.g. from :func:`route_monitoring`
+        :type messages: iterable of bytes
+        """
+        self._socket.sendall(b''.join(messages))
+
+    def replay_file(self, path, chunk_size=1000):
+        """
+        Send the BMP messages of a file with concatenated messages.
+
+        :param str path: path of the capture
+        :param int chunk_size: number of messages per send
+        :return: number of sent messages
+        :rtype: int
+
+        :raises BMPError: if the file has a malformed message
+        """
+        count = 0
+        chunk = []
+        with open(path, 'rb') as capture:
+            while True:
+                message = read_message(capture)
+                if message is None:
+                    break
+                chunk.append(encode_message(*message))
+                if len(chunk) == chunk_size:
+                    self.send(chunk)
+                    count += len(chunk)
+                    chunk = []
+        self.send(chunk)
+        return count + len(chunk)
+
+    def close(self):
+        """Close the connection, the collector finishes its messages."""
+        self._socket.close()
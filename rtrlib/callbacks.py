@@ -5,15 +5,28 @@ Utility functions and wrapper for callbacks
 from __future__ import absolute_import, unicode_literals
 
 import logging
+import time
 
 from _rtrlib import ffi
+from . import profiling
 from .manager_group import ManagerGroup, ManagerGroupStatus
 from .rtr_socket import RTRSocket
-from .records import PFXRecord, SPKIRecord
+from .records import PFXRecord, SPKIRecord, copy_pfx_record, copy_spki_record
 
 LOG = logging.getLogger(__name__)
 
 
+def _call(mgr, callback, *args):
+    """
+    Call a user callback directly or,
+    if the manager has a dispatcher, queue it for its worker thread.
+    """
+    if mgr.dispatcher is None:
+        callback(*args)
+    else:
+        mgr.dispatcher.submit(callback, *args)
+
+
 @ffi.def_extern(name="rtr_mgr_status_callback")
 def status_callback(rtr_mgr_group, group_status, rtr_socket, object_handle):
     """
@@ -21,14 +34,34 @@ def status_callback(rtr_mgr_group, group_status, rtr_socket, object_handle):
     This wrapper is only for the status callback of the rtrlib manager.
     """
 
+    timer = profiling.start('status_callback')
+
     object_ = ffi.from_handle(object_handle)
+    group = ManagerGroup(rtr_mgr_group)
+    status = ManagerGroupStatus(group_status)
+    socket = RTRSocket(rtr_socket)
+
+    if timer:
+        timer.lap('wrap')
+
+    for listener in object_._status_listeners:
+        listener(group, status, socket)
+
+    if timer:
+        timer.lap('listeners')
+
+    if object_._status_callback:
+        _call(
+            object_,
+            object_._status_callback,
+            group,
+            status,
+            socket,
+            object_._status_callback_data
+            )
 
-    object_._status_callback(
-        ManagerGroup(rtr_mgr_group),
-        ManagerGroupStatus(group_status),
-        RTRSocket(rtr_socket),
-        object_._status_callback_data
-        )
+    if timer:
+        timer.stop('callback')
 
 
 @ffi.def_extern(name="pfx_table_callback")
@@ -37,30 +70,92 @@ def pfx_table_callback(pfx_record, object_handle):
     Wraps the pfx_table callback, used for iteration of the pfx table,
     to hide cffi specifics
     """
+    timer = profiling.start('pfx_table_callback')
+
     callback, data = ffi.from_handle(object_handle)
+    record = PFXRecord(pfx_record)
 
-    callback(PFXRecord(pfx_record), data)
+    if timer:
+        timer.lap('wrap')
+
+    callback(record, data)
+
+    if timer:
+        timer.stop('callback')
 
 
 @ffi.def_extern(name="pfx_update_callback")
 def pfx_update_callback(pfx_table, record, added):
+    timer = profiling.start('pfx_update_callback')
+
     wrapped_socket = ffi.cast("struct rtr_socket_wrapper *", record.socket)
     mgr = ffi.from_handle(wrapped_socket.data)
 
-    mgr._pfx_update_callback(
-            PFXRecord(record),
-            added,
-            mgr._pfx_update_callback_data,
-        )
+    pfx_record = PFXRecord(record)
+
+    if timer:
+        timer.lap('wrap')
+
+    tracer = mgr.sync_tracer
+    if tracer is not None:
+        start = time.time()
+
+    for listener in mgr._pfx_update_listeners:
+        listener(pfx_record, added)
+
+    if timer:
+        timer.lap('listeners')
+
+    if mgr._pfx_update_callback:
+        # the record is only valid during this call
+        if mgr.dispatcher is not None:
+            pfx_record = copy_pfx_record(pfx_record)
+
+        _call(
+                mgr,
+                mgr._pfx_update_callback,
+                pfx_record,
+                added,
+                mgr._pfx_update_callback_data,
+            )
+
+    if tracer is not None:
+        tracer.pfx_update(pfx_record, added, time.time() - start)
+
+    if timer:
+        timer.stop('callback')
 
 
 @ffi.def_extern(name="spki_update_callback")
 def spki_update_callback(spki_table, record, added):
+    timer = profiling.start('spki_update_callback')
+
     wrapped_socket = ffi.cast("struct rtr_socket_wrapper *", record.socket)
     mgr = ffi.from_handle(wrapped_socket.data)
 
-    mgr._spki_update_callback(
-            SPKIRecord(record),
-            added,
-            mgr._spki_update_callback_data,
+    spki_record = SPKIRecord(record)
+
+    if timer:
+        timer.lap('wrap')
+
+    for listener in mgr._spki_update_listeners:
+        listener(spki_record, added)
+
+    if timer:
+        timer.lap('listeners')
+
+    if mgr._spki_update_callback:
+        # the record is only valid during this call
+        if mgr.dispatcher is not None:
+            spki_record = copy_spki_record(spki_record)
+
+        _call(
+                mgr,
+                mgr._spki_update_callback,
+                spki_record,
+                added,
+                mgr._spki_update_callback_data,
             )
+
+    if timer:
+        timer.stop('callback')
@@ -0,0 +1,302 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.churn
+------------
+
+Sliding window rates of the pfx updates to detect churn storms
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import random
+import threading
+import time
+
+from _rtrlib import ffi
+
+from .report import SpaceSaving
+from .rtr_socket import RTRSocketState
+
+_PRIME = (1 << 61) - 1
+
+
+class CountMinSketch(object):
+    r"""
+    Approximate counts of integer keys in fixed memory.
+
+    Every key is counted in one cell of each of the depth rows, its \
+    estimate is the smallest of these cells. Estimates are never lower \
+    than the true count.
+
+    :param int width: cells per row
+    :param int depth: number of rows
+    :param int seed: seed of the hash functions, sketches can only be \
+        combined if they have the same width, depth and seed
+    """
+
+    def __init__(self, width=2048, depth=4, seed=0):
+        rnd = random.Random(seed)
+        self._width = width
+        self._hashes = [(rnd.randint(1, _PRIME - 1), rnd.randint(0, _PRIME - 1))
+                        for _ in range(depth)]
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _cells(self, key):
+        width = self._width
+        return [((a * key + b) % _PRIME) % width for a, b in self._hashes]
+
+    def add(self, key, count=1):
+        """Add count occurrences of key."""
+        for row, cell in zip(self._rows, self._cells(key)):
+            row[cell] += count
+
+    def estimate(self, key):
+        """Return the estimated count of key."""
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(key)))
+
+    def subtract(self, other):
+        """Subtract the counts of a sketch with the same parameters."""
+        for row, other_row in zip(self._rows, other._rows):
+            for cell, count in enumerate(other_row):
+                if count:
+                    row[cell] -= count
+
+    def clear(self):
+        """Reset all counts to 0."""
+        for row in self._rows:
+            row[:] = [0] * self._width
+
+
+class _Bucket(object):
+
+    def __init__(self, width, depth, top_k):
+        self.origins = CountMinSketch(width, depth)
+        self.top = SpaceSaving(top_k)
+        self.adds = 0
+        self.removes = 0
+        self.resync = 0
+        self.sockets = {}
+
+
+class ChurnMonitor(object):
+    r"""
+    Add and remove rates of the pfx updates of a :class:`.RTRManager`.
+
+    The monitor is fed by the pfx update and status listeners of the \
+    manager. Rates are averaged over a sliding window that is split into \
+    resolution buckets, globally, per socket and per origin ASN. The per \
+    origin rates are estimated with count-min sketches and the busiest \
+    origins are tracked with :class:`.SpaceSaving` counters, memory does \
+    not grow with the number of updates or origins.
+
+    Updates received while a socket resynchronizes after a reset query are \
+    the expected reload of the whole table, they are only counted as \
+    resync and not as churn.
+
+    alert_callback is called as alert_callback(kind, key, rate) when a \
+    rate exceeds its threshold and again after it dropped below and \
+    exceeded it once more. kind is "global" with key None or "origin" with \
+    the ASN as key. It is called on the thread that delivers the updates \
+    and should return quickly.
+
+    :param float window: length of the window in seconds
+    :param int resolution: number of buckets of the window
+    :param int width: width of the count-min sketches
+    :param int depth: depth of the count-min sketches
+    :param int top_k: number of origins tracked as busiest per bucket
+    :param float storm_rate: global updates per second that raise an alert
+    :param float origin_storm_rate: updates per second of one origin \
+        that raise an alert
+    :param alert_callback: function called on alerts
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self,
+                 window=60,
+                 resolution=12,
+                 width=2048,
+                 depth=4,
+                 top_k=20,
+                 storm_rate=None,
+                 origin_storm_rate=None,
+                 alert_callback=None,
+                 clock=time.time):
+        self._window = float(window)
+        self._bucket_width = self._window / resolution
+        self._top_k = top_k
+        self._buckets = [_Bucket(width, depth, top_k) for _ in range(resolution)]
+        self._origins = CountMinSketch(width, depth)
+        self._bucket = int(clock() // self._bucket_width)
+        self._resyncing = set()
+        self._storm_rate = storm_rate
+        self._origin_storm_rate = origin_storm_rate
+        self._alert_callback = alert_callback
+        self._alerts = set()
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _session_id(socket):
+        return int(ffi.cast('uintptr_t', socket))
+
+    def _advance(self):
+        bucket = int(self._clock() // self._bucket_width)
+        expired = min(bucket - self._bucket, len(self._buckets))
+        for i in range(1, expired + 1):
+            old = self._buckets[(self._bucket + i) % len(self._buckets)]
+            self._origins.subtract(old.origins)
+            old.origins.clear()
+            old.top = SpaceSaving(self._top_k)
+            old.adds = old.removes = old.resync = 0
+            old.sockets = {}
+        self._bucket = max(bucket, self._bucket)
+        return self._buckets[self._bucket % len(self._buckets)]
+
+    def status_update(self, group, group_status, socket):
+        """
+        Track the sockets that resynchronize after a reset query.
+
+        Has the signature of a status listener.
+        """
+        state = socket.state
+        session_id = self._session_id(socket._socket)
+
+        with self._lock:
+            if state == RTRSocketState.RESET:
+                self._resyncing.add(session_id)
+            elif state != RTRSocketState.SYNC:
+                self._resyncing.discard(session_id)
+
+    def pfx_update(self, record, added):
+        """
+        Count a pfx update.
+
+        Has the signature of a pfx update listener.
+        """
+        asn = record.asn
+        session_id = self._session_id(record._record.socket)
+        alerts = []
+
+        with self._lock:
+            bucket = self._advance()
+            if session_id in self._resyncing:
+                bucket.resync += 1
+                return
+
+            if added:
+                bucket.adds += 1
+            else:
+                bucket.removes += 1
+            counts = bucket.sockets.setdefault(session_id, [0, 0])
+            counts[0 if added else 1] += 1
+
+            bucket.origins.add(asn)
+            bucket.top.add(asn)
+            self._origins.add(asn)
+
+            if self._storm_rate is not None:
+                self._check('global', None, self._global_rate(),
+                            self._storm_rate, alerts)
+            if self._origin_storm_rate is not None:
+                self._check('origin', asn, self._rate(self._origins.estimate(asn)),
+                            self._origin_storm_rate, alerts)
+
+        if self._alert_callback is not None:
+            for alert in alerts:
+                self._alert_callback(*alert)
+
+    def _check(self, kind, key, rate, threshold, alerts):
+        if rate > threshold:
+            if (kind, key) not in self._alerts:
+                self._alerts.add((kind, key))
+                alerts.append((kind, key, rate))
+        else:
+            self._alerts.discard((kind, key))
+
+    def _rate(self, count):
+        return count / self._window
+
+    def _global_rate(self):
+        return self._rate(sum(b.adds + b.removes for b in self._buckets))
+
+    def rates(self):
+        """
+        Return the global rates in updates per second.
+
+        :return: dict with the keys adds, removes and resync
+        :rtype: dict
+        """
+        with self._lock:
+            self._advance()
+            return {
+                'adds': self._rate(sum(b.adds for b in self._buckets)),
+                'removes': self._rate(sum(b.removes for b in self._buckets)),
+                'resync': self._rate(sum(b.resync for b in self._buckets)),
+            }
+
+    def socket_rates(self):
+        r"""
+        Return the rates of every socket in updates per second.
+
+        :return: dict mapping a session id, as used by :class:`.SyncTracer`, \
+            to a dict with the keys adds and removes
+        :rtype: dict
+        """
+        with self._lock:
+            self._advance()
+            totals = {}
+            for bucket in self._buckets:
+                for session_id, (adds, removes) in bucket.sockets.items():
+                    total = totals.setdefault(session_id, [0, 0])
+                    total[0] += adds
+                    total[1] += removes
+            return dict((session_id, {'adds': self._rate(adds),
+                                      'removes': self._rate(removes)})
+                        for session_id, (adds, removes) in totals.items())
+
+    def origin_rate(self, asn):
+        """
+        Return the estimated updates per second of an origin ASN.
+
+        The estimate is an upper bound of the true rate.
+
+        :param int asn: autonomous system number
+        :rtype: float
+        """
+        with self._lock:
+            self._advance()
+            return self._rate(self._origins.estimate(asn))
+
+    def top_origins(self, n=10):
+        """
+        Return the origin ASNs with the most updates in the window.
+
+        :param int n: number of origins
+        :rtype: list of (asn, updates per second) tuples
+        """
+        with self._lock:
+            self._advance()
+            candidates = set()
+            for bucket in self._buckets:
+                candidates.update(asn for asn, _, _ in bucket.top.top())
+            rates = [(asn, self._rate(self._origins.estimate(asn)))
+                     for asn in candidates]
+        return sorted(rates, key=lambda item: (-item[1], item[0]))[:n]
+
+    def alerts(self):
+        """
+        Return the thresholds that are currently exceeded.
+
+        :rtype: list of (kind, key) tuples
+        """
+        with self._lock:
+            self._advance()
+            for kind, key in list(self._alerts):
+                if kind == 'global':
+                    exceeded = self._global_rate() > self._storm_rate
+                else:
+                    exceeded = (self._rate(self._origins.estimate(key)) >
+                                self._origin_storm_rate)
+                if not exceeded:
+                    self._alerts.discard((kind, key))
+            return sorted(self._alerts, key=lambda alert: (alert[0], alert[1] or 0))
@@ -0,0 +1,235 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.compaction
+-----------------
+
+Find redundant records and build a minimal table with the same results
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+from _rtrlib import ffi, lib
+
+from .batch import prepare_routes, validate_routes
+from .pfx_table import PfxTable
+from .records import PFXRecord
+from .util import ip_str_to_addr
+
+_POINTER = ffi.sizeof('void *')
+
+NODE_BYTES = ((ffi.sizeof('struct lrtr_ip_addr') + _POINTER - 1) // _POINTER * _POINTER +
+              7 * _POINTER)
+"""Estimated heap bytes of a trie node of rtrlib with its data array header"""
+
+ELEM_BYTES = 2 * _POINTER
+"""Estimated heap bytes of a record in the data array of a trie node"""
+
+
+def _record_tuple(record):
+    if isinstance(record, PFXRecord):
+        return record.asn, record.prefix, record.min_len, record.max_len
+    return tuple(record)
+
+
+def _address(prefix):
+    addr = ip_str_to_addr(prefix)
+    if addr.ver == lib.LRTR_IPV4:
+        return 32, addr.u.addr4.addr
+
+    value = 0
+    for word in addr.u.addr6.addr:
+        value = (value << 32) | word
+    return 128, value
+
+
+class CompactionReport(object):
+    r"""
+    Result of :func:`analyze`.
+
+    :ivar list redundant: (record, covering record) tuples, every \
+        redundant record with a record that makes it redundant
+    :ivar list kept: the records of the minimal table
+    :ivar int nodes_before: trie nodes of the table
+    :ivar int nodes_after: trie nodes of the minimal table
+    :ivar mismatches: routes validated differently by the minimal table, \
+        None if the tables were not verified
+    :ivar float lookup_before: seconds to validate the verification routes \
+        against the table, None if the tables were not verified
+    :ivar float lookup_after: the same for the minimal table
+
+    Records are (asn, prefix, min_len, max_len) tuples.
+    """
+
+    def __init__(self, redundant, kept, nodes_before, nodes_after):
+        self.redundant = redundant
+        self.kept = kept
+        self.nodes_before = nodes_before
+        self.nodes_after = nodes_after
+        self.mismatches = None
+        self.lookup_before = None
+        self.lookup_after = None
+
+    @property
+    def records_before(self):
+        """Number of records of the table."""
+        return len(self.kept) + len(self.redundant)
+
+    @property
+    def bytes_before(self):
+        """Estimated heap bytes of the trie of the table."""
+        return self.nodes_before * NODE_BYTES + self.records_before * ELEM_BYTES
+
+    @property
+    def bytes_after(self):
+        """Estimated heap bytes of the trie of the minimal table."""
+        return self.nodes_after * NODE_BYTES + len(self.kept) * ELEM_BYTES
+
+    def as_dict(self):
+        """
+        Return the savings as a dict of plain python types.
+
+        :rtype: dict
+        """
+        return {
+            'records_before': self.records_before,
+            'records_after': len(self.kept),
+            'nodes_before': self.nodes_before,
+            'nodes_after': self.nodes_after,
+            'bytes_before': self.bytes_before,
+            'bytes_after': self.bytes_after,
+            'lookup_before': self.lookup_before,
+            'lookup_after': self.lookup_after,
+            'mismatches': (len(self.mismatches)
+                           if self.mismatches is not None else None),
+        }
+
+
+def analyze(records):
+    r"""
+    Find the records that do not change any validation result.
+
+    A record is redundant if a record with the same asn covers its prefix \
+    with a max_len that is at least as long, every route the record makes \
+    valid is valid by the covering record as well and every route it covers \
+    is covered by the covering record. The pfxv_state of every route is the \
+    same without the redundant records, the reasons of invalid routes may \
+    list fewer records.
+
+    :param records: :class:`.PFXRecord` objects or \
+        (asn, prefix, min_len, max_len) tuples, e.g. a :class:`.PfxTableSnapshot`
+    :type records: iterable
+    :rtype: CompactionReport
+    """
+    records = [_record_tuple(record) for record in records]
+    addresses = [_address(prefix) for _, prefix, _, _ in records]
+
+    # (asn, bits) -> {length: {network: (max_len, record)}}
+    by_origin = {}
+    nodes = set()
+    for record, (bits, value) in zip(records, addresses):
+        asn, _, length, max_len = record
+        network = value >> (bits - length)
+        nodes.add((bits, length, network))
+
+        networks = by_origin.setdefault((asn, bits), {}).setdefault(length, {})
+        best = networks.get(network)
+        if best is None or best[0] < max_len:
+            networks[network] = (max_len, record)
+
+    redundant = []
+    kept = []
+    kept_nodes = set()
+    for record, (bits, value) in zip(records, addresses):
+        asn, _, length, max_len = record
+        lengths = by_origin[(asn, bits)]
+        covering = None
+
+        for covering_length in sorted(lengths):
+            if covering_length > length:
+                break
+            best = lengths[covering_length].get(value >> (bits - covering_length))
+            if best is None or best[1] == record:
+                continue
+            if best[0] > max_len or (best[0] == max_len and covering_length < length):
+                covering = best[1]
+                break
+
+        if covering is None:
+            kept.append(record)
+            kept_nodes.add((bits, length, value >> (bits - length)))
+        else:
+            redundant.append((record, covering))
+
+    return CompactionReport(redundant, kept, len(nodes), len(kept_nodes))
+
+
+def probe_routes(records):
+    r"""
+    Return routes that hit every boundary where a record changes a result.
+
+    For every record these are its prefix announced by its asn with \
+    min_len, max_len and max_len + 1 and announced by another asn.
+
+    :param records: (asn, prefix, min_len, max_len) tuples
+    :rtype: list of (asn, prefix, mask_len) tuples
+    """
+    routes = []
+    for asn, prefix, min_len, max_len in records:
+        bits = 128 if ':' in prefix else 32
+        routes.append((asn, prefix, min_len))
+        routes.append((asn, prefix, max_len))
+        if max_len < bits:
+            routes.append((asn, prefix, max_len + 1))
+        routes.append(((asn + 1) & 0xFFFFFFFF, prefix, min_len))
+    return routes
+
+
+def verify(pfx_table, other, routes):
+    r"""
+    Compare the validation results of two tables.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param cdata other: struct pfx_table *
+    :param routes: (asn, prefix, mask_len) tuples
+    :return: the (route, state, other state) tuples that differ and the \
+        seconds both tables needed to validate the routes
+    :rtype: tuple of list, float and float
+    """
+    prepared = prepare_routes(routes)
+    codes = bytearray(len(routes))
+    other_codes = bytearray(len(routes))
+
+    start = time.time()
+    validate_routes(pfx_table, prepared, out=codes, flags=False)
+    middle = time.time()
+    validate_routes(other, prepared, out=other_codes, flags=False)
+    end = time.time()
+
+    mismatches = [(route, code, other_code)
+                  for route, code, other_code in zip(routes, codes, other_codes)
+                  if code != other_code]
+    return mismatches, middle - start, end - middle
+
+
+def compact(table, check=True):
+    r"""
+    Build a minimal table that validates every route like table.
+
+    :param table: :class:`.PfxTable` or :class:`.RTRManager`
+    :param bool check: compare the results of both tables for \
+        :func:`probe_routes` of all records and time the lookups
+    :return: the minimal table and the report
+    :rtype: tuple of :class:`.PfxTable` and :class:`CompactionReport`
+    """
+    report = analyze(table.snapshot())
+    minimal = PfxTable()
+    minimal.reload(report.kept)
+
+    if check:
+        routes = probe_routes([record for record, _ in report.redundant] + report.kept)
+        report.mismatches, report.lookup_before, report.lookup_after = \
+            verify(table.pfx_table, minimal.pfx_table, routes)
+
+    return minimal, report
@@ -0,0 +1,319 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.daemon
+-------------
+
+Serve route origin validation to local processes over a Unix socket
+
+Protocol
+^^^^^^^^
+
+All integers are in network byte order. A client sends request frames \
+and may send the next request before the previous response arrived, \
+responses are sent in request order.
+
+Request: ``request id (uint32), count (uint16)`` followed by count routes \
+of ``asn (uint32), ip version 4 or 6 (uint8), mask_len (uint8), \
+address (16 bytes, IPv4 addresses are padded with zeros)``.
+
+Response: ``request id (uint32), status (uint8), count (uint16)`` followed \
+by count result codes (uint8) as described in :mod:`rtrlib.batch`. On \
+error the status is not 0 and count is 0.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import logging
+import os
+import socket
+import stat
+import struct
+
+from six.moves import socketserver
+
+from _rtrlib import ffi, lib
+
+from .batch import ALL_BITS, STATE_MASK
+from .exceptions import IpConversionException, PFXException
+from .rtr_manager import ValidationResult
+from .util import is_integer
+
+
+LOG = logging.getLogger(__name__)
+
+_REQUEST = struct.Struct('!IH')
+_ROUTE = struct.Struct('!IBB16s')
+_RESPONSE = struct.Struct('!IBH')
+_IPV4 = struct.Struct('!I')
+_IPV6 = struct.Struct('!4I')
+
+MAX_BATCH = 0xFFFF
+"""Maximum number of routes in one request"""
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _validate_request(pfx_table, body, count):
+    asns = ffi.new('uint32_t[]', count)
+    prefixes = ffi.new('struct lrtr_ip_addr[]', count)
+    mask_lens = ffi.new('uint8_t[]', count)
+    results = ffi.new('uint8_t[]', count)
+
+    for i in range(count):
+        asn, version, mask_len, address = _ROUTE.unpack_from(body, i * _ROUTE.size)
+        prefix = prefixes[i]
+        if version == 4:
+            prefix.ver = lib.LRTR_IPV4
+            prefix.u.addr4.addr = _IPV4.unpack_from(address)[0]
+        elif version == 6:
+            prefix.ver = lib.LRTR_IPV6
+            prefix.u.addr6.addr = _IPV6.unpack(address)
+        else:
+            raise ValueError("Unknown ip version {}".format(version))
+        asns[i] = asn
+        mask_lens[i] = mask_len
+
+    ret = lib.pfx_table_validate_batch(pfx_table,
+                                       asns,
+                                       prefixes,
+                                       mask_lens,
+                                       count,
+                                       results,
+                                       ALL_BITS)
+    if ret == lib.PFX_ERROR:
+        raise ValueError("Mask length too long")
+
+    return ffi.buffer(results)[:]
+
+
+def _remove_stale_socket(path):
+    # only the socket file of a server that is gone is removed
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "File exists and is not a socket", path)
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as err:
+        if err.errno != errno.ECONNREFUSED:
+            raise
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "A server is listening on the socket", path)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            header = _recv_exactly(self.request, _REQUEST.size)
+            if header is None:
+                return
+            request_id, count = _REQUEST.unpack(header)
+
+            body = _recv_exactly(self.request, count * _ROUTE.size)
+            if body is None:
+                return
+
+            try:
+                codes = _validate_request(self.server.source.pfx_table, body, count)
+            except ValueError as err:
+                LOG.debug("Invalid request %d: %s", request_id, err)
+                self.request.sendall(_RESPONSE.pack(request_id, STATUS_ERROR, 0))
+                continue
+
+            self.request.sendall(_RESPONSE.pack(request_id, STATUS_OK, count) + codes)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ValidationServer(object):
+    r"""
+    Validation service on a Unix socket.
+
+    Every connection is served by its own thread, requests of a \
+    connection are answered in order. The table is taken from \
+    source.pfx_table for every request, source is usually a started \
+    :class:`.RTRManager`.
+
+    :param source: object with a pfx_table attribute, \
+        e.g. :class:`.RTRManager` or :class:`.PfxTable`
+    :param str path: path of the Unix socket, a stale socket file of a \
+        server that is gone is replaced
+
+    :raises OSError: if path exists and is not a socket or a server is \
+        listening on it
+    """
+
+    def __init__(self, source, path):
+        _remove_stale_socket(path)
+
+        self.path = path
+        self._server = _UnixServer(path, _RequestHandler)
+        self._server.source = source
+
+    def serve_forever(self):
+        """Handle requests until :py:meth:`shutdown` is called."""
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop :py:meth:`serve_forever`, must be called from another thread."""
+        self._server.shutdown()
+
+    def close(self):
+        """Close the socket and remove its file."""
+        self._server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ValidationClient(object):
+    r"""
+    Client of a :class:`ValidationServer`.
+
+    :py:meth:`validate` and :py:meth:`validate_many` return \
+    :class:`.ValidationResult` objects like :py:meth:`.PfxTable.validate`. \
+    A client must not be shared between threads.
+
+    :param str path: path of the Unix socket
+    :param float timeout: socket timeout in seconds
+    :param int window: number of requests sent ahead of the responses
+    """
+
+    def __init__(self, path, timeout=None, window=8):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._window = window
+        self._request_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        """Close the connection."""
+        self._socket.close()
+
+    def validate(self, asn, prefix, mask_len):
+        """
+        Validate BGP prefix and returns state as ValidationResult object.
+
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: ValidationResult
+        """
+        return self.validate_many([(asn, prefix, mask_len)])[0]
+
+    def validate_many(self, routes, batch_size=1000):
+        """
+        Validate many routes with pipelined requests.
+
+        :param routes: (asn, prefix, mask_len) tuples
+        :type routes: sequence of tuples
+        :param int batch_size: number of routes per request
+        :rtype: list of ValidationResult
+        """
+        codes = self.validate_codes(routes, batch_size)
+        return [ValidationResult(prefix, mask_len, asn, code & STATE_MASK)
+                for (asn, prefix, mask_len), code in zip(routes, codes)]
+
+    def validate_codes(self, routes, batch_size=1000):
+        """
+        Validate many routes and return the raw result codes.
+
+        :param routes: (asn, prefix, mask_len) tuples
+        :type routes: sequence of tuples
+        :param int batch_size: number of routes per request
+        :return: result codes as described in :mod:`rtrlib.batch`
+        :rtype: bytearray
+        """
+        batch_size = min(batch_size, MAX_BATCH)
+        # an invalid route raises before the first request is sent, no
+        # response is left unread on the connection
+        batches = [self._encode(routes[start:start + batch_size])
+                   for start in range(0, len(routes), batch_size)]
+        pending = []
+        codes = bytearray()
+        rejected = False
+
+        for count, body in batches:
+            if len(pending) >= self._window:
+                rejected |= self._receive(pending.pop(0), codes)
+            pending.append(self._send(count, body))
+
+        # read every response even after a rejected request, the next
+        # call would see them otherwise
+        for request_id in pending:
+            rejected |= self._receive(request_id, codes)
+
+        if rejected:
+            raise PFXException("The validation server rejected the request")
+
+        return codes
+
+    @staticmethod
+    def _encode(routes):
+        frame = []
+        for asn, prefix, mask_len in routes:
+            if not is_integer(asn):
+                raise TypeError("asn must be integer not %s" % type(asn))
+            if not is_integer(mask_len):
+                raise TypeError("mask_len must be integer not %s" % type(mask_len))
+
+            try:
+                if ':' in prefix:
+                    version = 6
+                    address = socket.inet_pton(socket.AF_INET6, prefix)
+                else:
+                    version = 4
+                    address = socket.inet_pton(socket.AF_INET, prefix)
+            except (socket.error, ValueError):
+                raise IpConversionException("String could not be converted")
+            frame.append(_ROUTE.pack(asn, version, mask_len, address))
+        return len(frame), b''.join(frame)
+
+    def _send(self, count, body):
+        self._request_id = (self._request_id + 1) & 0xFFFFFFFF
+        self._socket.sendall(_REQUEST.pack(self._request_id, count) + body)
+        return self._request_id
+
+    def _receive(self, request_id, codes):
+        header = _recv_exactly(self._socket, _RESPONSE.size)
+        if header is None:
+            raise PFXException("Connection closed by the validation server")
+
+        response_id, status, count = _RESPONSE.unpack(header)
+        if response_id != request_id:
+            raise PFXException("Unexpected response {}".format(response_id))
+
+        data = _recv_exactly(self._socket, count)
+        if data is None:
+            raise PFXException("Connection closed by the validation server")
+
+        codes += data
+        return status != STATUS_OK
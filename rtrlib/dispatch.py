@@ -0,0 +1,214 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.dispatch
+---------------
+
+Run user callbacks outside of the rtrlib thread
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+
+from enum import Enum
+from six.moves import queue
+
+from .util import StoppableThread
+
+
+LOG = logging.getLogger(__name__)
+
+
+class OverflowPolicy(Enum):
+    """What to do with a callback when the dispatch queue is full."""
+
+    block = 'block'
+    """Wait until the worker has made room, this stalls the rtrlib thread"""
+
+    drop_new = 'drop_new'
+    """Discard the new callback"""
+
+    drop_oldest = 'drop_oldest'
+    """Discard the oldest queued callback to make room for the new one"""
+
+
+class CallbackDispatcher(object):
+    r"""
+    Bounded queue between the rtrlib thread and the user callbacks.
+
+    When passed to :class:`.RTRManager` the callback trampolines only \
+    append the callback and its arguments to the queue, a dedicated \
+    worker thread runs them. If an executor is given, the worker hands \
+    every callback to it instead, callbacks may then run out of order. \
+    Their result is counted when the future returned by submit is done, \
+    for an executor whose submit returns no future a callback counts as \
+    processed when it is handed over.
+
+    :param int maxsize: maximum number of queued callbacks
+    :param OverflowPolicy overflow: what to do if the queue is full
+    :param executor: optional object with a \
+        :py:meth:`concurrent.futures.Executor.submit` like method
+    """
+
+    def __init__(self,
+                 maxsize=10000,
+                 overflow=OverflowPolicy.block,
+                 executor=None):
+        if not isinstance(overflow, OverflowPolicy):
+            raise TypeError("overflow must be an OverflowPolicy")
+
+        self._queue = queue.Queue(maxsize)
+        self._overflow = overflow
+        self._executor = executor
+        self._lock = threading.Lock()
+        # notified when a callback handed to the executor is done
+        self._idle = threading.Condition(self._lock)
+        self._outstanding = 0
+        self._thread = None
+
+        self._submitted = 0
+        self._processed = 0
+        self._dropped = 0
+        self._failed = 0
+        self._max_depth = 0
+
+    def start(self):
+        """Start the worker thread, does nothing if it is running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = StoppableThread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """
+        Stop the worker thread.
+
+        :param bool drain: run the queued callbacks before returning, \
+            with an executor wait until their futures are done
+        """
+        if self._thread is None:
+            return
+
+        if drain:
+            self._queue.join()
+            with self._lock:
+                while self._outstanding:
+                    self._idle.wait()
+
+        self._thread.stop()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, function, *args):
+        """
+        Queue function to be called with args by the worker thread.
+
+        Called by the callback trampolines on the rtrlib thread.
+        """
+        item = (function, args)
+
+        if self._overflow is OverflowPolicy.block:
+            self._queue.put(item)
+        elif self._overflow is OverflowPolicy.drop_new:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._lock:
+                    self._dropped += 1
+                return
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    self._discard_oldest()
+
+        with self._lock:
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+
+    def _discard_oldest(self):
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            return
+        self._queue.task_done()
+        with self._lock:
+            self._dropped += 1
+
+    def _run(self):
+        thread = threading.current_thread()
+
+        while not thread.stopped():
+            try:
+                function, args = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+            future = None
+            try:
+                if self._executor is not None:
+                    future = self._executor.submit(function, *args)
+                else:
+                    function(*args)
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Dispatched callback raised an exception")
+                self._count_processed(True)
+            else:
+                if hasattr(future, 'add_done_callback'):
+                    with self._lock:
+                        self._outstanding += 1
+                    future.add_done_callback(self._executor_done)
+                else:
+                    self._count_processed(False)
+            finally:
+                self._queue.task_done()
+
+    def _executor_done(self, future):
+        failed = True
+        if not future.cancelled():
+            exception = future.exception()
+            if exception is not None:
+                LOG.error("Dispatched callback raised an exception: %r", exception)
+            failed = exception is not None
+        self._count_processed(failed)
+
+        with self._lock:
+            self._outstanding -= 1
+            self._idle.notify_all()
+
+    def _count_processed(self, failed):
+        with self._lock:
+            self._processed += 1
+            if failed:
+                self._failed += 1
+
+    @property
+    def depth(self):
+        """Number of callbacks currently waiting in the queue."""
+        return self._queue.qsize()
+
+    def stats(self):
+        r"""
+        Return the queue metrics.
+
+        submitted, processed, dropped and failed count callbacks since \
+        the dispatcher was created, max_depth is the highest queue depth \
+        seen so far. With an executor, processed and failed count the \
+        callbacks whose future is done, a cancelled callback has failed.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'max_depth': self._max_depth,
+                'submitted': self._submitted,
+                'processed': self._processed,
+                'dropped': self._dropped,
+                'failed': self._failed,
+            }
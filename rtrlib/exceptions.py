@@ -28,3 +28,15 @@ class IpConversionException(RTRlibException):
 
 class SyncTimeout(RTRlibException):
     """The timeout was reached while waiting for sync."""
+
+
+class NotEnabledError(RTRlibException):
+    """A feature was used that was not enabled during initialization."""
+
+
+class RoaFileError(RTRlibException):
+    """A ROA file could not be parsed."""
+
+
+class UpdateLogError(RTRlibException):
+    """An update log could not be read."""
@@ -0,0 +1,376 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.history
+--------------
+
+Validate routes against the records of any point in the past
+
+Storage
+^^^^^^^
+
+Records are packed into 23 bytes, ``ip version (uint8), network \
+(16 bytes), min_len (uint8), asn (uint32), max_len (uint8)``, which sort \
+like the records of a trie walk. Every update that adds a record missing \
+from the table or removes its last copy is a delta of 32 bytes, its \
+timestamp (double) and flags (uint8) with the packed record. Updates that \
+do not change the set of records, e.g. the same record from a second \
+cache, are only counted.
+
+Every checkpoint_every deltas a checkpoint stores all records sorted, \
+23 bytes per record, and the deltas since the previous checkpoint are \
+indexed by their record with 4 more bytes per delta. A query looks up \
+the covering records of a route in the checkpoint before its time and \
+in the index of the following deltas with one binary search per prefix \
+length, the latency does not depend on the length of the history. The \
+deltas after the last checkpoint are indexed in a dict.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import array
+import bisect
+import socket
+import struct
+import threading
+import time
+
+from _rtrlib import lib
+
+from .overlay import route_state
+from .pfx_table import PfxTable
+from .rtr_manager import ValidationResult
+from .records import PFXRecord
+from .update_log import ADDED, read_update_log
+from .util import is_integer
+
+_RECORD = struct.Struct('!B16sBIB')
+_DELTA_SIZE = 1 + _RECORD.size
+_PREFIX_SIZE = 18
+_IPV4 = struct.Struct('!I12x')
+_IPV6 = struct.Struct('!QQ')
+_MASK64 = 2 ** 64 - 1
+
+
+def _network(version, address, length):
+    """Return the 16 bytes of the network of an integer address."""
+    bits = 32 if version == 4 else 128
+    network = address >> (bits - length) << (bits - length)
+    if version == 4:
+        return _IPV4.pack(network)
+    return _IPV6.pack(network >> 64, network & _MASK64)
+
+
+def _pack(asn, version, address, min_len, max_len):
+    return _RECORD.pack(version, _network(version, address, min_len), min_len, asn, max_len)
+
+
+def _pack_record(record):
+    prefix = record.prefix
+    if prefix.ver == lib.LRTR_IPV4:
+        version, address = 4, prefix.u.addr4.addr
+    else:
+        version, address = 6, 0
+        for word in prefix.u.addr6.addr:
+            address = (address << 32) | word
+    return _pack(record.asn, version, address, record.min_len, record.max_len)
+
+
+def _unpack(packed):
+    """Return the (asn, prefix, min_len, max_len) tuple of a packed record."""
+    version, network, min_len, asn, max_len = _RECORD.unpack(packed)
+    if version == 4:
+        prefix = socket.inet_ntop(socket.AF_INET, network[:4])
+    else:
+        prefix = socket.inet_ntop(socket.AF_INET6, network)
+    return asn, prefix, min_len, max_len
+
+
+def _parse(prefix):
+    try:
+        if ':' in prefix:
+            high, low = _IPV6.unpack(socket.inet_pton(socket.AF_INET6, prefix))
+            return 6, high << 64 | low
+        return 4, struct.unpack('!I', socket.inet_pton(socket.AF_INET, prefix))[0]
+    except (socket.error, OSError, TypeError):
+        raise ValueError("%s is not an ip address" % prefix)
+
+
+def _search(count, key, prefix):
+    """First of count sorted items whose key(i) is not below prefix."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if key(middle) < prefix:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class _Checkpoint(object):
+    r"""
+    All records after the first position deltas and, once the next \
+    checkpoint exists, the positions of the following deltas sorted by \
+    their record.
+    """
+
+    __slots__ = ('position', 'records', 'index')
+
+    def __init__(self, position, records):
+        self.position = position
+        self.records = records
+        self.index = None
+
+    def covering(self, prefix):
+        records = self.records
+        size = _RECORD.size
+        i = _search(len(records) // size,
+                    lambda i: records[i * size:i * size + _PREFIX_SIZE], prefix)
+        found = []
+        while records[i * size:i * size + _PREFIX_SIZE] == prefix:
+            found.append(records[i * size:(i + 1) * size])
+            i += 1
+        return found
+
+
+class HistoryStore(object):
+    r"""
+    Time indexed history of the pfx records of a table.
+
+    :py:meth:`pfx_update` has the signature of a pfx update listener, \
+    :class:`.RTRManager` feeds a store passed as its history argument. \
+    :py:meth:`load_update_log` adds the updates of a log written by \
+    :mod:`rtrlib.update_log`. Updates have to arrive in time order, a \
+    timestamp before the last one is recorded at the time of the last one.
+
+    :param int checkpoint_every: number of deltas between checkpoints
+    :param clock: function returning the timestamp of an update
+    """
+
+    def __init__(self, checkpoint_every=250000, clock=time.time):
+        self._checkpoint_every = checkpoint_every
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._times = array.array('d')
+        self._deltas = bytearray()
+        self._checkpoints = [_Checkpoint(0, b'')]
+        self._positions = [0]
+        self._open = {}
+        self.updates = 0
+
+    def __len__(self):
+        """Number of deltas."""
+        return len(self._times)
+
+    def pfx_update(self, record, added):
+        """
+        Record a pfx update at the current time.
+
+        Has the signature of a pfx update listener.
+        """
+        self._record(self._clock(), added, _pack_record(record._record))
+
+    def add_update(self, timestamp, added, asn, prefix, min_len, max_len):
+        """
+        Record a pfx update.
+
+        :param float timestamp: time of the update in seconds
+        :param bool added: True if the record was added
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int min_len: minimum length of the subnet mask
+        :param int max_len: maximum length of the subnet mask
+        """
+        if not is_integer(asn):
+            raise TypeError("asn must be integer not %s" % type(asn))
+        version, address = _parse(prefix)
+        self._record(timestamp, added, _pack(asn, version, address, min_len, max_len))
+
+    def load_update_log(self, path):
+        """
+        Record the pfx updates of an update log with their timestamps.
+
+        :param str path: path of the log
+        :return: number of pfx updates
+        :rtype: int
+
+        :raises UpdateLogError: if the file is not a valid log
+        """
+        count = 0
+        for timestamp, _, added, record in read_update_log(path):
+            if isinstance(record, PFXRecord):
+                self._record(timestamp, added, _pack_record(record._record))
+                count += 1
+        return count
+
+    def _record(self, timestamp, added, packed):
+        with self._lock:
+            self.updates += 1
+            count = self._counts.get(packed, 0)
+            if added:
+                self._counts[packed] = count + 1
+                if count:
+                    return
+            else:
+                if not count:
+                    return
+                if count > 1:
+                    self._counts[packed] = count - 1
+                    return
+                del self._counts[packed]
+
+            if self._times and timestamp < self._times[-1]:
+                timestamp = self._times[-1]
+            position = len(self._times)
+            self._times.append(timestamp)
+            self._deltas.append(ADDED if added else 0)
+            self._deltas += packed
+            self._open.setdefault(packed[:_PREFIX_SIZE], []).append(position)
+
+            if position + 1 - self._checkpoints[-1].position >= self._checkpoint_every:
+                self._checkpoint()
+
+    def _checkpoint(self):
+        last = self._checkpoints[-1]
+        end = len(self._times)
+        deltas = self._deltas
+        last.index = array.array('I', sorted(
+            range(last.position, end),
+            key=lambda i: deltas[i * _DELTA_SIZE + 1:(i + 1) * _DELTA_SIZE]))
+        self._checkpoints.append(_Checkpoint(end, b''.join(sorted(self._counts))))
+        self._positions.append(end)
+        self._open = {}
+
+    def _delta(self, position):
+        offset = position * _DELTA_SIZE
+        return self._deltas[offset] & ADDED, bytes(self._deltas[offset + 1:offset + _DELTA_SIZE])
+
+    def _covering(self, checkpoint, position, prefix):
+        """Packed records covered by prefix after position deltas."""
+        present = set(checkpoint.covering(prefix))
+        if checkpoint.index is None:
+            positions = self._open.get(prefix, ())
+        else:
+            index = checkpoint.index
+            deltas = self._deltas
+            start = _search(len(index), lambda i: deltas[index[i] * _DELTA_SIZE + 1:
+                                                          index[i] * _DELTA_SIZE + 1 + _PREFIX_SIZE],
+                            prefix)
+            positions = []
+            for i in range(start, len(index)):
+                offset = index[i] * _DELTA_SIZE
+                if deltas[offset + 1:offset + 1 + _PREFIX_SIZE] != prefix:
+                    break
+                positions.append(index[i])
+
+        for delta in positions:
+            if delta >= position:
+                continue
+            added, packed = self._delta(delta)
+            if added:
+                present.add(packed)
+            else:
+                present.discard(packed)
+        return present
+
+    def _locate(self, timestamp):
+        position = bisect.bisect_right(self._times, timestamp)
+        i = bisect.bisect_right(self._positions, position) - 1
+        return self._checkpoints[i], position
+
+    def covering_at(self, timestamp, prefix, mask_len):
+        r"""
+        Return the records covering a route at a point in time.
+
+        :param float timestamp: time in seconds, the updates of that \
+            second are included
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :return: (asn, prefix, min_len, max_len) tuples, the shortest \
+            prefixes first
+        :rtype: list of tuples
+
+        :raises ValueError: if prefix is not an ip address
+        """
+        version, address = _parse(prefix)
+        if mask_len > (32 if version == 4 else 128):
+            raise ValueError("mask_len %s is too long for %s" % (mask_len, prefix))
+
+        with self._lock:
+            checkpoint, position = self._locate(timestamp)
+            records = []
+            for length in range(mask_len + 1):
+                search = struct.pack('!B16sB', version, _network(version, address, length),
+                                     length)
+                records.extend(self._covering(checkpoint, position, search))
+        return [_unpack(record) for record in sorted(records)]
+
+    def validate_at(self, timestamp, asn, prefix, mask_len):
+        """
+        Validate a route against the records of a point in time.
+        The reason list in the returned result will be empty.
+
+        :param float timestamp: time in seconds
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: ValidationResult
+        """
+        records = [(record[0], record[3])
+                   for record in self.covering_at(timestamp, prefix, mask_len)]
+        return ValidationResult(prefix, mask_len, asn, route_state(asn, mask_len, records))
+
+    def records_at(self, timestamp):
+        """
+        Return all records of a point in time.
+
+        :param float timestamp: time in seconds
+        :return: (asn, prefix, min_len, max_len) tuples
+        :rtype: list of tuples
+        """
+        with self._lock:
+            checkpoint, position = self._locate(timestamp)
+            records = checkpoint.records
+            present = set(records[i:i + _RECORD.size]
+                          for i in range(0, len(records), _RECORD.size))
+            for delta in range(checkpoint.position, position):
+                added, packed = self._delta(delta)
+                if added:
+                    present.add(packed)
+                else:
+                    present.discard(packed)
+        return [_unpack(record) for record in sorted(present)]
+
+    def table_at(self, timestamp):
+        """
+        Rebuild the table of a point in time.
+
+        :param float timestamp: time in seconds
+        :rtype: :class:`.PfxTable`
+        """
+        table = PfxTable()
+        table.reload(self.records_at(timestamp))
+        return table
+
+    def stats(self):
+        r"""
+        Return the size of the history.
+
+        :return: dict with the keys updates, deltas, checkpoints, \
+            records and bytes, the memory of the deltas, their indexes \
+            and the checkpoints
+        :rtype: dict
+        """
+        with self._lock:
+            checkpoint_bytes = sum(len(c.records) for c in self._checkpoints)
+            index_bytes = sum(len(c.index) * c.index.itemsize
+                              for c in self._checkpoints if c.index is not None)
+            return {
+                'updates': self.updates,
+                'deltas': len(self._times),
+                'checkpoints': len(self._checkpoints),
+                'records': len(self._counts),
+                'bytes': (len(self._deltas) + len(self._times) * self._times.itemsize +
+                          index_bytes + checkpoint_bytes),
+            }
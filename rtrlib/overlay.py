@@ -0,0 +1,306 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.overlay
+--------------
+
+Hypothetical record changes on top of a table, for what-if impact analysis
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import bisect
+import socket
+import struct
+
+from _rtrlib import ffi, lib
+
+from .batch import prepare_routes, validate_routes
+from .exceptions import IpConversionException, PFXException
+from .rtr_manager import PfxvState, ValidationResult
+from .util import ip_str_to_addr, is_integer
+
+_IPV4 = struct.Struct('!I')
+_IPV6 = struct.Struct('!QQ')
+
+
+def _address(prefix):
+    """Return the bits and the integer value of an ip address."""
+    try:
+        if ':' in prefix:
+            high, low = _IPV6.unpack(socket.inet_pton(socket.AF_INET6, prefix))
+            return 128, high << 64 | low
+        return 32, _IPV4.unpack(socket.inet_pton(socket.AF_INET, prefix))[0]
+    except (socket.error, OSError, TypeError):
+        raise IpConversionException("%s could not be converted" % prefix)
+
+
+def _record_key(record):
+    """Return the overlay key of a struct pfx_record."""
+    prefix = record.prefix
+    if prefix.ver == lib.LRTR_IPV4:
+        bits, address = 32, prefix.u.addr4.addr
+    else:
+        bits, address = 128, 0
+        for word in prefix.u.addr6.addr:
+            address = (address << 32) | word
+    shift = bits - record.min_len
+    return record.asn, bits, address >> shift << shift, record.min_len, record.max_len
+
+
+def route_state(asn, mask_len, records):
+    """
+    Return the RFC 6811 state of a route from its covering records.
+
+    Like rtrlib, records of AS 0 (RFC 7607) never match a route, not even \
+    a route of origin 0.
+
+    :param int asn: origin AS of the route
+    :param int mask_len: length of the prefix of the route
+    :param records: (asn, max_len) tuples of the covering records
+    :rtype: PfxvState
+    """
+    if not records:
+        return PfxvState.not_found
+    for record_asn, max_len in records:
+        if record_asn != 0 and record_asn == asn and mask_len <= max_len:
+            return PfxvState.valid
+    return PfxvState.invalid
+
+
+class RouteIndex(object):
+    r"""
+    Routes sorted by address, to find the routes a record covers.
+
+    Building the index converts every prefix once, an index of the \
+    global table is reused for any number of :py:meth:`WhatIfOverlay.impact` \
+    calls.
+
+    :param routes: (asn, prefix, mask_len) tuples
+    :type routes: sequence of tuples
+
+    :raises IpConversionException: if a prefix is not an ip address
+    """
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        families = {32: [], 128: []}
+        for i, (_, prefix, mask_len) in enumerate(self.routes):
+            bits, address = _address(prefix)
+            families[bits].append((address, mask_len, i))
+
+        self._families = {}
+        for bits, entries in families.items():
+            entries.sort()
+            self._families[bits] = ([address for address, _, _ in entries], entries)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def covered(self, bits, network, length):
+        """
+        Return the indexes of the routes within network/length.
+
+        :param int bits: 32 for IPv4, 128 for IPv6
+        :param int network: first address of the network as integer
+        :param int length: prefix length of the network
+        :rtype: list of int
+        """
+        addresses, entries = self._families[bits]
+        first = bisect.bisect_left(addresses, network)
+        last = bisect.bisect_left(addresses, network + (1 << (bits - length)), first)
+        return [i for _, mask_len, i in entries[first:last] if mask_len >= length]
+
+
+def _covered(routes, keys):
+    indexes = set()
+    for _, bits, network, min_len, _ in keys:
+        indexes.update(routes.covered(bits, network, min_len))
+    return indexes
+
+
+class StateChange(object):
+    r"""
+    A route whose state differs with the changes of an overlay.
+
+    :ivar int asn: origin AS of the route
+    :ivar str prefix: prefix of the route
+    :ivar int mask_len: length of the prefix
+    :ivar PfxvState before: state against the base table
+    :ivar PfxvState after: state with the changes of the overlay
+    """
+
+    __slots__ = ('asn', 'prefix', 'mask_len', 'before', 'after')
+
+    def __init__(self, asn, prefix, mask_len, before, after):
+        self.asn = asn
+        self.prefix = prefix
+        self.mask_len = mask_len
+        self.before = before
+        self.after = after
+
+    def __repr__(self):
+        return "StateChange({} {}/{}: {} -> {})".format(self.asn, self.prefix,
+                                                       self.mask_len, self.before.name,
+                                                       self.after.name)
+
+
+class WhatIfOverlay(object):
+    r"""
+    Hypothetical adds and removes on top of a table.
+
+    The base table is not copied or modified. Only routes covered by a \
+    changed record can change their state, :py:meth:`impact` finds \
+    them with a :class:`RouteIndex`, validates them against the base \
+    table in one batch and computes their new state from the covering \
+    records of the base and the changes.
+
+    Changes to the base table, e.g. by an :class:`.RTRManager`, are seen \
+    by later calls.
+
+    :param source: :class:`.PfxTable`, :class:`.RTRManager` or any \
+        object with a pfx_table attribute
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._added = {}
+        self._removed = {}
+
+    @staticmethod
+    def _key(asn, ip, min_length, max_length):
+        if not is_integer(asn):
+            raise TypeError("asn must be integer not %s" % type(asn))
+        bits, address = _address(ip)
+        if not 0 <= min_length <= max_length <= bits:
+            raise ValueError("invalid prefix lengths %s-%s" % (min_length, max_length))
+        network = address >> (bits - min_length) << (bits - min_length)
+        return asn, bits, network, min_length, max_length
+
+    def add_record(self, asn, ip, min_length, max_length):
+        """
+        Add a hypothetical record, a hypothetical removal is undone.
+
+        :param int asn: autonomous system number
+        :param str ip: ip address
+        :param int min_length: minimum length of the subnet mask
+        :param int max_length: maximum length of the subnet mask
+        """
+        key = self._key(asn, ip, min_length, max_length)
+        if self._removed.pop(key, None) is None:
+            self._added[key] = (asn, ip, min_length, max_length)
+
+    def remove_record(self, asn, ip, min_length, max_length):
+        """
+        Remove a record hypothetically, a hypothetical add is undone.
+
+        :param int asn: autonomous system number
+        :param str ip: ip address
+        :param int min_length: minimum length of the subnet mask
+        :param int max_length: maximum length of the subnet mask
+        """
+        key = self._key(asn, ip, min_length, max_length)
+        if self._added.pop(key, None) is None:
+            self._removed[key] = (asn, ip, min_length, max_length)
+
+    def clear(self):
+        """Drop all changes."""
+        self._added.clear()
+        self._removed.clear()
+
+    @property
+    def added(self):
+        """Hypothetically added (asn, prefix, min_len, max_len) tuples."""
+        return list(self._added.values())
+
+    @property
+    def removed(self):
+        """Hypothetically removed (asn, prefix, min_len, max_len) tuples."""
+        return list(self._removed.values())
+
+    def _covering(self, prefix, mask_len):
+        # (asn, max_len) of the covering records with the changes applied
+        records = ffi.new('struct pfx_record **')
+        records[0] = ffi.NULL
+        records_len = ffi.new('unsigned int *')
+        addr = ip_str_to_addr(prefix)
+        if lib.pfx_table_covering(self._source.pfx_table, addr, mask_len,
+                                  records, records_len) == lib.PFX_ERROR:
+            raise PFXException("An error occurred during the prefix query")
+
+        covering = []
+        try:
+            for i in range(records_len[0]):
+                record = records[0][i]
+                if not self._removed or _record_key(record) not in self._removed:
+                    covering.append((record.asn, record.max_len))
+        finally:
+            lib.free(records[0])
+
+        return covering + self._added_covering(prefix, mask_len)
+
+    def _added_covering(self, prefix, mask_len):
+        bits, address = _address(prefix)
+        return [(asn, max_len)
+                for asn, record_bits, network, min_len, max_len in self._added
+                if (record_bits == bits and min_len <= mask_len and
+                    address >> (bits - min_len) == network >> (bits - min_len))]
+
+    def validate(self, asn, prefix, mask_len):
+        """
+        Validate a route with the changes applied.
+        The reason list in the returned result will be empty.
+
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: ValidationResult
+        """
+        return ValidationResult(prefix, mask_len, asn,
+                                route_state(asn, mask_len, self._covering(prefix, mask_len)))
+
+    def affected(self, routes):
+        """
+        Return the indexes of the routes covered by a changed record.
+
+        :param RouteIndex routes: the routes
+        :rtype: list of int
+        """
+        return sorted(_covered(routes, self._added) | _covered(routes, self._removed))
+
+    def impact(self, routes):
+        r"""
+        Return the routes whose state changes with the changes.
+
+        :param routes: the routes, (asn, prefix, mask_len) tuples are \
+            indexed on every call
+        :type routes: RouteIndex or sequence of tuples
+        :rtype: list of :class:`StateChange`, in the order of the routes
+        """
+        if not isinstance(routes, RouteIndex):
+            routes = RouteIndex(routes)
+        indexes = self.affected(routes)
+        if not indexes:
+            return []
+        candidates = [routes.routes[i] for i in indexes]
+
+        before = validate_routes(self._source.pfx_table, prepare_routes(candidates),
+                                 flags=False)
+        removed = _covered(routes, self._removed)
+        covering = {}
+        changes = []
+        for i, code in zip(indexes, before):
+            asn, prefix, mask_len = routes.routes[i]
+            if i in removed:
+                if (prefix, mask_len) not in covering:
+                    covering[(prefix, mask_len)] = self._covering(prefix, mask_len)
+                after = route_state(asn, mask_len, covering[(prefix, mask_len)])
+            elif code == PfxvState.valid.value:
+                continue
+            else:
+                # added records can only make a route found or valid
+                after = route_state(asn, mask_len, self._added_covering(prefix, mask_len))
+                if after is not PfxvState.valid and code == PfxvState.invalid.value:
+                    continue
+            if after.value != code:
+                changes.append(StateChange(asn, prefix, mask_len, PfxvState(code), after))
+        return changes
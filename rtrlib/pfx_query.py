@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.pfx_query
+----------------
+
+Prefix queries that walk the trie of a pfx_table directly
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from _rtrlib import ffi, lib
+
+from .exceptions import PFXException
+from .records import PFXRecord, copy_pfx_record
+from .util import ip_str_to_addr, is_integer
+
+
+def covering_records(pfx_table, prefix, mask_len):
+    """
+    Return all records of pfx_table whose prefix covers prefix/mask_len.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param str prefix: ip address
+    :param int mask_len: length of the subnet mask
+    :rtype: list of :class:`.PFXRecord`
+    """
+    return _query(lib.pfx_table_covering, pfx_table, prefix, mask_len)
+
+
+def more_specific_records(pfx_table, prefix, mask_len):
+    """
+    Return all records of pfx_table whose prefix is equal to or more \
+    specific than prefix/mask_len.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param str prefix: ip address
+    :param int mask_len: length of the subnet mask
+    :rtype: list of :class:`.PFXRecord`
+    """
+    return _query(lib.pfx_table_more_specifics, pfx_table, prefix, mask_len)
+
+
+def _query(function, pfx_table, prefix, mask_len):
+    if not is_integer(mask_len):
+        raise TypeError("mask_len must be integer not %s" % type(mask_len))
+
+    records = ffi.new('struct pfx_record **')
+    records[0] = ffi.NULL
+    records_len = ffi.new('unsigned int *')
+
+    ret = function(pfx_table,
+                   ip_str_to_addr(prefix),
+                   mask_len,
+                   records,
+                   records_len)
+
+    if ret == lib.PFX_ERROR:
+        raise PFXException("An error occurred during the prefix query")
+
+    try:
+        return [copy_pfx_record(PFXRecord(records[0] + i))
+                for i in range(records_len[0])]
+    finally:
+        lib.free(records[0])
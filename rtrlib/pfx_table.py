@@ -7,32 +7,76 @@ rtrlib.rtr_manager
 
 from __future__ import absolute_import, unicode_literals
 
-
-from .exceptions import PFXException
-from .rtr_manager import ValidationResult
+import threading
+
+from . import profiling
+from .asn_index import AsnIndex
+from .batch import STATE_MASK, validate_origins, validate_routes
+from .exceptions import (PFXException, NotEnabledError, IpConversionException,
+                         RoaFileError)
+from .pfx_query import covering_records, more_specific_records
+from .prefilter import CoverageFilter
+from .records import PFXRecord
+from .roa_file import read_roa_file, write_roa_file
+from .snapshot import PfxTableSnapshot
+from .rtr_manager import PfxvState, ValidationResult, Validator
 from .util import ip_str_to_addr
 
 from _rtrlib import ffi, lib
 
 
+def _new_pfx_table():
+    # allocate pfx_table
+    pfx_table = ffi.new('struct pfx_table *')
+    # initialize it
+    lib.pfx_table_init(pfx_table,
+                       ffi.NULL)
+    # freed when the last reference is gone, a call that is still
+    # running on a replaced table keeps it alive
+    return ffi.gc(pfx_table, lib.pfx_table_free)
+
+
+def _coverage_filter(prefilter):
+    if prefilter is True:
+        return CoverageFilter()
+    return prefilter or None
+
+
 class PfxTable(object):
-    """
+    r"""
     Wrapper class around pfx_table.
 
+    Every method looks up the current table once, :py:meth:`reload` \
+    builds a new table next to it and replaces it with a single \
+    assignment. Calls that started before keep using the old table, \
+    it is freed when the last of them returned.
+
+    :param asn_index: maintain an index of the records of every ASN, \
+        see :py:meth:`records_for_asn`
+    :type asn_index: bool
+
+    :param prefilter: answer not found without calling rtrlib for routes \
+        no record can cover, True for a filter with the default blocks. \
+        A :class:`.Validator` only uses it if created with prefilter set.
+    :type prefilter: bool or :class:`.CoverageFilter`
+
+    :ivar prefilter: the :class:`.CoverageFilter` with the hit counters \
+        or None
     """
 
-    def __init__(self):
-        # allocate pfx_table
-        self.pfx_table = ffi.new('struct pfx_table *')
-        # initialize it
-        lib.pfx_table_init(self.pfx_table,
-                           ffi.NULL)
+    def __init__(self, asn_index=False, prefilter=False):
+        self.pfx_table = _new_pfx_table()
         self.closed = False
 
+        self._asn_index = AsnIndex() if asn_index else None
+        self.prefilter = _coverage_filter(prefilter)
+        self._reload_lock = threading.Lock()
+
     @staticmethod
     def _create_pfx_record(asn, ip, min_length, max_length):
         record = ffi.new('struct pfx_record *')
-        lib.lrtr_ip_str_to_addr(ip.encode('ascii'), ffi.addressof(record, 'prefix'))
+        if lib.lrtr_ip_str_to_addr(ip.encode('ascii'), ffi.addressof(record, 'prefix')) != 0:
+            raise IpConversionException("%s could not be converted" % ip)
 
         record.asn = asn
         record.min_len = min_length
@@ -60,7 +104,10 @@ class PfxTable(object):
 
         record = self._create_pfx_record(asn, ip, min_length, max_length)
 
-        lib.pfx_table_add(self.pfx_table, record)
+        ret = lib.pfx_table_add(self.pfx_table, record)
+
+        if ret == lib.PFX_SUCCESS:
+            self._update_indexes(self._asn_index, self.prefilter, record, True)
 
     def remove_record(self, asn, ip, min_length, max_length):
         """
@@ -81,7 +128,10 @@ class PfxTable(object):
 
         record = self._create_pfx_record(asn, ip, min_length, max_length)
 
-        lib.pfx_table_remove(self.pfx_table, record)
+        ret = lib.pfx_table_remove(self.pfx_table, record)
+
+        if ret == lib.PFX_SUCCESS:
+            self._update_indexes(self._asn_index, self.prefilter, record, False)
 
     def validate(self, asn, prefix, mask_len):
         """
@@ -100,21 +150,38 @@ class PfxTable(object):
         :rtype: ValidationResult
         """
 
+        if self.prefilter is not None and self.prefilter.not_found(prefix, mask_len):
+            return ValidationResult(prefix, mask_len, asn, PfxvState.not_found.value)
+
+        timer = profiling.start('PfxTable.validate')
+
         result = ffi.new('enum pfxv_state *')
+        addr = ip_str_to_addr(prefix)
+
+        if timer:
+            timer.lap('parse')
 
         ret = lib.pfx_table_validate(self.pfx_table,
                                      asn,
-                                     ip_str_to_addr(prefix),
+                                     addr,
                                      mask_len,
                                      result)
 
+        if timer:
+            timer.lap('c_call')
+
         if ret == lib.PFX_ERROR:
             raise PFXException("An error occurred during validation")
 
-        return ValidationResult(prefix,
-                                mask_len,
-                                asn,
-                                result[0])
+        validation_result = ValidationResult(prefix,
+                                             mask_len,
+                                             asn,
+                                             result[0])
+
+        if timer:
+            timer.stop('result')
+
+        return validation_result
 
     def validate_r(self, asn, prefix, mask_len):
         """
@@ -133,34 +200,304 @@ class PfxTable(object):
         :rtype: ValidationResult
         """
 
+        if self.prefilter is not None and self.prefilter.not_found(prefix, mask_len):
+            return ValidationResult(prefix, mask_len, asn, PfxvState.not_found.value)
+
+        timer = profiling.start('PfxTable.validate_r')
+
         result = ffi.new('enum pfxv_state *')
 
         reason = ffi.new('struct pfx_record **')
         reason[0] = ffi.NULL
         reason_length = ffi.new('unsigned int *')
         reason_length[0] = 0
+        addr = ip_str_to_addr(prefix)
+
+        if timer:
+            timer.lap('parse')
 
         ret = lib.pfx_table_validate_r(self.pfx_table,
                                        reason,
                                        reason_length,
                                        asn,
-                                       ip_str_to_addr(prefix),
+                                       addr,
                                        mask_len,
                                        result)
 
+        if timer:
+            timer.lap('c_call')
+
         if ret == lib.PFX_ERROR:
             raise PFXException("An error occurred during validation")
 
-        return ValidationResult(prefix,
-                                mask_len,
-                                asn,
-                                result[0],
-                                reason,
-                                reason_length[0])
+        validation_result = ValidationResult(prefix,
+                                             mask_len,
+                                             asn,
+                                             result[0],
+                                             reason,
+                                             reason_length[0])
+
+        if timer:
+            timer.stop('result')
+
+        return validation_result
+
+    def validator(self, prefilter=False):
+        """
+        Return a validation handle with reusable buffers for one thread.
+
+        :param bool prefilter: use the prefilter of the table
+        :rtype: :class:`.Validator`
+        """
+        return Validator(self, prefilter)
+
+    def validate_origins(self, prefix, mask_len, asns):
+        """
+        Validate a prefix announced by several origins.
+        The reason lists in the returned results will be empty.
+
+        The covering records are looked up once for all asns, see \
+        :func:`rtrlib.batch.validate_origins`.
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :param asns: origin asns
+        :type asns: sequence of int
+        :return: one result per asn, in the order of asns
+        :rtype: list of ValidationResult
+        """
+        if self.prefilter is not None and self.prefilter.not_found(prefix, mask_len):
+            codes = bytearray([PfxvState.not_found.value]) * len(asns)
+        else:
+            codes = validate_origins(self.pfx_table, prefix, mask_len, asns, flags=False)
+        return [ValidationResult(prefix, mask_len, asn, code & STATE_MASK)
+                for asn, code in zip(asns, codes)]
+
+    def validate_codes(self, routes, out=None, flags=True, group=False):
+        """
+        Validate many routes and return compact result codes.
+
+        See :func:`rtrlib.batch.validate_routes` for the codes and buffers.
+
+        :param routes: (asn, prefix, mask_len) tuples or \
+            :class:`.PreparedRoutes`
+        :param out: writable buffer the codes are written to
+        :param bool flags: if False only the pfxv_state values are returned
+        :param bool group: look up every distinct prefix once
+
+        :rtype: bytearray or out
+        """
+        return validate_routes(self.pfx_table, routes, out, flags, group)
+
+    def export(self, fp, format='json', compression=None, trust_anchor='rtr'):
+        r"""
+        Write the records as a JSON or CSV ROA export.
+
+        See :func:`rtrlib.roa_file.write_roa_file`.
+
+        :param fp: path or file object opened for writing bytes
+        :param str format: json or csv
+        :param str compression: None, gzip or zstd
+        :param str trust_anchor: value of the ta field of every record
+        :return: number of written records
+        :rtype: int
+        """
+        return write_roa_file(self.pfx_table, fp, format, compression, trust_anchor)
+
+    def covering(self, prefix, mask_len):
+        """
+        Return all records whose prefix covers the given prefix.
+
+        Only the path of the prefix through the trie is walked, \
+        the cost is proportional to the result and not to the table size.
+
+        :param prefix: ip address
+        :type prefix: str
+
+        :param mask_len: length of the subnet mask
+        :type mask_len: int
+
+        :rtype: list of :class:`.PFXRecord`
+        """
+        return covering_records(self.pfx_table, prefix, mask_len)
+
+    def more_specifics(self, prefix, mask_len):
+        """
+        Return all records whose prefix is equal to or more specific \
+        than the given prefix.
+
+        :param prefix: ip address
+        :type prefix: str
+
+        :param mask_len: length of the subnet mask
+        :type mask_len: int
+
+        :rtype: list of :class:`.PFXRecord`
+        """
+        return more_specific_records(self.pfx_table, prefix, mask_len)
+
+    def snapshot(self, ipv4=True, ipv6=True):
+        """
+        Return a consistent point-in-time copy of the table.
+
+        :param bool ipv4: include the ipv4 records
+        :param bool ipv6: include the ipv6 records
+
+        :rtype: :class:`.PfxTableSnapshot`
+        """
+        return PfxTableSnapshot(self.pfx_table, ipv4, ipv6)
+
+    def records_for_asn(self, asn):
+        """
+        Return all records for an ASN.
+
+        :param asn: autonomous system number
+        :type asn: int
+
+        :rtype: list of :class:`.PFXRecord`
+
+        :raises NotEnabledError: if the table was created without asn_index
+        """
+        return self._get_asn_index().records_for_asn(asn)
+
+    def records_for_asns(self, asns):
+        """
+        Return the records for several ASNs at once.
+
+        :param asns: autonomous system numbers
+        :type asns: iterable of int
+
+        :rtype: dict mapping every asn to a list of :class:`.PFXRecord`
+
+        :raises NotEnabledError: if the table was created without asn_index
+        """
+        return self._get_asn_index().records_for_asns(asns)
+
+    def copy(self):
+        """
+        Return a copy of the table.
+
+        The trie is copied in C without adding the records one by one.
+
+        :rtype: PfxTable
+
+        :raises PFXException:
+        """
+        copy = PfxTable()
+        copy._replace(self._clone(), self._copy_asn_index(), self._copy_prefilter())
+        return copy
+
+    def reload(self, records):
+        r"""
+        Replace all records of the table.
+
+        The new table is built while readers keep using the current one, \
+        they never see a partially filled table. Records added or removed \
+        with :py:meth:`add_record` or :py:meth:`remove_record` during a \
+        reload are lost.
+
+        :param records: (asn, prefix, min_len, max_len) tuples
+        :type records: iterable
+
+        :raises IpConversionException: the table is not replaced
+        """
+        with self._reload_lock:
+            pfx_table = _new_pfx_table()
+            asn_index = AsnIndex() if self._asn_index is not None else None
+            prefilter = self._copy_prefilter(records=False)
+
+            for asn, prefix, min_len, max_len in records:
+                record = self._create_pfx_record(asn, prefix, min_len, max_len)
+                ret = lib.pfx_table_add(pfx_table, record)
+                if ret == lib.PFX_SUCCESS:
+                    self._update_indexes(asn_index, prefilter, record, True)
+
+            self._replace(pfx_table, asn_index, prefilter)
+
+    def reload_changes(self, added=(), removed=()):
+        r"""
+        Apply a set of changes to a copy of the table and replace the \
+        table with it.
+
+        Readers see either none or all of the changes.
+
+        :param added: (asn, prefix, min_len, max_len) tuples
+        :type added: iterable
+        :param removed: (asn, prefix, min_len, max_len) tuples
+        :type removed: iterable
+
+        :raises PFXException:
+        """
+        with self._reload_lock:
+            pfx_table = self._clone()
+            asn_index = self._copy_asn_index()
+            prefilter = self._copy_prefilter()
+
+            for records, function, is_added in ((removed, lib.pfx_table_remove, False),
+                                                (added, lib.pfx_table_add, True)):
+                for asn, prefix, min_len, max_len in records:
+                    record = self._create_pfx_record(asn, prefix, min_len, max_len)
+                    ret = function(pfx_table, record)
+                    if ret == lib.PFX_SUCCESS:
+                        self._update_indexes(asn_index, prefilter, record, is_added)
+
+            self._replace(pfx_table, asn_index, prefilter)
+
+    def load_roa_file(self, path):
+        """
+        Replace all records of the table with the ROAs of a file.
+
+        See :func:`rtrlib.roa_file.read_roa_file` for the supported formats.
+
+        :param str path: path of a JSON or CSV ROA export
+
+        :raises RoaFileError: the table is not replaced
+        """
+        try:
+            self.reload(read_roa_file(path))
+        except IpConversionException as err:
+            raise RoaFileError("{}: {}".format(path, err))
+
+    def _clone(self):
+        pfx_table = _new_pfx_table()
+        if lib.pfx_table_clone(self.pfx_table, pfx_table) == lib.PFX_ERROR:
+            raise PFXException("An error occurred while copying the table")
+        return pfx_table
+
+    def _copy_asn_index(self):
+        if self._asn_index is None:
+            return None
+        return self._asn_index.copy()
+
+    def _copy_prefilter(self, records=True):
+        if self.prefilter is None:
+            return None
+        return self.prefilter.copy(records)
+
+    @staticmethod
+    def _update_indexes(asn_index, prefilter, record, added):
+        if asn_index is not None:
+            asn_index.update(PFXRecord(record), added)
+        if prefilter is not None:
+            prefilter.update(PFXRecord(record), added)
+
+    def _replace(self, pfx_table, asn_index, prefilter):
+        # the filter first, readers of the new table must not skip its records
+        self.prefilter = prefilter
+        self.pfx_table = pfx_table
+        self._asn_index = asn_index
+
+    def _get_asn_index(self):
+        if self._asn_index is None:
+            raise NotEnabledError("PfxTable was created without asn_index")
+        return self._asn_index
 
     def close(self):
+        """
+        Free the table once no call is using it anymore.
+        """
         if not self.closed:
-            lib.pfx_table_free(self.pfx_table)
+            self.pfx_table = None
             self.closed = True
 
     def __enter__(self):
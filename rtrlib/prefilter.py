@@ -0,0 +1,283 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.prefilter
+----------------
+
+Answer not found for routes no record can cover without calling rtrlib
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import socket
+import struct
+import threading
+
+from _rtrlib import lib
+
+_IPV4 = struct.Struct('!I')
+_IPV6 = struct.Struct('!Q8x')
+
+IPV4_BLOCK = 24
+"""Prefix length of the IPv4 blocks of the bitmap"""
+
+
+class _Family(object):
+    r"""
+    Covered blocks of one address family.
+
+    Records at least as long as a block are counted per block, shorter \
+    records per (length, network). With a bitmap every covered block has \
+    its bit set, without a bitmap a lookup probes the blocks and every \
+    length of the shorter records.
+    """
+
+    def __init__(self, bits, block_bits, bitmap):
+        self._bits = bits
+        self._block_bits = block_bits
+        self._blocks = {}
+        self._short = {}
+        self.bitmap = bytearray(1 << (block_bits - 3)) if bitmap else None
+
+    def copy(self):
+        copy = _Family(self._bits, self._block_bits, False)
+        copy._blocks = dict(self._blocks)
+        copy._short = dict((length, dict(networks))
+                           for length, networks in self._short.items())
+        if self.bitmap is not None:
+            copy.bitmap = bytearray(self.bitmap)
+        return copy
+
+    def covered(self, address):
+        """Return True if a record may cover the address."""
+        block = address >> (self._bits - self._block_bits)
+        if self.bitmap is not None:
+            return bool(self.bitmap[block >> 3] & (1 << (block & 7)))
+
+        if block in self._blocks:
+            return True
+        for length, networks in self._short.items():
+            if block >> (self._block_bits - length) in networks:
+                return True
+        return False
+
+    def add(self, address, length):
+        length = min(length, self._bits)
+        if length >= self._block_bits:
+            block = address >> (self._bits - self._block_bits)
+            self._blocks[block] = self._blocks.get(block, 0) + 1
+            if self.bitmap is not None:
+                self._set(block, 1, True)
+            return
+
+        networks = self._short.setdefault(length, {})
+        network = address >> (self._bits - length)
+        networks[network] = networks.get(network, 0) + 1
+        if self.bitmap is not None and networks[network] == 1:
+            size = 1 << (self._block_bits - length)
+            self._set(network * size, size, True)
+
+    def remove(self, address, length):
+        length = min(length, self._bits)
+        if length >= self._block_bits:
+            counts = self._blocks
+            key = address >> (self._bits - self._block_bits)
+            first, size = key, 1
+        else:
+            counts = self._short.get(length, {})
+            key = address >> (self._bits - length)
+            size = 1 << (self._block_bits - length)
+            first = key * size
+
+        if key not in counts:
+            return
+        if counts[key] > 1:
+            counts[key] -= 1
+            return
+        del counts[key]
+        if not counts and counts is not self._blocks:
+            del self._short[length]
+        if self.bitmap is not None:
+            self._refresh(first, size)
+
+    def _refresh(self, first, size):
+        # set the bits of the range again from the remaining records
+        for length, networks in self._short.items():
+            length_size = 1 << (self._block_bits - length)
+            if length_size >= size and first // length_size in networks:
+                return
+
+        self._set(first, size, False)
+        for length, networks in self._short.items():
+            length_size = 1 << (self._block_bits - length)
+            if length_size < size:
+                for network in _within(networks, first // length_size,
+                                       size // length_size):
+                    self._set(network * length_size, length_size, True)
+        for block in _within(self._blocks, first, size):
+            self._set(block, 1, True)
+
+    def _set(self, first, size, value):
+        bitmap = self.bitmap
+        end = first + size
+        while first < end and first & 7:
+            _set_bit(bitmap, first, value)
+            first += 1
+        full = (end - first) >> 3
+        if full:
+            bitmap[first >> 3:(first >> 3) + full] = (b'\xff' if value else b'\x00') * full
+            first += full << 3
+        while first < end:
+            _set_bit(bitmap, first, value)
+            first += 1
+
+
+def _set_bit(bitmap, bit, value):
+    if value:
+        bitmap[bit >> 3] |= 1 << (bit & 7)
+    else:
+        bitmap[bit >> 3] &= ~(1 << (bit & 7)) & 0xFF
+
+
+def _within(keys, first, count):
+    """Keys in [first, first + count), probing or scanning what is fewer."""
+    if count < len(keys):
+        return [key for key in range(first, first + count) if key in keys]
+    return [key for key in keys if first <= key < first + count]
+
+
+class CoverageFilter(object):
+    r"""
+    Address blocks that contain or are covered by a record.
+
+    IPv4 is tracked in a bitmap of all /24 blocks, 2 MiB, IPv6 in a hash \
+    set of /32 or /48 blocks. A route whose block is not covered can not \
+    have a covering record, it is not found. The filter never answers not \
+    found for a route that rtrlib would find, a covered block only means \
+    the route has to be validated by rtrlib.
+
+    :class:`.PfxTable` and :class:`.RTRManager` maintain a filter for \
+    their prefilter argument and skip the C call for filtered routes. \
+    lookups and filtered count the checked and the filtered routes, they \
+    are not synchronized and may miss a few increments of concurrent \
+    validations.
+
+    :param int ipv6_block: prefix length of the IPv6 blocks, 32 or 48
+    """
+
+    def __init__(self, ipv6_block=32):
+        if ipv6_block not in (32, 48):
+            raise ValueError("ipv6_block must be 32 or 48 not %s" % ipv6_block)
+        self.ipv6_block = ipv6_block
+        self._ipv4 = _Family(32, IPV4_BLOCK, True)
+        self._ipv6 = _Family(64, ipv6_block, False)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.filtered = 0
+
+    def copy(self, records=True):
+        r"""
+        Return a filter with the same block size and counters.
+
+        :param bool records: copy the covered blocks, an empty filter \
+            if False
+        :rtype: CoverageFilter
+        """
+        copy = CoverageFilter(self.ipv6_block)
+        if records:
+            with self._lock:
+                copy._ipv4 = self._ipv4.copy()
+                copy._ipv6 = self._ipv6.copy()
+        copy.lookups = self.lookups
+        copy.filtered = self.filtered
+        return copy
+
+    def update(self, record, added):
+        """
+        Apply a pfx update.
+
+        Has the signature of a pfx update listener.
+
+        :param PFXRecord record: the affected record
+        :param bool added: True if the record was added
+        """
+        cdata = record._record
+        prefix = cdata.prefix
+        if prefix.ver == lib.LRTR_IPV4:
+            family = self._ipv4
+            address = prefix.u.addr4.addr
+        else:
+            family = self._ipv6
+            words = prefix.u.addr6.addr
+            address = (words[0] << 32) | words[1]
+
+        with self._lock:
+            if added:
+                family.add(address, cdata.min_len)
+            else:
+                family.remove(address, cdata.min_len)
+
+    def may_cover(self, prefix):
+        """
+        Return False if no record can cover a route of prefix.
+
+        :param str prefix: ip address
+        :rtype: bool
+
+        :raises ValueError: if prefix is not an ip address
+        """
+        try:
+            if ':' in prefix:
+                return self._ipv6.covered(
+                    _IPV6.unpack(socket.inet_pton(socket.AF_INET6, prefix))[0])
+            return self._ipv4.covered(
+                _IPV4.unpack(socket.inet_pton(socket.AF_INET, prefix))[0])
+        except (socket.error, OSError):
+            raise ValueError("%s is not an ip address" % prefix)
+
+    def not_found(self, prefix, mask_len):
+        r"""
+        Return True if a route is certainly not found and count the lookup.
+
+        Invalid prefixes and mask lengths return False, rtrlib reports \
+        the error.
+
+        :param prefix: ip address
+        :type prefix: str or bytes
+        :param int mask_len: length of the subnet mask
+        :rtype: bool
+        """
+        self.lookups += 1
+        if isinstance(prefix, bytes):
+            prefix = prefix.decode('ascii', 'replace')
+        try:
+            if ':' in prefix:
+                if mask_len > 128:
+                    return False
+                covered = self._ipv6.covered(
+                    _IPV6.unpack(socket.inet_pton(socket.AF_INET6, prefix))[0])
+            else:
+                if mask_len > 32:
+                    return False
+                block = _IPV4.unpack(socket.inet_pton(socket.AF_INET, prefix))[0] >> 8
+                covered = self._ipv4.bitmap[block >> 3] & (1 << (block & 7))
+        except (socket.error, OSError):
+            return False
+        if covered:
+            return False
+        self.filtered += 1
+        return True
+
+    def stats(self):
+        r"""
+        Return the counters.
+
+        :return: dict with the keys lookups, filtered and hit_rate, the \
+            share of lookups answered without rtrlib
+        :rtype: dict
+        """
+        lookups, filtered = self.lookups, self.filtered
+        return {
+            'lookups': lookups,
+            'filtered': filtered,
+            'hit_rate': float(filtered) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,213 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.profiling
+----------------
+
+Opt-in timing of the python wrapper code around the C calls
+
+The instrumented functions split every sampled call into phases, e.g. \
+parse, c_call and result for the validation methods and wrap, listeners \
+and callback for the callback trampolines. Profiling is enabled with \
+:class:`Profiler` as a context manager or for the whole process by \
+setting the environment variable ``RTRLIB_PROFILE`` to the path the \
+report is written to at exit.
+
+Reports of two versions can be compared with \
+``tools/profile-compare.py old.json new.json``.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import atexit
+import json
+import os
+import platform
+import random
+import threading
+import time
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+ACTIVE = None
+"""The enabled :class:`Profiler`, None if profiling is disabled"""
+
+RESERVOIR_SIZE = 10000
+"""Number of samples kept per phase for the percentiles"""
+
+
+def start(name):
+    """
+    Start timing a call of name.
+
+    Called by the instrumented functions, returns None if profiling is \
+    disabled or the call is not sampled.
+
+    :rtype: _Timer or None
+    """
+    profiler = ACTIVE
+    if profiler is None:
+        return None
+    return profiler.start(name)
+
+
+class _Timer(object):
+
+    __slots__ = ('_profiler', '_name', '_last', '_phases')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._phases = []
+        self._last = _clock()
+
+    def lap(self, phase):
+        """End phase and start the next one."""
+        now = _clock()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+
+    def stop(self, phase):
+        """End the last phase and record the call."""
+        self.lap(phase)
+        self._profiler.record(self._name, self._phases)
+
+
+class _PhaseStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            i = random.randint(0, self.count - 1)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': percentile(0.5),
+            'p99': percentile(0.99),
+        }
+
+
+class Profiler(object):
+    r"""
+    Collects the phase timings of the instrumented functions.
+
+    Only one profiler is active at a time, entering a profiler replaces \
+    the active one until it is exited.
+
+    :param float sample_rate: share of the calls that are timed
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self._sample_rate = sample_rate
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def __enter__(self):
+        global ACTIVE  # pylint: disable=global-statement
+        self._previous = ACTIVE
+        ACTIVE = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global ACTIVE  # pylint: disable=global-statement
+        ACTIVE = self._previous
+        self._previous = None
+        return False
+
+    def start(self, name):
+        """Return a timer for a call of name, None if it is not sampled."""
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            return None
+        return _Timer(self, name)
+
+    def record(self, name, phases):
+        """
+        Add the phase durations of one call.
+
+        :param str name: name of the instrumented function
+        :param phases: (phase, seconds) tuples
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name, {})
+            for phase, seconds in phases:
+                phase_stats = stats.get(phase)
+                if phase_stats is None:
+                    phase_stats = stats[phase] = _PhaseStats()
+                phase_stats.add(seconds)
+
+    def report(self):
+        r"""
+        Return the timings with some information about the environment.
+
+        :return: dict with the keys python, implementation and functions, \
+            functions maps every function to its phases and every phase \
+            to count, total, mean, p50 and p99 in seconds
+        :rtype: dict
+        """
+        with self._lock:
+            functions = dict((name, dict((phase, phase_stats.summary())
+                                         for phase, phase_stats in stats.items()))
+                             for name, stats in self._stats.items())
+
+        return {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'functions': functions,
+        }
+
+    def dump(self, path):
+        """Write the report as JSON to path."""
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
+
+
+def compare_reports(old, new):
+    """
+    Compare the mean phase durations of two reports.
+
+    :param dict old: report as returned by :py:meth:`Profiler.report`
+    :param dict new: report as returned by :py:meth:`Profiler.report`
+    :return: (function, phase, old mean, new mean) tuples, a mean is None \
+        if the phase is missing in a report
+    :rtype: list
+    """
+    rows = []
+    old_functions = old['functions']
+    new_functions = new['functions']
+
+    for name in sorted(set(old_functions) | set(new_functions)):
+        old_phases = old_functions.get(name, {})
+        new_phases = new_functions.get(name, {})
+        for phase in sorted(set(old_phases) | set(new_phases)):
+            rows.append((name,
+                         phase,
+                         old_phases.get(phase, {}).get('mean'),
+                         new_phases.get(phase, {}).get('mean')))
+    return rows
+
+
+if os.environ.get('RTRLIB_PROFILE'):
+    ACTIVE = Profiler()
+    atexit.register(ACTIVE.dump, os.environ['RTRLIB_PROFILE'])
@@ -10,19 +10,26 @@ from __future__ import absolute_import, unicode_literals
 
 from _rtrlib import ffi
 
-from .util import ip_addr_to_str
+from .util import ip_addr_to_str, ip_str_to_addr
 from .rtr_socket import RTRSocket
 
 
 class PFXRecord(object):
-    """Wrapper around the pfx_record struct."""
+    """
+    Wrapper around the pfx_record struct.
 
-    def __init__(self, record):
+    :param cdata record: struct pfx_record * or struct pfx_record
+    :param object owner: object owning the memory of record, \
+        kept alive as long as the PFXRecord exists
+    """
+
+    def __init__(self, record, owner=None):
         if (not ffi.typeof(record) is ffi.typeof("struct pfx_record *") and
                 not ffi.typeof(record) is ffi.typeof("struct pfx_record")):
             raise TypeError("Type of record must be struct pfx_record *")
 
         self._record = record
+        self._owner = owner
 
     @property
     def asn(self):
@@ -57,6 +64,27 @@ class PFXRecord(object):
                                                    )
 
 
+def create_pfx_record(asn, prefix, min_len, max_len, socket=ffi.NULL):
+    """
+    Create a pfx_record struct.
+
+    :param int asn: autonomous system number
+    :param str prefix: ip address
+    :param int min_len: minimum length of the subnet mask
+    :param int max_len: maximum length of the subnet mask
+    :param cdata socket: rtr_socket the record belongs to
+    :rtype: cdata struct pfx_record *
+    """
+    record = ffi.new('struct pfx_record *')
+    record.prefix = ip_str_to_addr(prefix)[0]
+    record.asn = asn
+    record.min_len = min_len
+    record.max_len = max_len
+    record.socket = socket
+
+    return record
+
+
 def copy_pfx_record(record):
     """
     Copy a pfx record.
@@ -82,7 +110,8 @@ class SPKIRecord(object):
     """Wrapper around the spki_record struct."""
 
     def __init__(self, record):
-        if not ffi.typeof(record) is ffi.typeof("struct spki_record *"):
+        if (not ffi.typeof(record) is ffi.typeof("struct spki_record *") and
+                not ffi.typeof(record) is ffi.typeof("struct spki_record")):
             raise TypeError("Type of record must be struct spki_record *")
 
         self._record = record
@@ -106,3 +135,20 @@ class SPKIRecord(object):
     def spki(self):
         """Subject public key info."""
         return self._record.spki
+
+
+def copy_spki_record(record):
+    """
+    Copy a spki record.
+
+    :param SPKIRecord record: The record that should be copied
+    :rtype: SPKIRecord
+    """
+    if not isinstance(record, SPKIRecord):
+        raise TypeError("Type of record must be struct spki_record *")
+
+    cdata = record._record
+    if ffi.typeof(cdata) is ffi.typeof("struct spki_record *"):
+        cdata = cdata[0]
+
+    return SPKIRecord(ffi.new('struct spki_record *', cdata))
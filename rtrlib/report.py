@@ -0,0 +1,215 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.report
+-------------
+
+Constant memory aggregation of validation results
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import itertools
+
+from .batch import AS_INVALID, LENGTH_INVALID, STATE_MASK, validate_routes
+from .rtr_manager import PfxvState
+
+
+class SpaceSaving(object):
+    r"""
+    Approximate top-k counter with the Space-Saving algorithm.
+
+    At most k keys are counted. A new key replaces the key with the lowest \
+    count and inherits that count as its error, the count of every key is \
+    an upper bound of its true count and exceeds it by at most the error.
+
+    :param int k: number of counted keys
+    """
+
+    def __init__(self, k):
+        self._k = k
+        self._counters = {}
+
+    def __len__(self):
+        return len(self._counters)
+
+    def add(self, key, count=1):
+        """Add count occurrences of key."""
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += count
+        elif len(self._counters) < self._k:
+            self._counters[key] = [count, 0]
+        else:
+            min_key = min(self._counters, key=lambda k: self._counters[k][0])
+            min_count = self._counters.pop(min_key)[0]
+            self._counters[key] = [min_count + count, min_count]
+
+    def _floor(self):
+        if len(self._counters) < self._k:
+            return 0
+        return min(counter[0] for counter in self._counters.values())
+
+    def merge(self, other):
+        r"""
+        Add the counts of other, keys missing on one side are assumed \
+        to have the lowest count of that side.
+
+        :param SpaceSaving other: counter with the same k
+        """
+        floor = self._floor()
+        other_floor = other._floor()
+        counters = {}
+
+        for key in set(self._counters) | set(other._counters):
+            count, error = self._counters.get(key, (floor, floor))
+            other_count, other_error = other._counters.get(key, (other_floor, other_floor))
+            counters[key] = [count + other_count, error + other_error]
+
+        top = sorted(counters.items(), key=lambda item: -item[1][0])[:self._k]
+        self._counters = dict(top)
+
+    def get(self, key):
+        """Return the count of key, None if it is not counted."""
+        counter = self._counters.get(key)
+        return counter[0] if counter is not None else None
+
+    def top(self, n=None):
+        """
+        Return the keys with the highest counts.
+
+        :param int n: number of keys, all counted keys if None
+        :rtype: list of (key, count, error) tuples
+        """
+        top = sorted(self._counters.items(), key=lambda item: -item[1][0])
+        return [(key, count, error) for key, (count, error) in top[:n]]
+
+
+class ValidationReport(object):
+    r"""
+    Streaming aggregation of the validation results of routes.
+
+    Routes are validated in batches by the extension, only fixed size \
+    counters are kept: the states per address family, the states per \
+    prefix length, the causes of invalid routes and the origin ASes with \
+    the most routes and the most invalid routes. Reports of parallel \
+    workers can be combined with :py:meth:`merge`, they can be pickled.
+
+    :param int top_k: number of origin ASes that are counted
+    """
+
+    def __init__(self, top_k=100):
+        self.routes = 0
+        self.states = {4: [0] * 3, 6: [0] * 3}
+        self.lengths = {4: [[0] * 3 for _ in range(33)],
+                        6: [[0] * 3 for _ in range(129)]}
+        self.as_invalid = 0
+        self.length_invalid = 0
+        self.as_and_length_invalid = 0
+        self.origins = SpaceSaving(top_k)
+        self.invalid_origins = SpaceSaving(top_k)
+
+    def update(self, pfx_table, routes, batch_size=5000):
+        """
+        Validate routes against pfx_table and add them to the report.
+
+        :param cdata pfx_table: struct pfx_table *
+        :param routes: (asn, prefix, mask_len) tuples
+        :type routes: iterable
+        :param int batch_size: number of routes validated at once
+        """
+        routes = iter(routes)
+        codes = bytearray(batch_size)
+        while True:
+            batch = list(itertools.islice(routes, batch_size))
+            if not batch:
+                break
+            self.add_results(batch, validate_routes(pfx_table, batch, out=codes))
+
+    def add_results(self, routes, codes):
+        """
+        Add routes that were already validated.
+
+        :param routes: (asn, prefix, mask_len) tuples
+        :param codes: result codes as returned by \
+            :func:`rtrlib.batch.validate_routes`
+        """
+        invalid = PfxvState.invalid.value
+
+        for (asn, prefix, mask_len), code in zip(routes, codes):
+            state = code & STATE_MASK
+            afi = 6 if ':' in prefix else 4
+
+            self.states[afi][state] += 1
+            self.lengths[afi][mask_len][state] += 1
+            self.origins.add(asn)
+
+            if state == invalid:
+                self.invalid_origins.add(asn)
+                if code & AS_INVALID and code & LENGTH_INVALID:
+                    self.as_and_length_invalid += 1
+                elif code & AS_INVALID:
+                    self.as_invalid += 1
+                elif code & LENGTH_INVALID:
+                    self.length_invalid += 1
+
+        self.routes += len(routes)
+
+    def merge(self, other):
+        """
+        Add the counters of another report.
+
+        :param ValidationReport other: report with the same top_k
+        """
+        self.routes += other.routes
+        for afi in self.states:
+            self.states[afi] = [a + b for a, b in zip(self.states[afi], other.states[afi])]
+            self.lengths[afi] = [[a + b for a, b in zip(mine, theirs)]
+                                 for mine, theirs in zip(self.lengths[afi], other.lengths[afi])]
+        self.as_invalid += other.as_invalid
+        self.length_invalid += other.length_invalid
+        self.as_and_length_invalid += other.as_and_length_invalid
+        self.origins.merge(other.origins)
+        self.invalid_origins.merge(other.invalid_origins)
+
+    def invalid_share_by_origin(self, n=10):
+        r"""
+        Return the origin ASes with the most invalid routes.
+
+        Both counts are upper bounds, see :class:`SpaceSaving`. The total \
+        is None if the AS is not among the top_k origins by route count.
+
+        :param int n: number of origin ASes
+        :rtype: list of (asn, invalid, total, share) tuples
+        """
+        shares = []
+        for asn, invalid, _ in self.invalid_origins.top(n):
+            total = self.origins.get(asn)
+            share = float(invalid) / total if total else None
+            shares.append((asn, invalid, total, share))
+        return shares
+
+    def as_dict(self):
+        """
+        Return the report as a dict of plain python types.
+
+        :rtype: dict
+        """
+        def by_state(counts):
+            return dict((state.name, counts[state.value]) for state in PfxvState)
+
+        return {
+            'routes': self.routes,
+            'states': dict((afi, by_state(counts))
+                           for afi, counts in self.states.items()),
+            'lengths': dict((afi, dict((length, by_state(counts))
+                                       for length, counts in enumerate(lengths)
+                                       if any(counts)))
+                            for afi, lengths in self.lengths.items()),
+            'invalid_causes': {
+                'as': self.as_invalid,
+                'length': self.length_invalid,
+                'as_and_length': self.as_and_length_invalid,
+            },
+            'top_origins': self.origins.top(),
+            'top_invalid_origins': self.invalid_origins.top(),
+        }
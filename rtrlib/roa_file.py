@@ -0,0 +1,173 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.roa_file
+---------------
+
+Read and write validated ROA payloads in the formats of relying party software
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import csv
+import gzip
+import io
+import json
+
+from _rtrlib import ffi, lib
+
+from .exceptions import IpConversionException, RoaFileError
+from .snapshot import PfxTableSnapshot
+from .util import is_integer, is_string
+
+CHUNK_SIZE = 1 << 20
+"""Bytes of text formatted per call into the extension"""
+
+
+def read_roa_file(path):
+    r"""
+    Read the ROAs of a JSON or CSV export.
+
+    JSON files have a list of objects with asn, prefix and maxLength \
+    under the key "roas", as written by rpki-client, Routinator and the \
+    RIPE validator. CSV files have the columns ASN, IP Prefix and Max \
+    Length with a header line. ASNs may be written with an AS prefix.
+
+    :param str path: path of the file
+    :return: iterator of (asn, prefix, min_len, max_len) tuples
+    :rtype: Iterator
+
+    :raises RoaFileError:
+    """
+    with io.open(path, encoding='utf8') as roa_file:
+        content = roa_file.read()
+
+    if content.lstrip().startswith('{'):
+        try:
+            rows = json.loads(content)['roas']
+        except (ValueError, KeyError, TypeError) as err:
+            raise RoaFileError("{}: {}".format(path, err))
+        if not isinstance(rows, list):
+            raise RoaFileError("{}: roas is not a list".format(path))
+    else:
+        rows = list(csv.reader(content.splitlines()))[1:]
+
+    return _parse(path, rows)
+
+
+def _parse(path, rows):
+    # rows are JSON objects or CSV lines
+    for line, row in enumerate(rows, 1):
+        try:
+            if isinstance(row, dict):
+                asn, prefix, max_len = row['asn'], row['prefix'], row['maxLength']
+            else:
+                asn, prefix, max_len = row[:3]
+            if not is_integer(asn) and asn.upper().startswith('AS'):
+                asn = asn[2:]
+            address, min_len = prefix.split('/')
+            record = int(asn), address, int(min_len), int(max_len)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise RoaFileError("{}: invalid ROA {} {}".format(path, line, row))
+        yield record
+
+
+def _csv_field(value):
+    if any(char in value for char in ',"\r\n'):
+        return '"{}"'.format(value.replace('"', '""'))
+    return value
+
+
+def _layout(format, trust_anchor):
+    # header, separator, the four parts around the fields and footer
+    if format == 'json':
+        return ('{\n  "roas": [\n', ',\n',
+                '    { "asn": "AS', '", "prefix": "', '", "maxLength": ',
+                ', "ta": ' + json.dumps(trust_anchor) + ' }',
+                '\n  ]\n}\n')
+    if format == 'csv':
+        return ('ASN,IP Prefix,Max Length,Trust Anchor\n', '',
+                'AS', ',', ',', ',' + _csv_field(trust_anchor) + '\n',
+                '')
+    raise ValueError("format must be json or csv not %s" % format)
+
+
+def _compressor(fp, compression):
+    if compression is None:
+        return None
+    if compression == 'gzip':
+        # the level of the gzip tool, level 9 is several times slower for a
+        # few percent smaller files
+        return gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().stream_writer(fp, closefd=False)
+    raise ValueError("compression must be gzip or zstd not %s" % compression)
+
+
+def write_roa_file(pfx_table, fp, format='json', compression=None,
+                   trust_anchor='rtr', chunk_size=CHUNK_SIZE):
+    r"""
+    Write the records of a table as a JSON or CSV ROA export.
+
+    The JSON format is the one of Routinator and rpki-client, an object \
+    with the list "roas" of objects with asn, prefix, maxLength and ta. \
+    The CSV format has the columns ASN, IP Prefix, Max Length and Trust \
+    Anchor. Both are read by :func:`read_roa_file`.
+
+    The records are copied with one :class:`.PfxTableSnapshot` and \
+    formatted in C into a buffer of chunk_size bytes, which is written \
+    to fp whenever it is full. No python object is created per record.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param fp: path or file object opened for writing bytes, a file \
+        object is not closed
+    :param str format: json or csv
+    :param str compression: None, gzip or zstd, zstd requires the \
+        zstandard package
+    :param str trust_anchor: value of the ta field of every record, \
+        rtrlib does not know the trust anchor of a record
+    :param int chunk_size: size of the buffer in bytes
+    :return: number of written records
+    :rtype: int
+
+    :raises ValueError: for an unknown format or compression
+    :raises IpConversionException: if an address could not be formatted
+    """
+    layout = [part.encode('utf8') for part in _layout(format, trust_anchor)]
+    header, footer = layout[0], layout[-1]
+    parts_data = [ffi.new('char[]', part) for part in layout[1:-1]]
+    parts = ffi.new('char *[]', parts_data)
+
+    if is_string(fp):
+        with open(fp, 'wb') as out:
+            return write_roa_file(pfx_table, out, format, compression,
+                                  trust_anchor, chunk_size)
+
+    compressor = _compressor(fp, compression)
+    out = fp if compressor is None else compressor
+
+    snapshot = PfxTableSnapshot(pfx_table)
+    records = snapshot._records
+    count = len(snapshot)
+    buf = ffi.new('char[]', chunk_size)
+    formatted = ffi.new('unsigned int *')
+
+    out.write(header)
+    done = 0
+    while done < count:
+        written = lib.pfx_records_format(records + done, count - done, parts,
+                                         done > 0, buf, chunk_size, formatted)
+        if written < 0:
+            raise IpConversionException("ip_addr object could not be converted")
+        if formatted[0] == 0:
+            raise ValueError("chunk_size is too small for one record")
+        out.write(ffi.buffer(buf, written))
+        done += formatted[0]
+    out.write(footer)
+
+    if compressor is not None:
+        compressor.close()
+    return count
@@ -9,6 +9,7 @@ from __future__ import absolute_import, unicode_literals
 
 
 import time
+import functools
 import logging
 import signal
 import threading
@@ -17,15 +18,30 @@ from enum import Enum
 from _rtrlib import ffi, lib
 
 import rtrlib.callbacks as callbacks
+import rtrlib.profiling as profiling
 import rtrlib.records as records
 
+from .asn_index import AsnIndex
+from .batch import STATE_MASK, validate_origins, validate_routes
+from .pfx_query import covering_records, more_specific_records
+from .roa_file import write_roa_file
+from .prefilter import CoverageFilter
+from .session_state import load_session_state, save_session_state
+from .snapshot import PfxTableSnapshot
+from .update_log import UpdateLogWriter
+
 from .util import (to_bytestr,
                    is_integer,
                    is_string,
                    ip_str_to_addr,
                    CallbackGenerator
                    )
-from .exceptions import RTRInitError, PFXException, SyncTimeout
+from .exceptions import (RTRInitError,
+                         IpConversionException,
+                         PFXException,
+                         SyncTimeout,
+                         NotEnabledError
+                         )
 
 
 LOG = logging.getLogger(__name__)
@@ -76,6 +92,38 @@ class RTRManager(object):
 
     :param spki_update_callback_data: data passed to the spki update callback
 
+    :param bool asn_index: maintain an index of the records of every ASN, \
+        see :py:meth:`records_for_asn`
+
+    :param prefilter: answer not found without calling rtrlib for routes \
+        no record can cover, True for a filter with the default blocks, \
+        available as the prefilter attribute
+    :type prefilter: bool or :class:`.CoverageFilter`
+
+    :param dispatcher: run the status, pfx update and spki update \
+        callbacks on the worker thread of this dispatcher instead of the \
+        rtrlib thread
+    :type dispatcher: :class:`.CallbackDispatcher`
+
+    :param sync_tracer: record the state transitions and sync phases \
+        of the rtr socket
+    :type sync_tracer: :class:`.SyncTracer`
+
+    :param churn_monitor: count the pfx updates per origin and socket \
+        to detect churn storms
+    :type churn_monitor: :class:`.ChurnMonitor`
+
+    :param str update_log: append every pfx and spki update to this \
+        file, see :mod:`rtrlib.update_log`
+
+    :param history: record every pfx update with its time to validate \
+        routes against past records
+    :type history: :class:`.HistoryStore`
+
+    :param str state_file: save the session id, serial number and records \
+        to this file on :py:meth:`stop` and resume the session from it \
+        on :py:meth:`start` with a serial query instead of a reset query
+
     :raises RTRInitError:
 
     """
@@ -93,6 +141,14 @@ class RTRManager(object):
                 pfx_update_callback_data=None,
                 spki_update_callback=None,
                 spki_update_callback_data=None,
+                asn_index=False,
+                dispatcher=None,
+                sync_tracer=None,
+                state_file=None,
+                churn_monitor=None,
+                update_log=None,
+                prefilter=False,
+                history=None,
             ):
 
         LOG.debug('Initializing RTR manager')
@@ -106,30 +162,92 @@ class RTRManager(object):
 
         self._status_callback_data = status_callback_data
         self._handle = ffi.new_handle(self)
+        self.dispatcher = dispatcher
+        self.sync_tracer = sync_tracer
+        self.churn_monitor = churn_monitor
+
+        # internal consumers of status changes, called with
+        # (ManagerGroup, ManagerGroupStatus, RTRSocket) before the user callback
+        self._status_listeners = []
+        if sync_tracer is not None:
+            self._status_listeners.append(sync_tracer.status_update)
+        if churn_monitor is not None:
+            self._status_listeners.append(churn_monitor.status_update)
 
         if status_callback:
             self._status_callback = status_callback
-            cffi_callback = lib.rtr_mgr_status_callback
         else:
             self._status_callback = ffi.NULL
+
+        if status_callback or self._status_listeners:
+            cffi_callback = lib.rtr_mgr_status_callback
+        else:
             cffi_callback = ffi.NULL
 
+        # internal consumers of pfx updates, called with (PFXRecord, added)
+        # before the user callback
+        self._pfx_update_listeners = []
+
+        self.prefilter = CoverageFilter() if prefilter is True else prefilter or None
+        if self.prefilter is not None:
+            self._pfx_update_listeners.append(self.prefilter.update)
+
+        self._asn_index = None
+        if asn_index:
+            self._asn_index = AsnIndex()
+            self._pfx_update_listeners.append(self._asn_index.update)
+        if churn_monitor is not None:
+            self._pfx_update_listeners.append(churn_monitor.pfx_update)
+
+        self._update_log = None
+        if update_log:
+            self._update_log = UpdateLogWriter(update_log)
+            self._pfx_update_listeners.append(self._update_log.pfx_update)
+
+        self.history = history
+        if history is not None:
+            self._pfx_update_listeners.append(history.pfx_update)
+
         self._pfx_update_callback_data = pfx_update_callback_data
         if pfx_update_callback:
             self._pfx_update_callback = pfx_update_callback
-            pfx_cffi_callback = lib.pfx_update_callback
         else:
             self._pfx_update_callback = ffi.NULL
+
+        if (pfx_update_callback or self._pfx_update_listeners or
+                sync_tracer is not None):
+            pfx_cffi_callback = lib.pfx_update_callback
+        else:
             pfx_cffi_callback = ffi.NULL
 
+        # internal consumers of spki updates, called with (SPKIRecord, added)
+        # before the user callback
+        self._spki_update_listeners = []
+
+        # the spki table can not be read back, a session with router keys
+        # is not saved
+        self._state_file = state_file
+        self._spki_records = 0
+        if state_file:
+            self._spki_update_listeners.append(self._count_spki_record)
+        if self._update_log is not None:
+            self._spki_update_listeners.append(self._update_log.spki_update)
+        self.session_restored = False
+
         self._spki_update_callback_data = spki_update_callback_data
         if spki_update_callback:
             self._spki_update_callback = spki_update_callback
-            spki_cffi_callback = lib.spki_update_callback
         else:
             self._spki_update_callback = ffi.NULL
+
+        if spki_update_callback or self._spki_update_listeners:
+            spki_cffi_callback = lib.spki_update_callback
+        else:
             spki_cffi_callback = ffi.NULL
 
+        self._host = host
+        self._port = port
+
         self.host = ffi.new('char[]', to_bytestr(host))
         self.port = ffi.new('char[]', to_bytestr(port))
 
@@ -170,6 +288,7 @@ class RTRManager(object):
                                "is invalid.")
 
         self.rtr_manager_config = rtr_manager_config[0]
+        self.pfx_table = self.rtr_socket.rtr_socket.pfx_table
 
     def __del__(self):
         if hasattr(self, "rtr_manager_config"):
@@ -198,16 +317,67 @@ class RTRManager(object):
             only that it did not finish in time.
         """
         LOG.debug("Starting RTR manager")
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+        if self._state_file:
+            self.session_restored = load_session_state(self._state_file,
+                                                       self._host,
+                                                       self._port,
+                                                       self.rtr_socketp[0])
+
         lib.rtr_mgr_start(self.rtr_manager_config)
 
         if wait:
             self.wait_for_sync(timeout)
 
     def stop(self):
-        """Stop RTRManager."""
+        r"""
+        Stop RTRManager.
+
+        If a dispatcher is used, this waits until all queued callbacks ran, \
+        including the callbacks handed to its executor.
+        If the manager has a state file, the session is saved first.
+        """
         LOG.debug("Stopping RTR manager")
+        if self._state_file:
+            self.save_state()
+
         lib.rtr_mgr_stop(self.rtr_manager_config)
 
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+
+        if self._update_log is not None:
+            self._update_log.flush()
+
+    def save_state(self):
+        r"""
+        Save the session to the state file.
+
+        Can be called periodically, the session is only saved while it is \
+        established and no update is being applied.
+
+        :return: True if the session was saved
+        :rtype: bool
+
+        :raises NotEnabledError: if the manager was created without state_file
+        """
+        if not self._state_file:
+            raise NotEnabledError("RTRManager was created without state_file")
+
+        if self._spki_records:
+            LOG.info("Not saving session state, router keys can not be saved")
+            return False
+
+        return save_session_state(self._state_file,
+                                  self._host,
+                                  self._port,
+                                  self.rtr_socketp[0])
+
+    def _count_spki_record(self, record, added):
+        self._spki_records += 1 if added else -1
+
     def is_synced(self):
         """
         Check if RTRManager is fully synchronized.
@@ -239,9 +409,14 @@ class RTRManager(object):
         signal.alarm(0)
 
     def validate(self, asn, prefix, mask_len):
-        """
+        r"""
         Validate BGP prefix and returns state as PfxvState enum.
 
+        The reasons of the decision are not collected, they are looked up \
+        with :py:meth:`explain` the first time \
+        :py:attr:`ValidationResult.reason` (or as_invalid, length_invalid) \
+        is accessed and reflect the table at that time.
+
         :param asn: autonomous system number
         :type asn: int
 
@@ -253,8 +428,77 @@ class RTRManager(object):
 
         :rtype: ValidationResult
         """
+        timer = profiling.start('RTRManager.validate')
         LOG.debug("Validating %s/%s from AS %s", prefix, mask_len, asn)
 
+        if not is_integer(asn):
+            raise TypeError("asn must be integer not %s" % type(asn))
+
+        if not is_integer(mask_len):
+            raise TypeError("mask_len must be integer not %s" % type(asn))
+
+        if self.prefilter is not None and self.prefilter.not_found(prefix, mask_len):
+            return ValidationResult(prefix, mask_len, asn, PfxvState.not_found.value)
+
+        result = ffi.new('enum pfxv_state *')
+        addr = ip_str_to_addr(prefix)
+
+        if timer:
+            timer.lap('parse')
+
+        ret = lib.pfx_table_validate(self.pfx_table,
+                                     asn,
+                                     addr,
+                                     mask_len,
+                                     result
+                                     )
+
+        if timer:
+            timer.lap('c_call')
+
+        if ret == lib.PFX_ERROR:
+            raise PFXException("An error occurred during validation")
+
+        validation_result = ValidationResult(prefix,
+                                             mask_len,
+                                             asn,
+                                             result[0],
+                                             explain=functools.partial(self.explain,
+                                                                       asn,
+                                                                       prefix,
+                                                                       mask_len))
+
+        if timer:
+            timer.stop('result')
+
+        return validation_result
+
+    def validator(self, prefilter=False):
+        """
+        Return a validation handle with reusable buffers for one thread.
+
+        :param bool prefilter: use the prefilter of the manager
+        :rtype: :class:`Validator`
+        """
+        return Validator(self, prefilter)
+
+    def explain(self, asn, prefix, mask_len):
+        """
+        Validate BGP prefix and collect the records the decision is based on.
+
+        :param asn: autonomous system number
+        :type asn: int
+
+        :param prefix: ip address
+        :type prefix: str
+
+        :param mask_len: length of the subnet mask
+        :type mask_len: int
+
+        :rtype: ValidationResult
+        """
+        timer = profiling.start('RTRManager.explain')
+
         if not is_integer(asn):
             raise TypeError("asn must be integer not %s" % type(asn))
 
@@ -267,25 +511,166 @@ class RTRManager(object):
         reason[0] = ffi.NULL
         reason_length = ffi.new('unsigned int *')
         reason_length[0] = 0
+        addr = ip_str_to_addr(prefix)
+
+        if timer:
+            timer.lap('parse')
 
-        ret = lib.pfx_table_validate_r(self.rtr_socket[0].pfx_table,
+        ret = lib.pfx_table_validate_r(self.pfx_table,
                                        reason,
                                        reason_length,
                                        asn,
-                                       ip_str_to_addr(prefix),
+                                       addr,
                                        mask_len,
                                        result
                                        )
 
+        if timer:
+            timer.lap('c_call')
+
         if ret == lib.PFX_ERROR:
             raise PFXException("An error occurred during validation")
 
-        return ValidationResult(prefix,
-                                mask_len,
-                                asn,
-                                result[0],
-                                reason,
-                                reason_length[0])
+        validation_result = ValidationResult(prefix,
+                                             mask_len,
+                                             asn,
+                                             result[0],
+                                             reason,
+                                             reason_length[0])
+
+        if timer:
+            timer.stop('result')
+
+        return validation_result
+
+    def validate_origins(self, prefix, mask_len, asns):
+        r"""
+        Validate a prefix announced by several origins.
+
+        The covering records are looked up once for all asns, the \
+        reasons are looked up like those of :py:meth:`validate`.
+
+        See :py:meth:`rtrlib.pfx_table.PfxTable.validate_origins`
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :param asns: origin asns
+        :type asns: sequence of int
+        :return: one result per asn, in the order of asns
+        :rtype: list of ValidationResult
+        """
+        if self.prefilter is not None and self.prefilter.not_found(prefix, mask_len):
+            codes = bytearray([PfxvState.not_found.value]) * len(asns)
+        else:
+            codes = validate_origins(self.pfx_table, prefix, mask_len, asns,
+                                     flags=False)
+        return [ValidationResult(prefix,
+                                 mask_len,
+                                 asn,
+                                 code & STATE_MASK,
+                                 explain=functools.partial(self.explain,
+                                                           asn,
+                                                           prefix,
+                                                           mask_len))
+                for asn, code in zip(asns, codes)]
+
+    def validate_codes(self, routes, out=None, flags=True, group=False):
+        """
+        Validate many routes and return compact result codes.
+
+        See :py:meth:`rtrlib.pfx_table.PfxTable.validate_codes`
+
+        :param routes: (asn, prefix, mask_len) tuples or \
+            :class:`.PreparedRoutes`
+        :param out: writable buffer the codes are written to
+        :param bool flags: if False only the pfxv_state values are returned
+        :param bool group: look up every distinct prefix once
+        :rtype: bytearray or out
+        """
+        return validate_routes(self.pfx_table, routes, out, flags, group)
+
+    def export(self, fp, format='json', compression=None, trust_anchor='rtr'):
+        r"""
+        Write the records as a JSON or CSV ROA export.
+
+        See :func:`rtrlib.roa_file.write_roa_file`.
+
+        :param fp: path or file object opened for writing bytes
+        :param str format: json or csv
+        :param str compression: None, gzip or zstd
+        :param str trust_anchor: value of the ta field of every record
+        :return: number of written records
+        :rtype: int
+        """
+        return write_roa_file(self.pfx_table, fp, format, compression, trust_anchor)
+
+    def covering(self, prefix, mask_len):
+        """
+        Return all records whose prefix covers the given prefix.
+
+        See :py:meth:`rtrlib.pfx_table.PfxTable.covering`
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: list of :class:`.PFXRecord`
+        """
+        return covering_records(self.pfx_table, prefix, mask_len)
+
+    def more_specifics(self, prefix, mask_len):
+        """
+        Return all records whose prefix is equal to or more specific \
+        than the given prefix.
+
+        See :py:meth:`rtrlib.pfx_table.PfxTable.more_specifics`
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: list of :class:`.PFXRecord`
+        """
+        return more_specific_records(self.pfx_table,
+                                     prefix,
+                                     mask_len)
+
+    def snapshot(self, ipv4=True, ipv6=True):
+        r"""
+        Return a consistent point-in-time copy of the pfx table.
+
+        The table is read locked only while the records are copied into \
+        a C array, rtrlib can apply updates while the copy is iterated.
+
+        :param bool ipv4: include the ipv4 records
+        :param bool ipv6: include the ipv6 records
+        :rtype: :class:`.PfxTableSnapshot`
+        """
+        return PfxTableSnapshot(self.pfx_table, ipv4, ipv6)
+
+    def records_for_asn(self, asn):
+        """
+        Return all records for an ASN.
+
+        :param int asn: autonomous system number
+        :rtype: list of :class:`.PFXRecord`
+
+        :raises NotEnabledError: if the manager was created without asn_index
+        """
+        return self._get_asn_index().records_for_asn(asn)
+
+    def records_for_asns(self, asns):
+        """
+        Return the records for several ASNs at once.
+
+        :param asns: autonomous system numbers
+        :type asns: iterable of int
+        :rtype: dict mapping every asn to a list of :class:`.PFXRecord`
+
+        :raises NotEnabledError: if the manager was created without asn_index
+        """
+        return self._get_asn_index().records_for_asns(asns)
+
+    def _get_asn_index(self):
+        if self._asn_index is None:
+            raise NotEnabledError("RTRManager was created without asn_index")
+        return self._asn_index
 
     def for_each_ipv4_record(self, callback, data):
         r"""
@@ -307,7 +692,7 @@ class RTRManager(object):
             data_handle
             )
 
-    def ipv4_records(self):
+    def ipv4_records(self, snapshot=False):
         r"""
         Return iterator over all ipv4 records in the pfx table.
 
@@ -315,8 +700,15 @@ class RTRManager(object):
         If that is a problem for you take a look at \
         :py:meth:`for_each_ipv4_record`.
 
+        With snapshot set the records are instead copied from the table \
+        at once, see :py:meth:`snapshot`.
+
+        :param bool snapshot: iterate over a point-in-time copy of the table
         :rtype: Iterator
         """
+        if snapshot:
+            return self.snapshot(ipv6=False).ipv4_records()
+
         def callback(record, data):
             LOG.debug('Putting "%s" in queue', record)
             data.put_nowait(records.copy_pfx_record(record))
@@ -344,7 +736,7 @@ class RTRManager(object):
             data_handle
             )
 
-    def ipv6_records(self):
+    def ipv6_records(self, snapshot=False):
         r"""
         Return iterator over all ipv6 records in the pfx table.
 
@@ -352,8 +744,15 @@ class RTRManager(object):
         If that is a problem for you take a look at \
         :py:meth:`for_each_ipv6_record`.
 
+        With snapshot set the records are instead copied from the table \
+        at once, see :py:meth:`snapshot`.
+
+        :param bool snapshot: iterate over a point-in-time copy of the table
         :rtype: Iterator
         """
+        if snapshot:
+            return self.snapshot(ipv4=False).ipv6_records()
+
         def callback(record, data):
             LOG.debug('Putting "%s" in queue', record)
             data.put_nowait(records.copy_pfx_record(record))
@@ -445,6 +844,10 @@ class ValidationResult(object):
 
     :param reason_len: Length of reason_records
     :type reason_len: int
+
+    :param explain: called without arguments to look up the reasons when \
+        they are first accessed, returns a ValidationResult with reasons
+    :type explain: function
     """
 
     def __init__(self,
@@ -453,7 +856,8 @@ class ValidationResult(object):
                  asn,
                  state,
                  reason_records=None,
-                 reason_len=0
+                 reason_len=0,
+                 explain=None
                  ):
         self._state = PfxvState(state)
         self._prefix = prefix
@@ -474,6 +878,9 @@ class ValidationResult(object):
             self._reason = None
             self._reason_records = None
 
+        self._explain = explain
+        self._explained = None
+
     def __del__(self,):
         if self._reason_records:
             lib.free(self._reason_records[0])
@@ -510,7 +917,7 @@ class ValidationResult(object):
         and state is invalid.
         """
         return (self.is_invalid and
-                any(reason.as_invalid for reason in self._reason))
+                any(reason.as_invalid for reason in self.reason))
 
     @property
     def length_invalid(self):
@@ -518,9 +925,91 @@ class ValidationResult(object):
          length and state is invalid.
          """
         return (self.is_invalid and
-                any(reason.length_invalid for reason in self._reason))
+                any(reason.length_invalid for reason in self.reason))
 
     @property
     def reason(self):
         """List of :class:`.Reason` ."""
+        if self._reason is None and self._explain is not None:
+            # the reasons point into the array owned by the explained result
+            self._explained = self._explain()
+            self._explain = None
+            self._reason = self._explained.reason
         return self._reason
+
+
+class Validator(object):
+    r"""
+    Validation handle that reuses its C buffers for every call.
+
+    Created with :py:meth:`RTRManager.validator` or \
+    :py:meth:`.PfxTable.validator`. The address and state buffers are \
+    allocated once and :py:meth:`validate` returns a :class:`PfxvState` \
+    member instead of a :class:`ValidationResult`, a call allocates no \
+    cffi objects. The table is looked up on the source for every call, \
+    a reloaded :class:`.PfxTable` is used at once. A sharded source is \
+    asked for the table of every address.
+
+    The prefilter of the source is skipped unless prefilter is set, its \
+    check in Python costs more than most rtrlib lookups it saves.
+
+    A validator must only be used by one thread at a time.
+
+    :param source: object with a pfx_table attribute
+    :param bool prefilter: answer routes the prefilter of the source \
+        filters as not found without calling rtrlib
+    """
+
+    def __init__(self, source, prefilter=False):
+        self._source = source
+        self._prefilter = prefilter
+        self._addr = ffi.new('struct lrtr_ip_addr *')
+        self._state = ffi.new('enum pfxv_state *')
+        self._states = dict((state.value, state) for state in PfxvState)
+        self._prefix = None
+        # sources with several tables, e.g. ShardedPfxTable, pick the
+        # table of an address, the others have one pfx_table
+        self._table_for = getattr(source, '_table_for', None)
+
+    def validate(self, asn, prefix, mask_len):
+        r"""
+        Validate BGP prefix and return its state.
+
+        A prefix passed in consecutive calls is only converted once, \
+        bytes prefixes skip the encoding of str prefixes.
+
+        :param int asn: autonomous system number
+        :param prefix: ip address
+        :type prefix: str or bytes
+        :param int mask_len: length of the subnet mask
+        :rtype: PfxvState
+
+        :raises IpConversionException:
+        :raises PFXException:
+        """
+        if self._prefilter:
+            prefilter = getattr(self._source, 'prefilter', None)
+            if prefilter is not None and prefilter.not_found(prefix, mask_len):
+                return PfxvState.not_found
+
+        if prefix != self._prefix:
+            self._prefix = None
+            if lib.lrtr_ip_str_to_addr(prefix if isinstance(prefix, bytes)
+                                       else prefix.encode('ascii'),
+                                       self._addr) != 0:
+                raise IpConversionException("String could not be converted")
+            self._prefix = prefix
+
+        if self._table_for is not None:
+            pfx_table = self._table_for(self._addr)
+        else:
+            pfx_table = self._source.pfx_table
+
+        if lib.pfx_table_validate(pfx_table,
+                                  asn,
+                                  self._addr,
+                                  mask_len,
+                                  self._state) == lib.PFX_ERROR:
+            raise PFXException("An error occurred during validation")
+
+        return self._states[self._state[0]]
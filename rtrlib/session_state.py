@@ -0,0 +1,239 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.session_state
+--------------------
+
+Persist the state of a RTR session to resume it with a serial query
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+import struct
+import time
+
+from _rtrlib import ffi, lib
+
+from .snapshot import PfxTableSnapshot
+from .util import to_bytestr
+
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'RTRS'
+FORMAT_VERSION = 2
+
+# magic, format version, protocol version, session id, serial number,
+# wall clock time of the save, age of the last update at the save,
+# ipv4 record count, ipv6 record count
+_HEADER = struct.Struct('!4sBBIIdqII')
+# host length, port length
+_STRINGS = struct.Struct('!HH')
+# asn, min_len, max_len, address
+_IPV4_RECORD = struct.Struct('!IBBI')
+_IPV6_RECORD = struct.Struct('!IBB4I')
+
+SAVE_ATTEMPTS = 3
+"""Snapshots taken before giving up on a session that keeps updating"""
+
+
+def save_session_state(path, host, port, rtr_socket):
+    r"""
+    Write the session id, serial number and records of rtr_socket to path.
+
+    The records and the serial number have to match, so the state is \
+    only written while the socket is ESTABLISHED and the serial number \
+    did not change while the table was copied.
+
+    The file is written to a temporary file first and renamed, a \
+    concurrent reader never sees a partial state.
+
+    :param str path: state file
+    :param str host: host of the cache server
+    :param str port: port of the cache server
+    :param cdata rtr_socket: struct rtr_socket *
+    :return: True if the state was written
+    :rtype: bool
+    """
+    for _ in range(SAVE_ATTEMPTS):
+        session = _session(rtr_socket)
+        if rtr_socket.state != lib.RTR_ESTABLISHED:
+            LOG.info("Not saving session state, socket is not established")
+            return False
+
+        snapshot = PfxTableSnapshot(rtr_socket.pfx_table)
+
+        if (rtr_socket.state == lib.RTR_ESTABLISHED and
+                _session(rtr_socket) == session):
+            break
+    else:
+        LOG.info("Not saving session state, table kept changing")
+        return False
+
+    ipv4 = []
+    ipv6 = []
+    records = snapshot._records
+    for i in range(len(snapshot)):
+        record = records[i]
+        if record.socket != rtr_socket:
+            continue
+        if record.prefix.ver == lib.LRTR_IPV4:
+            ipv4.append(_IPV4_RECORD.pack(record.asn,
+                                          record.min_len,
+                                          record.max_len,
+                                          record.prefix.u.addr4.addr))
+        else:
+            ipv6.append(_IPV6_RECORD.pack(record.asn,
+                                          record.min_len,
+                                          record.max_len,
+                                          *record.prefix.u.addr6.addr))
+
+    host = to_bytestr(host)
+    port = to_bytestr(port)
+    version, session_id, serial_number, last_update = session
+    # last_update is a time of the monotonic clock, which restarts with
+    # the host, only its age is meaningful after a restart
+    age = max(0, _monotonic_time() - last_update)
+
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as state_file:
+        state_file.write(_HEADER.pack(MAGIC,
+                                      FORMAT_VERSION,
+                                      version,
+                                      session_id,
+                                      serial_number,
+                                      time.time(),
+                                      age,
+                                      len(ipv4),
+                                      len(ipv6)))
+        state_file.write(_STRINGS.pack(len(host), len(port)))
+        state_file.write(host)
+        state_file.write(port)
+        state_file.write(b''.join(ipv4))
+        state_file.write(b''.join(ipv6))
+    os.rename(tmp_path, path)
+
+    LOG.debug("Saved session %d serial %d with %d records",
+              session_id, serial_number, len(ipv4) + len(ipv6))
+    return True
+
+
+def load_session_state(path, host, port, rtr_socket):
+    r"""
+    Restore the session saved in path into rtr_socket.
+
+    The records are added to the pfx_table of rtr_socket as if they \
+    were received from it, the socket then starts with a serial query. \
+    If the cache does not accept the serial, rtrlib flushes the records \
+    of the socket and falls back to a reset query.
+
+    The state is ignored if it belongs to another cache server, another \
+    protocol version or if its last update is older than the expire \
+    interval of rtr_socket. The age of the last update is saved with the \
+    wall clock time of the save, the restored last_update of rtr_socket \
+    keeps the age on the monotonic clock of rtrlib. Must be called \
+    before the manager is started.
+
+    :param str path: state file
+    :param str host: host of the cache server
+    :param str port: port of the cache server
+    :param cdata rtr_socket: struct rtr_socket *
+    :return: True if the session was restored
+    :rtype: bool
+    """
+    try:
+        with open(path, 'rb') as state_file:
+            data = state_file.read()
+    except (IOError, OSError) as err:
+        LOG.info("No session state loaded from %s: %s", path, err)
+        return False
+
+    try:
+        header = _HEADER.unpack_from(data, 0)
+        offset = _HEADER.size
+        host_len, port_len = _STRINGS.unpack_from(data, offset)
+        offset += _STRINGS.size
+        saved_host = data[offset:offset + host_len]
+        offset += host_len
+        saved_port = data[offset:offset + port_len]
+        offset += port_len
+    except struct.error:
+        LOG.warning("Session state %s is truncated", path)
+        return False
+
+    (magic, format_version, version, session_id, serial_number, saved_at, age,
+     ipv4_len, ipv6_len) = header
+
+    expected_len = (offset + ipv4_len * _IPV4_RECORD.size +
+                    ipv6_len * _IPV6_RECORD.size)
+
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        LOG.warning("%s is not a session state file", path)
+        return False
+    if len(data) != expected_len:
+        LOG.warning("Session state %s is truncated", path)
+        return False
+    if saved_host != to_bytestr(host) or saved_port != to_bytestr(port):
+        LOG.info("Session state %s belongs to another cache server", path)
+        return False
+    if version != rtr_socket.version:
+        LOG.info("Session state %s uses another protocol version", path)
+        return False
+    age += max(0, int(time.time() - saved_at))
+    if age > rtr_socket.expire_interval:
+        LOG.info("Session state %s is expired", path)
+        return False
+
+    record = ffi.new('struct pfx_record *')
+    record.socket = rtr_socket
+
+    record.prefix.ver = lib.LRTR_IPV4
+    for _ in range(ipv4_len):
+        (record.asn, record.min_len, record.max_len,
+         record.prefix.u.addr4.addr) = _IPV4_RECORD.unpack_from(data, offset)
+        offset += _IPV4_RECORD.size
+        if not _add(rtr_socket, record):
+            return False
+
+    record.prefix.ver = lib.LRTR_IPV6
+    for _ in range(ipv6_len):
+        values = _IPV6_RECORD.unpack_from(data, offset)
+        record.asn, record.min_len, record.max_len = values[:3]
+        record.prefix.u.addr6.addr = values[3:]
+        offset += _IPV6_RECORD.size
+        if not _add(rtr_socket, record):
+            return False
+
+    rtr_socket.session_id = session_id
+    rtr_socket.serial_number = serial_number
+    rtr_socket.last_update = _monotonic_time() - age
+    rtr_socket.request_session_id = False
+
+    LOG.debug("Restored session %d serial %d with %d records",
+              session_id, serial_number, ipv4_len + ipv6_len)
+    return True
+
+
+def _monotonic_time():
+    """Seconds of the clock of rtr_socket.last_update."""
+    seconds = ffi.new('time_t *')
+    if lib.rtr_monotonic_time(seconds) != 0:
+        raise OSError("The monotonic clock could not be read")
+    return seconds[0]
+
+
+def _session(rtr_socket):
+    return (rtr_socket.version,
+            rtr_socket.session_id,
+            rtr_socket.serial_number,
+            rtr_socket.last_update)
+
+
+def _add(rtr_socket, record):
+    if lib.pfx_table_add(rtr_socket.pfx_table, record) == lib.PFX_SUCCESS:
+        return True
+
+    LOG.warning("Could not restore the session records, starting with a reset")
+    lib.pfx_table_src_remove(rtr_socket.pfx_table, rtr_socket)
+    return False
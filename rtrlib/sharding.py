@@ -0,0 +1,252 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.sharding
+---------------
+
+Records partitioned over several pfx tables with independent locks
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from _rtrlib import ffi, lib
+
+from .exceptions import PFXException
+from .pfx_table import PfxTable
+from .records import create_pfx_record
+from .rtr_manager import ValidationResult, Validator
+from .util import ip_str_to_addr
+
+IPV6_SKIP_BITS = 3
+"""Leading IPv6 bits not used for sharding, global unicast is 2000::/3"""
+
+
+class ShardedPfxTable(object):
+    r"""
+    Prefix table split into independent pfx tables by AFI and leading bits.
+
+    Every shard is a :class:`.PfxTable` with its own rwlock. IPv4 records \
+    are assigned by their leading bits, IPv6 records by the bits after \
+    the first three. A route is validated against the one shard of its \
+    address, writes to other shards never block it.
+
+    Records shorter than the shard bits cover several shards, they are \
+    added to every covered shard. Covering records of a route are always \
+    in its shard and the results are the same as for one table.
+
+    The table only holds the records passed to :py:meth:`add_record`, \
+    :py:meth:`update` or :py:meth:`reload`. :class:`.RTRManager` has no \
+    shards argument, rtrlib writes the records of its caches into the \
+    one pfx_table of the manager.
+
+    :param int shards: number of shards per address family, a power of two
+    """
+
+    def __init__(self, shards=16):
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError("shards must be a power of two not %s" % shards)
+        self.bits = shards.bit_length() - 1
+        self.ipv4_shards = [PfxTable() for _ in range(shards)]
+        self.ipv6_shards = [PfxTable() for _ in range(shards)]
+        self.closed = False
+
+    def _locate(self, addr):
+        if addr.ver == lib.LRTR_IPV4:
+            return self.ipv4_shards, addr.u.addr4.addr >> (32 - self.bits)
+        word = addr.u.addr6.addr[0] << IPV6_SKIP_BITS & 0xFFFFFFFF
+        return self.ipv6_shards, word >> (32 - self.bits)
+
+    def _table_for(self, addr):
+        shards, index = self._locate(addr)
+        return shards[index].pfx_table
+
+    def _covered_shards(self, addr, length):
+        # shards of all addresses in addr/length
+        shards, index = self._locate(addr)
+        fixed = length if addr.ver == lib.LRTR_IPV4 else length - IPV6_SKIP_BITS
+
+        if fixed >= self.bits:
+            return shards[index:index + 1]
+        if fixed <= 0:
+            return shards
+        size = 1 << (self.bits - fixed)
+        first = index // size * size
+        return shards[first:first + size]
+
+    def shard_for(self, prefix):
+        """
+        Return the shard that validates routes of a prefix.
+
+        :param str prefix: ip address
+        :rtype: :class:`.PfxTable`
+        """
+        shards, index = self._locate(ip_str_to_addr(prefix))
+        return shards[index]
+
+    def _apply(self, record, added):
+        function = lib.pfx_table_add if added else lib.pfx_table_remove
+        ret = lib.PFX_SUCCESS
+        for shard in self._covered_shards(record.prefix, record.min_len):
+            if function(shard.pfx_table, record) == lib.PFX_ERROR:
+                ret = lib.PFX_ERROR
+        return ret
+
+    def add_record(self, asn, ip, min_length, max_length):
+        """
+        Add a BGP prefix to the table.
+
+        :param int asn: autonomous system number
+        :param str ip: ip address
+        :param int min_length: minimum length of the subnet mask
+        :param int max_length: maximum length of the subnet mask
+
+        :raises PFXException: if rtrlib fails to add the record
+        """
+        record = create_pfx_record(asn, ip, min_length, max_length)
+        if self._apply(record, True) == lib.PFX_ERROR:
+            raise PFXException("An error occurred while adding a record")
+
+    def remove_record(self, asn, ip, min_length, max_length):
+        """
+        Remove a BGP prefix from the table.
+
+        :param int asn: autonomous system number
+        :param str ip: ip address
+        :param int min_length: minimum length of the subnet mask
+        :param int max_length: maximum length of the subnet mask
+        """
+        self._apply(create_pfx_record(asn, ip, min_length, max_length), False)
+
+    def update(self, record, added):
+        """
+        Apply a pfx update, the record keeps its socket.
+
+        Has the signature of a pfx update listener.
+
+        :param PFXRecord record: the affected record
+        :param bool added: True if the record was added
+        """
+        record = record._record
+        if ffi.typeof(record).kind != 'pointer':
+            record = ffi.addressof(record)
+        self._apply(record, added)
+
+    def reload(self, records):
+        r"""
+        Replace all records of the table.
+
+        Every shard is reloaded like :py:meth:`.PfxTable.reload`, one \
+        after the other. A reader sees the old or the new records of a \
+        shard, during the reload shards may differ in their state.
+
+        :param records: (asn, prefix, min_len, max_len) tuples
+        :type records: iterable
+        """
+        shard_records = dict((id(shard), []) for shard in self.ipv4_shards + self.ipv6_shards)
+        for record in records:
+            _, prefix, min_len, _ = record
+            for shard in self._covered_shards(ip_str_to_addr(prefix), min_len):
+                shard_records[id(shard)].append(record)
+
+        for shard in self.ipv4_shards + self.ipv6_shards:
+            shard.reload(shard_records[id(shard)])
+
+    def validate(self, asn, prefix, mask_len):
+        """
+        Validate BGP prefix and return state as ValidationResult object.
+        The reason list in the returned result will be empty.
+
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: ValidationResult
+        """
+        result = ffi.new('enum pfxv_state *')
+        addr = ip_str_to_addr(prefix)
+
+        ret = lib.pfx_table_validate(self._table_for(addr), asn, addr, mask_len, result)
+        if ret == lib.PFX_ERROR:
+            raise PFXException("An error occurred during validation")
+
+        return ValidationResult(prefix, mask_len, asn, result[0])
+
+    def validate_r(self, asn, prefix, mask_len):
+        """
+        Validate BGP prefix and return state as ValidationResult object.
+        The reason list in the returned result will contain a list of Reason objects.
+
+        :param int asn: autonomous system number
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: ValidationResult
+        """
+        return self.shard_for(prefix).validate_r(asn, prefix, mask_len)
+
+    def validator(self):
+        """
+        Return a validation handle with reusable buffers for one thread.
+
+        :rtype: :class:`.Validator`
+        """
+        return Validator(self)
+
+    def covering(self, prefix, mask_len):
+        """
+        Return all records whose prefix covers the given prefix.
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: list of :class:`.PFXRecord`
+        """
+        return self.shard_for(prefix).covering(prefix, mask_len)
+
+    def more_specifics(self, prefix, mask_len):
+        """
+        Return all records whose prefix is equal to or more specific \
+        than the given prefix.
+
+        :param str prefix: ip address
+        :param int mask_len: length of the subnet mask
+        :rtype: list of :class:`.PFXRecord`
+        """
+        addr = ip_str_to_addr(prefix)
+        shards = self._covered_shards(addr, mask_len)
+        if len(shards) == 1:
+            return shards[0].more_specifics(prefix, mask_len)
+        return [record
+                for shard in shards
+                for record in shard.more_specifics(prefix, mask_len)
+                if self._is_home(shard, record)]
+
+    def _is_home(self, shard, record):
+        # a record covering several shards is reported by the first one
+        return self._covered_shards(record._record.prefix, record.min_len)[0] is shard
+
+    def snapshot(self, ipv4=True, ipv6=True):
+        """
+        Return the records of all shards, each record once.
+
+        :param bool ipv4: include the ipv4 records
+        :param bool ipv6: include the ipv6 records
+        :rtype: list of :class:`.PFXRecord`
+        """
+        shards = (self.ipv4_shards if ipv4 else []) + (self.ipv6_shards if ipv6 else [])
+        return [record
+                for shard in shards
+                for record in shard.snapshot()
+                if self._is_home(shard, record)]
+
+    def close(self):
+        """
+        Free the tables of all shards.
+        """
+        if not self.closed:
+            for shard in self.ipv4_shards + self.ipv6_shards:
+                shard.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.snapshot
+---------------
+
+Point-in-time copies of a pfx_table
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from _rtrlib import ffi, lib
+
+from .exceptions import PFXException
+from .records import PFXRecord
+
+
+class PfxTableSnapshot(object):
+    r"""
+    Consistent point-in-time copy of the records of a pfx_table.
+
+    The records are copied into a single C array while the table is read \
+    locked, the lock is released before the first record is handed to \
+    python. Iterating a snapshot never blocks rtrlib from updating the \
+    table, however slow the consumer is.
+
+    The :class:`.PFXRecord` objects point into the snapshot buffer, \
+    they keep it alive as long as they are referenced.
+
+    :param cdata pfx_table: struct pfx_table *
+    :param bool ipv4: copy the IPv4 records
+    :param bool ipv6: copy the IPv6 records
+
+    :raises PFXException:
+    """
+
+    def __init__(self, pfx_table, ipv4=True, ipv6=True):
+        records = ffi.new('struct pfx_record **')
+        records[0] = ffi.NULL
+        records_len = ffi.new('unsigned int *')
+        ipv4_len = ffi.new('unsigned int *')
+
+        ret = lib.pfx_table_snapshot(pfx_table,
+                                     ipv4,
+                                     ipv6,
+                                     records,
+                                     records_len,
+                                     ipv4_len)
+
+        if ret == lib.PFX_ERROR:
+            raise PFXException("An error occurred while copying the table")
+
+        self._records = ffi.gc(records[0], lib.free)
+        self._len = records_len[0]
+        self._ipv4_len = ipv4_len[0]
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return self._iter(0, self._len)
+
+    def ipv4_records(self):
+        """
+        Return iterator over all ipv4 records in the snapshot.
+
+        :rtype: Iterator
+        """
+        return self._iter(0, self._ipv4_len)
+
+    def ipv6_records(self):
+        """
+        Return iterator over all ipv6 records in the snapshot.
+
+        :rtype: Iterator
+        """
+        return self._iter(self._ipv4_len, self._len)
+
+    def _iter(self, start, stop):
+        records = self._records
+        for i in range(start, stop):
+            yield PFXRecord(records + i, owner=self)
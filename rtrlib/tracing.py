@@ -0,0 +1,238 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.tracing
+--------------
+
+Timing of the synchronization phases of RTR sessions
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import bisect
+import collections
+import threading
+import time
+
+from _rtrlib import ffi
+
+from .rtr_socket import RTRSocketState
+
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+"""Upper bounds in seconds of the sync duration histogram buckets"""
+
+ERROR_STATES = frozenset((
+    RTRSocketState.ERROR_NO_DATA_AVAILABLE,
+    RTRSocketState.ERROR_NO_INCREMENTAL_UPDATE_AVAILABLE,
+    RTRSocketState.ERROR_FATAL,
+    RTRSocketState.ERROR_TRANSPORT,
+))
+
+PHASES = {
+    RTRSocketState.CONNECTING: 'connect',
+    RTRSocketState.FAST_RECONNECT: 'connect',
+    RTRSocketState.RESET: 'reset',
+    RTRSocketState.SYNC: 'pdus',
+}
+"""Sync phase that starts with a socket state"""
+
+
+class SyncTrace(object):
+    r"""
+    Timing of one synchronization of a RTR session.
+
+    A sync starts with the first CONNECTING, FAST_RECONNECT, RESET or \
+    SYNC state after the session was idle and ends with ESTABLISHED or \
+    an error state.
+
+    :ivar float start: start timestamp
+    :ivar float end: end timestamp, None while the sync is running
+    :ivar list phases: (phase, start, end) tuples, phase is one of \
+        connect, reset or pdus
+    :ivar int records: number of pfx records added or removed
+    :ivar float callback_time: seconds spent in the pfx update callbacks
+    :ivar RTRSocketState end_state: state that ended the sync
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.phases = []
+        self.records = 0
+        self.callback_time = 0.0
+        self.end_state = None
+
+    @property
+    def duration(self):
+        """Duration of the sync in seconds, None while it is running."""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def ok(self):
+        """True if the sync ended with ESTABLISHED."""
+        return self.end_state == RTRSocketState.ESTABLISHED
+
+    def __str__(self):
+        return 'sync {:.3f}s {} records {}'.format(self.duration or 0,
+                                                   self.records,
+                                                   self.end_state)
+
+
+class _Session(object):
+
+    def __init__(self, timeline_size, syncs_size):
+        self.timeline = collections.deque(maxlen=timeline_size)
+        self.syncs = collections.deque(maxlen=syncs_size)
+        self.current = None
+        self.phase = None
+
+
+class SyncTracer(object):
+    r"""
+    Records the socket state transitions of a :class:`.RTRManager`.
+
+    The tracer is fed by the status and pfx update trampolines. It keeps \
+    a per session timeline of states, the recent syncs with their phases \
+    and a histogram of the sync durations.
+
+    rtrlib only reports the transitions it passes to the manager status \
+    callback, a phase that is not reported is accounted to the phase \
+    before it.
+
+    :param int timeline_size: number of transitions kept per session
+    :param int syncs_size: number of syncs kept per session
+    :param buckets: upper bounds of the histogram buckets in seconds
+    :param span_exporter: called as span_exporter(name, start, end, \
+        attributes) for every finished phase and sync, names are \
+        rtr.sync, rtr.connect, rtr.reset and rtr.pdus
+    """
+
+    def __init__(self,
+                 timeline_size=1000,
+                 syncs_size=100,
+                 buckets=DEFAULT_BUCKETS,
+                 span_exporter=None):
+        self._timeline_size = timeline_size
+        self._syncs_size = syncs_size
+        self._buckets = tuple(sorted(buckets))
+        self._histogram = [0] * (len(self._buckets) + 1)
+        self._span_exporter = span_exporter
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _session_id(socket):
+        return int(ffi.cast('uintptr_t', socket._socket))
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session(self._timeline_size, self._syncs_size)
+            self._sessions[session_id] = session
+        return session
+
+    def status_update(self, group, group_status, socket):
+        """
+        Record the current state of socket.
+
+        Has the signature of a status listener.
+        """
+        now = time.time()
+        state = socket.state
+        session_id = self._session_id(socket)
+        spans = []
+
+        with self._lock:
+            session = self._session(session_id)
+            if session.timeline and session.timeline[-1][1] == state:
+                return
+            session.timeline.append((now, state))
+
+            phase = PHASES.get(state)
+            sync = session.current
+
+            if phase is not None:
+                if sync is None:
+                    sync = session.current = SyncTrace(now)
+                if session.phase is None or phase != session.phase[0]:
+                    self._end_phase(session, now, spans)
+                    session.phase = (phase, now)
+            elif sync is not None and (state == RTRSocketState.ESTABLISHED or
+                                       state in ERROR_STATES or
+                                       state == RTRSocketState.SHUTDOWN):
+                self._end_phase(session, now, spans)
+                sync.end = now
+                sync.end_state = state
+                session.syncs.append(sync)
+                session.current = None
+                self._histogram[bisect.bisect_left(self._buckets, sync.duration)] += 1
+                spans.append(('rtr.sync', sync.start, now, {
+                    'rtr.session': session_id,
+                    'rtr.records': sync.records,
+                    'rtr.callback_time': sync.callback_time,
+                    'rtr.end_state': state.name,
+                }))
+
+        if self._span_exporter is not None:
+            for span in spans:
+                self._span_exporter(*span)
+
+    @staticmethod
+    def _end_phase(session, now, spans):
+        if session.phase is None:
+            return
+
+        name, start = session.phase
+        session.current.phases.append((name, start, now))
+        session.phase = None
+        spans.append(('rtr.' + name, start, now, {}))
+
+    def pfx_update(self, record, added, callback_time):
+        """
+        Count a pfx update towards the running sync of its session.
+
+        :param PFXRecord record: the affected record
+        :param bool added: True if the record was added
+        :param float callback_time: seconds the update callbacks took
+        """
+        session_id = int(ffi.cast('uintptr_t', record._record.socket))
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.current is None:
+                return
+            session.current.records += 1
+            session.current.callback_time += callback_time
+
+    def timeline(self):
+        r"""
+        Return the state transitions of every session.
+
+        :rtype: dict mapping a session id to a list of \
+            (timestamp, :class:`.RTRSocketState`) tuples
+        """
+        with self._lock:
+            return dict((session_id, list(session.timeline))
+                        for session_id, session in self._sessions.items())
+
+    def syncs(self):
+        """
+        Return the finished syncs of every session, oldest first.
+
+        :rtype: dict mapping a session id to a list of :class:`SyncTrace`
+        """
+        with self._lock:
+            return dict((session_id, list(session.syncs))
+                        for session_id, session in self._sessions.items())
+
+    def histogram(self):
+        r"""
+        Return the histogram of the sync durations of all sessions.
+
+        :rtype: list of (upper bound in seconds, count) tuples, the last \
+            bucket has the upper bound float('inf')
+        """
+        with self._lock:
+            return list(zip(self._buckets + (float('inf'),), self._histogram))
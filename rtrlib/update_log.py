@@ -0,0 +1,241 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.update_log
+-----------------
+
+Record the pfx and spki updates of a session and replay them offline
+
+Format
+^^^^^^
+
+All integers are in network byte order. A log starts with the 8 bytes \
+``RTRULOG\\x01`` followed by the updates. Every update starts with \
+``timestamp (double), flags (uint8), socket id (uint64), asn (uint32)``, \
+flags bit 0 is set for added records and bit 1 for spki records. pfx \
+updates continue with ``ip version 4 or 6 (uint8), min_len (uint8), \
+max_len (uint8), address (16 bytes, IPv4 addresses are padded with \
+zeros)``, spki updates with ``ski (20 bytes), spki (91 bytes)``.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import struct
+import threading
+import time
+
+from _rtrlib import ffi, lib
+
+from .exceptions import PFXException, UpdateLogError
+from .records import PFXRecord, SPKIRecord
+
+MAGIC = b'RTRULOG\x01'
+
+ADDED = 0x1
+SPKI = 0x2
+
+_UPDATE = struct.Struct('!dBQI')
+_PFX = struct.Struct('!BBB16s')
+_SPKI = struct.Struct('!20s91s')
+_IPV4 = struct.Struct('!I12x')
+_IPV6 = struct.Struct('!4I')
+
+
+class UpdateLogWriter(object):
+    r"""
+    Appends pfx and spki updates to a log file.
+
+    :py:meth:`pfx_update` and :py:meth:`spki_update` have the signature \
+    of the update listeners of :class:`.RTRManager`, which creates a \
+    writer for its update_log argument.
+
+    :param str path: path of the log, updates are appended to an \
+        existing log
+    :param clock: function returning the timestamp of an update
+    """
+
+    def __init__(self, path, clock=time.time):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def _socket_id(record):
+        return int(ffi.cast('uintptr_t', record.socket))
+
+    def pfx_update(self, record, added):
+        """Append a pfx update."""
+        record = record._record
+        prefix = record.prefix
+        if prefix.ver == lib.LRTR_IPV4:
+            version = 4
+            address = _IPV4.pack(prefix.u.addr4.addr)
+        else:
+            version = 6
+            address = _IPV6.pack(*prefix.u.addr6.addr)
+
+        data = (_UPDATE.pack(self._clock(),
+                             ADDED if added else 0,
+                             self._socket_id(record),
+                             record.asn) +
+                _PFX.pack(version, record.min_len, record.max_len, address))
+        with self._lock:
+            self._file.write(data)
+
+    def spki_update(self, record, added):
+        """Append a spki update."""
+        record = record._record
+        data = (_UPDATE.pack(self._clock(),
+                             SPKI | (ADDED if added else 0),
+                             self._socket_id(record),
+                             record.asn) +
+                _SPKI.pack(ffi.buffer(record.ski)[:], ffi.buffer(record.spki)[:]))
+        with self._lock:
+            self._file.write(data)
+
+    def flush(self):
+        """Write buffered updates to the file."""
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """Close the log."""
+        with self._lock:
+            self._file.close()
+
+
+def _read_updates(path):
+    with open(path, 'rb') as log_file:
+        if log_file.read(len(MAGIC)) != MAGIC:
+            raise UpdateLogError("{} is not an update log".format(path))
+
+        while True:
+            header = log_file.read(_UPDATE.size)
+            if not header:
+                return
+            if len(header) < _UPDATE.size:
+                raise UpdateLogError("{}: truncated update".format(path))
+
+            timestamp, flags, socket_id, asn = _UPDATE.unpack(header)
+            body_struct = _SPKI if flags & SPKI else _PFX
+            body = log_file.read(body_struct.size)
+            if len(body) < body_struct.size:
+                raise UpdateLogError("{}: truncated update".format(path))
+
+            yield (timestamp, flags, socket_id, asn) + body_struct.unpack(body)
+
+
+def _fill_pfx_record(record, asn, version, min_len, max_len, address):
+    record.asn = asn
+    record.min_len = min_len
+    record.max_len = max_len
+    if version == 4:
+        record.prefix.ver = lib.LRTR_IPV4
+        record.prefix.u.addr4.addr = _IPV4.unpack(address)[0]
+    else:
+        record.prefix.ver = lib.LRTR_IPV6
+        record.prefix.u.addr6.addr = _IPV6.unpack(address)
+
+
+def _fill_spki_record(record, asn, ski, spki):
+    record.asn = asn
+    ffi.memmove(record.ski, ski, len(ski))
+    ffi.memmove(record.spki, spki, len(spki))
+
+
+def read_update_log(path):
+    r"""
+    Read the updates of a log.
+
+    :param str path: path of the log
+    :return: iterator of (timestamp, socket id, added, record) tuples, \
+        record is a :class:`.PFXRecord` or :class:`.SPKIRecord` without \
+        socket
+    :rtype: Iterator
+
+    :raises UpdateLogError: if the file is not a valid log
+    """
+    for update in _read_updates(path):
+        timestamp, flags, socket_id = update[:3]
+        if flags & SPKI:
+            record = ffi.new('struct spki_record *')
+            _fill_spki_record(record, update[3], *update[4:])
+            record = SPKIRecord(record)
+        else:
+            record = ffi.new('struct pfx_record *')
+            _fill_pfx_record(record, update[3], *update[4:])
+            record = PFXRecord(record)
+        yield timestamp, socket_id, bool(flags & ADDED), record
+
+
+def replay_update_log(path, target, speed=None, sleep=time.sleep, clock=time.time):
+    r"""
+    Apply the updates of a log to a table.
+
+    target is a :class:`.PfxTable` or a not started :class:`.RTRManager`. \
+    The pfx updates are added to and removed from the pfx table of target, \
+    for a manager this runs its update listeners and pfx update callback \
+    like updates received from a cache. spki updates are only passed to \
+    the spki update callback of a manager, rtrlib has no function to fill \
+    its spki table directly. All records are replayed as records of the \
+    socket of target.
+
+    Removing a record that is not in the table and adding a duplicate \
+    record are ignored, a log can start in the middle of a session.
+
+    :param str path: path of the log
+    :param target: table the updates are applied to
+    :param float speed: None to replay as fast as possible, 1.0 to replay \
+        at the recorded pace, 2.0 twice as fast
+    :param sleep: function used to wait for the next update
+    :param clock: function returning the current time in seconds
+    :return: number of replayed updates
+    :rtype: int
+
+    :raises UpdateLogError: if the file is not a valid log
+    :raises PFXException: if rtrlib fails to add a record
+    """
+    socket = target.rtr_socketp[0] if hasattr(target, 'rtr_socketp') else ffi.NULL
+    spki_callback = hasattr(target, '_spki_update_listeners')
+    pfx_table = target.pfx_table
+
+    pfx_record = ffi.new('struct pfx_record *')
+    pfx_record.socket = socket
+    spki_record = ffi.new('struct spki_record *')
+    spki_record.socket = socket
+
+    start = None
+    count = 0
+
+    for update in _read_updates(path):
+        timestamp, flags = update[:2]
+
+        if speed is not None:
+            if start is None:
+                start = (timestamp, clock())
+            delay = (timestamp - start[0]) / speed - (clock() - start[1])
+            if delay > 0:
+                sleep(delay)
+
+        if flags & SPKI:
+            if spki_callback:
+                _fill_spki_record(spki_record, update[3], *update[4:])
+                lib.spki_update_callback(ffi.NULL, spki_record[0], bool(flags & ADDED))
+        else:
+            _fill_pfx_record(pfx_record, update[3], *update[4:])
+            if flags & ADDED:
+                if lib.pfx_table_add(pfx_table, pfx_record) == lib.PFX_ERROR:
+                    raise PFXException("An error occurred while adding a record")
+            else:
+                lib.pfx_table_remove(pfx_table, pfx_record)
+        count += 1
+
+    return count
@@ -92,7 +92,7 @@ class StoppableThread(threading.Thread):
         self._stop_event.set()
 
     def stopped(self):
-        return self._stop_event.isSet()
+        return self._stop_event.is_set()
 
 
 class CallbackGenerator(object):
@@ -0,0 +1,416 @@
+# -*- coding: utf8 -*-
+"""
+rtrlib.vector
+-------------
+
+Offline validation of numpy batches against sorted record arrays
+
+Requires numpy. Prefixes nest but never overlap partially, the address \
+space is split into segments that are covered by the same chain of \
+prefixes. A batch of routes is validated with one vectorized binary \
+search over the segment boundaries and one over the sorted (chain, asn) \
+pairs, the result codes are the same as \
+:func:`rtrlib.batch.validate_routes` returns.
+
+IPv6 networks are compared by their upper 64 bits. Records with IPv6 \
+prefixes longer than /64 are kept in a :class:`.PfxTable`, routes longer \
+than /64 are additionally validated against it by the C trie.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import socket
+import struct
+
+import numpy as np
+
+from _rtrlib import ffi, lib
+
+from .batch import AS_INVALID, LENGTH_INVALID, STATE_MASK, PreparedRoutes, validate_routes
+from .exceptions import PFXException
+from .pfx_table import PfxTable
+from .records import PFXRecord
+from .roa_file import read_roa_file
+from .rtr_manager import PfxvState
+from .util import ip_str_to_addr
+
+_IPV4 = struct.Struct('!I')
+_IPV6 = struct.Struct('!QQ')
+
+_VALID = PfxvState.valid.value
+_NOT_FOUND = PfxvState.not_found.value
+_INVALID = PfxvState.invalid.value
+
+
+def _bits(first, last, count):
+    """Mask of the bits first to last of count bits."""
+    last = min(last, count - 1)
+    if first > last:
+        return 0
+    return ((1 << (last + 1)) - 1) ^ ((1 << first) - 1)
+
+
+class _Chain(object):
+    r"""
+    Aggregated records of a prefix and all prefixes covering it.
+
+    pairs maps every asn of the chain to a (valid mask, longest max_len, \
+    shortest length with a record of another asn) tuple.
+    """
+
+    def __init__(self, parent, length, elements, mask_bits, from_bits):
+        if parent is None:
+            self.found_min = length
+            self.length_mask = 0
+            self.min_max_len = 255
+            self.pairs = pairs = {}
+            single_asn = elements[0][0]
+        else:
+            self.found_min = parent.found_min
+            self.length_mask = parent.length_mask
+            self.min_max_len = parent.min_max_len
+            self.pairs = pairs = dict(parent.pairs)
+            single_asn = parent.single_asn
+
+        for asn, max_len in elements:
+            self.length_mask |= from_bits[max_len + 1]
+            self.min_max_len = min(self.min_max_len, max_len)
+            if asn not in pairs:
+                # every record of the covering prefixes has another asn
+                pairs[asn] = (0, -1, self.found_min if parent is not None else 255)
+            if asn != single_asn:
+                single_asn = None
+
+        if single_asn is None and parent is not None and parent.single_asn is not None:
+            valid, max_all, _ = pairs[parent.single_asn]
+            pairs[parent.single_asn] = (valid, max_all, length)
+        if len(elements) > 1 or single_asn is None:
+            for asn, _ in elements:
+                valid, max_all, as_from = pairs[asn]
+                if as_from == 255 and (single_asn is None or asn != single_asn):
+                    pairs[asn] = (valid, max_all, length)
+
+        for asn, max_len in elements:
+            if asn != 0:
+                valid, max_all, as_from = pairs[asn]
+                pairs[asn] = (valid | _bits(length, max_len, mask_bits),
+                              max(max_all, max_len), as_from)
+
+        self.single_asn = single_asn
+
+
+class _Family(object):
+    r"""
+    Records of one address family as disjoint address segments.
+
+    Prefixes never overlap partially, every address segment between two \
+    prefix boundaries is covered by a chain of nested prefixes. For every \
+    chain the prefix lengths of the routes that are found, valid and \
+    invalid are precomputed as bit masks, per chain and per (chain, asn) \
+    pair. Prefix lengths that do not fit into the 64 bit masks, IPv6 \
+    routes longer than /63, are resolved with the max_len aggregates.
+    """
+
+    def __init__(self, width, networks, lengths, max_lens, asns):
+        mask_bits = self.mask_bits = min(width + 1, 64)
+        from_bits = [_bits(first, 255, mask_bits) for first in range(257)]
+
+        nodes = {}
+        for network, length, max_len, asn in zip(networks, lengths, max_lens, asns):
+            nodes.setdefault((network, length), []).append((asn, max_len))
+
+        chains = [None]
+        segments = [[0, 0]]
+        stack = []
+
+        def segment(start, chain):
+            if start >= 1 << width:
+                return
+            if segments[-1][0] == start:
+                segments[-1][1] = chain
+            else:
+                segments.append([start, chain])
+
+        for start, length in sorted(nodes):
+            end = start + (1 << (width - length)) - 1
+            while stack and stack[-1][1] < start:
+                closed = stack.pop()
+                segment(closed[1] + 1, stack[-1][2] if stack else 0)
+
+            parent = chains[stack[-1][2]] if stack else None
+            chains.append(_Chain(parent, length, nodes[(start, length)],
+                                 mask_bits, from_bits))
+            stack.append((start, end, len(chains) - 1))
+            segment(start, len(chains) - 1)
+
+        while stack:
+            closed = stack.pop()
+            segment(closed[1] + 1, stack[-1][2] if stack else 0)
+
+        self.bounds = np.array([start for start, _ in segments], dtype=np.uint64)
+        self.segment_chains = np.array([chain for _, chain in segments], dtype=np.int64)
+
+        self.found_min = np.array([255] + [c.found_min for c in chains[1:]], dtype=np.uint8)
+        self.length_mask = np.array([0] + [c.length_mask for c in chains[1:]], dtype=np.uint64)
+        self.min_max_len = np.array([255] + [c.min_max_len for c in chains[1:]], dtype=np.uint8)
+
+        pairs = sorted(((index << 32) | asn, pair)
+                       for index, chain in enumerate(chains[1:], 1)
+                       for asn, pair in chain.pairs.items())
+        # a sentinel keeps the arrays from being empty
+        pairs.append(((1 << 64) - 1, (0, -1, 255)))
+        self.pair_keys = np.array([key for key, _ in pairs], dtype=np.uint64)
+        self.valid_mask = np.array([pair[0] for _, pair in pairs], dtype=np.uint64)
+        self.valid_max_len = np.array([pair[1] for _, pair in pairs], dtype=np.int16)
+        self.as_mask = np.array([from_bits[pair[2]] for _, pair in pairs],
+                                dtype=np.uint64)
+        self.as_any = np.array([pair[2] != 255 for _, pair in pairs], dtype=bool)
+
+    def validate(self, addresses, asns, mask_lens, out):
+        segments = np.searchsorted(self.bounds, addresses, side='right') - 1
+        chains = self.segment_chains[segments]
+
+        short = mask_lens < self.mask_bits
+        if short.all():
+            # no route needs the max_len aggregates
+            short = None
+            bit = mask_lens.astype(np.uint64)
+        else:
+            bit = np.minimum(mask_lens, self.mask_bits - 1).astype(np.uint64)
+
+        def test(masks, long_values):
+            bits = (masks >> bit) & np.uint64(1) != 0
+            if short is None:
+                return bits
+            return np.where(short, bits, long_values())
+
+        found = mask_lens >= self.found_min[chains]
+        length_invalid = test(self.length_mask[chains],
+                              lambda: self.min_max_len[chains] < mask_lens)
+
+        keys = (chains.astype(np.uint64) << np.uint64(32)) | asns
+        pairs = np.searchsorted(self.pair_keys, keys)
+        hit = self.pair_keys[pairs] == keys
+
+        valid = hit & test(self.valid_mask[pairs],
+                           lambda: self.valid_max_len[pairs] >= mask_lens)
+        as_invalid = np.where(hit,
+                              test(self.as_mask[pairs], lambda: self.as_any[pairs]),
+                              found)
+
+        invalid = (_INVALID |
+                   as_invalid.astype(np.uint8) * AS_INVALID |
+                   length_invalid.astype(np.uint8) * LENGTH_INVALID)
+        out[:] = np.where(valid, _VALID, np.where(found, invalid, _NOT_FOUND))
+
+
+def _as_arrays(asns, mask_lens):
+    return np.asarray(asns, dtype=np.uint32), np.asarray(mask_lens, dtype=np.uint8)
+
+
+def _output(out, count):
+    if out is None:
+        return np.empty(count, dtype=np.uint8)
+    if len(out) < count:
+        raise ValueError("out is smaller than the number of routes")
+    return out[:count]
+
+
+class VectorEngine(object):
+    r"""
+    Validates numpy batches of routes with vectorized binary searches.
+
+    The engine is an immutable copy of the records, build it with \
+    :py:meth:`from_table`, :py:meth:`from_records` or \
+    :py:meth:`from_roa_file`.
+
+    :param records: (asn, prefix, min_len, max_len) tuples or \
+        :class:`.PFXRecord` objects
+    :type records: iterable
+    """
+
+    def __init__(self, records):
+        ipv4 = ([], [], [], [])
+        ipv6 = ([], [], [], [])
+        long_ipv6 = []
+
+        for record in records:
+            if isinstance(record, PFXRecord):
+                cdata = record._record
+                asn, address, min_len, max_len = (cdata.asn, cdata.prefix,
+                                                  cdata.min_len, cdata.max_len)
+            else:
+                asn, prefix, min_len, max_len = record
+                address = ip_str_to_addr(prefix)[0]
+
+            if address.ver == lib.LRTR_IPV4:
+                columns = ipv4
+                network = address.u.addr4.addr
+            elif min_len > 64:
+                if isinstance(record, PFXRecord):
+                    prefix = record.prefix
+                long_ipv6.append((asn, prefix, min_len, max_len))
+                continue
+            else:
+                columns = ipv6
+                words = address.u.addr6.addr
+                network = (words[0] << 32) | words[1]
+
+            columns[0].append(network)
+            columns[1].append(min_len)
+            columns[2].append(max_len)
+            columns[3].append(asn)
+
+        self._ipv4 = _Family(32, *ipv4)
+        self._ipv6 = _Family(64, *ipv6)
+        self._long_ipv6 = None
+        if long_ipv6:
+            self._long_ipv6 = PfxTable()
+            self._long_ipv6.reload(long_ipv6)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build an engine from records.
+
+        :param records: (asn, prefix, min_len, max_len) tuples or \
+            :class:`.PFXRecord` objects
+        :rtype: VectorEngine
+        """
+        return cls(records)
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Build an engine from a snapshot of a table.
+
+        :param table: :class:`.PfxTable` or :class:`.RTRManager`
+        :rtype: VectorEngine
+        """
+        return cls(table.snapshot())
+
+    @classmethod
+    def from_roa_file(cls, path):
+        """
+        Build an engine from a ROA export, see :func:`.read_roa_file`.
+
+        :param str path: path of the file
+        :rtype: VectorEngine
+
+        :raises RoaFileError:
+        """
+        return cls(read_roa_file(path))
+
+    def validate_ipv4(self, asns, addresses, mask_lens, out=None):
+        r"""
+        Validate IPv4 routes.
+
+        :param asns: origin asn of every route
+        :param addresses: IPv4 address of every route as integer
+        :param mask_lens: prefix length of every route
+        :param out: uint8 array the result codes are written to
+        :return: result codes as described in :mod:`rtrlib.batch`
+        :rtype: numpy.ndarray of uint8
+
+        :raises PFXException: if a mask_len is longer than 32
+        """
+        asns, mask_lens = _as_arrays(asns, mask_lens)
+        addresses = np.asarray(addresses, dtype=np.uint64)
+        if mask_lens.size and mask_lens.max() > 32:
+            raise PFXException("An error occurred during validation")
+
+        out = _output(out, len(asns))
+        self._ipv4.validate(addresses, asns, mask_lens, out)
+        return out
+
+    def validate_ipv6(self, asns, addresses_high, addresses_low, mask_lens, out=None):
+        r"""
+        Validate IPv6 routes.
+
+        :param asns: origin asn of every route
+        :param addresses_high: upper 64 bits of every address as integer
+        :param addresses_low: lower 64 bits of every address as integer
+        :param mask_lens: prefix length of every route
+        :param out: uint8 array the result codes are written to
+        :return: result codes as described in :mod:`rtrlib.batch`
+        :rtype: numpy.ndarray of uint8
+
+        :raises PFXException: if a mask_len is longer than 128
+        """
+        asns, mask_lens = _as_arrays(asns, mask_lens)
+        addresses_high = np.asarray(addresses_high, dtype=np.uint64)
+        if mask_lens.size and mask_lens.max() > 128:
+            raise PFXException("An error occurred during validation")
+
+        out = _output(out, len(asns))
+        self._ipv6.validate(addresses_high, asns, mask_lens, out)
+
+        if self._long_ipv6 is not None:
+            long_routes = np.nonzero(mask_lens > 64)[0]
+            if len(long_routes):
+                addresses_low = np.asarray(addresses_low, dtype=np.uint64)
+                codes = np.empty(len(long_routes), dtype=np.uint8)
+                validate_routes(self._long_ipv6.pfx_table,
+                                _prepare_ipv6(asns[long_routes],
+                                              addresses_high[long_routes],
+                                              addresses_low[long_routes],
+                                              mask_lens[long_routes]),
+                                out=codes)
+                out[long_routes] = _combine(out[long_routes], codes)
+        return out
+
+    def validate_routes(self, routes):
+        """
+        Validate (asn, prefix, mask_len) tuples, e.g. to compare results.
+
+        :param routes: (asn, prefix, mask_len) tuples
+        :type routes: sequence of tuples
+        :rtype: numpy.ndarray of uint8
+        """
+        ipv4 = ([], [], [], [])
+        ipv6 = ([], [], [], [], [])
+
+        for i, (asn, prefix, mask_len) in enumerate(routes):
+            if ':' in prefix:
+                high, low = _IPV6.unpack(socket.inet_pton(socket.AF_INET6, prefix))
+                ipv6[0].append(i)
+                ipv6[1].append(asn)
+                ipv6[2].append(high)
+                ipv6[3].append(low)
+                ipv6[4].append(mask_len)
+            else:
+                ipv4[0].append(i)
+                ipv4[1].append(asn)
+                ipv4[2].append(_IPV4.unpack(socket.inet_aton(prefix))[0])
+                ipv4[3].append(mask_len)
+
+        out = np.empty(len(routes), dtype=np.uint8)
+        if ipv4[0]:
+            out[ipv4[0]] = self.validate_ipv4(*ipv4[1:])
+        if ipv6[0]:
+            out[ipv6[0]] = self.validate_ipv6(*[np.array(column, dtype=np.uint64)
+                                                for column in ipv6[1:]])
+        return out
+
+
+def _prepare_ipv6(asns, addresses_high, addresses_low, mask_lens):
+    count = len(asns)
+    prefixes = ffi.new('struct lrtr_ip_addr[]', count)
+    for i in range(count):
+        prefix = prefixes[i]
+        high = int(addresses_high[i])
+        low = int(addresses_low[i])
+        prefix.ver = lib.LRTR_IPV6
+        prefix.u.addr6.addr = [high >> 32, high & 0xFFFFFFFF, low >> 32, low & 0xFFFFFFFF]
+
+    return PreparedRoutes(ffi.new('uint32_t[]', [int(asn) for asn in asns]),
+                          prefixes,
+                          ffi.new('uint8_t[]', [int(mask_len) for mask_len in mask_lens]))
+
+
+def _combine(codes, other):
+    """Result codes of routes validated against two disjoint record sets."""
+    valid = (codes == _VALID) | (other == _VALID)
+    invalid = ((codes & STATE_MASK) == _INVALID) | ((other & STATE_MASK) == _INVALID)
+    flags = (codes | other) & (AS_INVALID | LENGTH_INVALID)
+    return np.where(valid, _VALID, np.where(invalid, _INVALID | flags, _NOT_FOUND))
@@ -0,0 +1,589 @@
+/*
+ * Helper functions compiled into the _rtrlib extension module.
+ *
+ * They operate directly on the prefix trie of a pfx_table, which rtrlib
+ * does not expose through its public api. The structs below mirror the
+ * private definitions of rtrlib/pfx/trie/trie.h and trie-pfx.c and have
+ * to be kept in sync with the rtrlib version the binding is built against.
+ */
+
+#include <pthread.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+struct ext_trie_node {
+    struct lrtr_ip_addr prefix;
+    struct ext_trie_node *rchild;
+    struct ext_trie_node *lchild;
+    struct ext_trie_node *parent;
+    void *data;
+    uint8_t len;
+};
+
+struct ext_data_elem {
+    uint32_t asn;
+    uint8_t max_len;
+    const struct rtr_socket *socket;
+};
+
+struct ext_node_data {
+    unsigned int len;
+    struct ext_data_elem *ary;
+};
+
+struct ext_record_buf {
+    struct pfx_record *records;
+    unsigned int len;
+    unsigned int size;
+    int error;
+};
+
+static unsigned int ext_addr_bits(const struct lrtr_ip_addr *addr)
+{
+    return addr->ver == LRTR_IPV4 ? 32 : 128;
+}
+
+/* Return bit <pos> of addr, counted from the most significant bit. */
+static int ext_get_bit(const struct lrtr_ip_addr *addr, unsigned int pos)
+{
+    if (pos >= ext_addr_bits(addr))
+        return 0;
+
+    if (addr->ver == LRTR_IPV4)
+        return (addr->u.addr4.addr >> (31 - pos)) & 1;
+
+    return (addr->u.addr6.addr[pos / 32] >> (31 - (pos % 32))) & 1;
+}
+
+/* Check if the first <len> bits of a and b are equal. */
+static int ext_prefix_match(const struct lrtr_ip_addr *a,
+                            const struct lrtr_ip_addr *b,
+                            unsigned int len)
+{
+    unsigned int word;
+    uint32_t mask;
+
+    if (a->ver != b->ver)
+        return 0;
+
+    if (a->ver == LRTR_IPV4) {
+        if (len == 0)
+            return 1;
+        mask = len >= 32 ? 0xFFFFFFFFu : ~(0xFFFFFFFFu >> len);
+        return (a->u.addr4.addr & mask) == (b->u.addr4.addr & mask);
+    }
+
+    for (word = 0; word < 4 && len > 0; word++) {
+        mask = len >= 32 ? 0xFFFFFFFFu : ~(0xFFFFFFFFu >> len);
+        if ((a->u.addr6.addr[word] & mask) != (b->u.addr6.addr[word] & mask))
+            return 0;
+        len = len >= 32 ? len - 32 : 0;
+    }
+
+    return 1;
+}
+
+static struct ext_trie_node *ext_root(struct pfx_table *pfx_table,
+                                      const struct lrtr_ip_addr *prefix)
+{
+    if (prefix->ver == LRTR_IPV4)
+        return (struct ext_trie_node *)pfx_table->ipv4;
+    return (struct ext_trie_node *)pfx_table->ipv6;
+}
+
+static void ext_buf_push_node(struct ext_record_buf *buf,
+                              const struct ext_trie_node *node)
+{
+    const struct ext_node_data *data = node->data;
+    struct pfx_record *records;
+    struct pfx_record *record;
+    unsigned int i;
+    unsigned int size;
+
+    if (buf->error || !data)
+        return;
+
+    if (buf->len + data->len > buf->size) {
+        size = buf->size ? buf->size * 2 : 16;
+        while (size < buf->len + data->len)
+            size *= 2;
+
+        records = realloc(buf->records, size * sizeof(*records));
+        if (!records) {
+            buf->error = 1;
+            return;
+        }
+        buf->records = records;
+        buf->size = size;
+    }
+
+    for (i = 0; i < data->len; i++) {
+        record = &buf->records[buf->len++];
+        record->asn = data->ary[i].asn;
+        record->prefix = node->prefix;
+        record->min_len = node->len;
+        record->max_len = data->ary[i].max_len;
+        record->socket = data->ary[i].socket;
+    }
+}
+
+static int ext_buf_finish(struct ext_record_buf *buf,
+                          struct pfx_record **records,
+                          unsigned int *records_len)
+{
+    if (buf->error) {
+        free(buf->records);
+        return PFX_ERROR;
+    }
+
+    *records = buf->records;
+    *records_len = buf->len;
+    return PFX_SUCCESS;
+}
+
+/*
+ * Walk the same path through the trie that pfx_table_validate_r() takes,
+ * so exactly the records that could decide a validation are collected.
+ */
+static void ext_walk_covering(const struct ext_trie_node *node,
+                              const struct lrtr_ip_addr *prefix,
+                              uint8_t mask_len,
+                              struct ext_record_buf *buf)
+{
+    unsigned int level = 0;
+
+    while (node) {
+        if (node->len <= mask_len &&
+                ext_prefix_match(&node->prefix, prefix, node->len))
+            ext_buf_push_node(buf, node);
+
+        node = ext_get_bit(prefix, level) ? node->rchild : node->lchild;
+        level++;
+    }
+}
+
+/*
+ * Follow the path of prefix for the first mask_len levels, below that
+ * every node of the subtree may hold a more specific prefix.
+ */
+static void ext_walk_more_specific(const struct ext_trie_node *node,
+                                   const struct lrtr_ip_addr *prefix,
+                                   uint8_t mask_len,
+                                   unsigned int level,
+                                   struct ext_record_buf *buf)
+{
+    while (node) {
+        if (node->len >= mask_len &&
+                ext_prefix_match(&node->prefix, prefix, mask_len))
+            ext_buf_push_node(buf, node);
+
+        if (level >= mask_len) {
+            ext_walk_more_specific(node->lchild, prefix, mask_len, level + 1, buf);
+            node = node->rchild;
+        } else {
+            node = ext_get_bit(prefix, level) ? node->rchild : node->lchild;
+        }
+        level++;
+    }
+}
+
+static void ext_walk_all(const struct ext_trie_node *node,
+                         struct ext_record_buf *buf)
+{
+    while (node) {
+        ext_buf_push_node(buf, node);
+        ext_walk_all(node->lchild, buf);
+        node = node->rchild;
+    }
+}
+
+int pfx_table_covering(struct pfx_table *pfx_table,
+                       const struct lrtr_ip_addr *prefix,
+                       const uint8_t mask_len,
+                       struct pfx_record **records,
+                       unsigned int *records_len)
+{
+    struct ext_record_buf buf = {NULL, 0, 0, 0};
+
+    if (mask_len > ext_addr_bits(prefix))
+        return PFX_ERROR;
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    ext_walk_covering(ext_root(pfx_table, prefix), prefix, mask_len, &buf);
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    return ext_buf_finish(&buf, records, records_len);
+}
+
+int pfx_table_more_specifics(struct pfx_table *pfx_table,
+                             const struct lrtr_ip_addr *prefix,
+                             const uint8_t mask_len,
+                             struct pfx_record **records,
+                             unsigned int *records_len)
+{
+    struct ext_record_buf buf = {NULL, 0, 0, 0};
+
+    if (mask_len > ext_addr_bits(prefix))
+        return PFX_ERROR;
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    ext_walk_more_specific(ext_root(pfx_table, prefix), prefix, mask_len, 0, &buf);
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    return ext_buf_finish(&buf, records, records_len);
+}
+
+int pfx_table_snapshot(struct pfx_table *pfx_table,
+                       const bool ipv4,
+                       const bool ipv6,
+                       struct pfx_record **records,
+                       unsigned int *records_len,
+                       unsigned int *ipv4_len)
+{
+    struct ext_record_buf buf = {NULL, 0, 0, 0};
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    if (ipv4)
+        ext_walk_all((struct ext_trie_node *)pfx_table->ipv4, &buf);
+    *ipv4_len = buf.len;
+    if (ipv6)
+        ext_walk_all((struct ext_trie_node *)pfx_table->ipv6, &buf);
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    return ext_buf_finish(&buf, records, records_len);
+}
+
+#define EXT_STATE_AS_INVALID 4
+#define EXT_STATE_LENGTH_INVALID 8
+
+/* A path through the trie has at most one node per bit of an address. */
+#define EXT_MAX_PATH 129
+
+/*
+ * Same walk as pfx_table_validate(), collects the nodes on the path of
+ * prefix whose records cover it into nodes and returns their number.
+ */
+static unsigned int ext_covering_nodes(const struct ext_trie_node *node,
+                                       const struct lrtr_ip_addr *prefix,
+                                       uint8_t mask_len,
+                                       const struct ext_trie_node **nodes)
+{
+    unsigned int level = 0;
+    unsigned int count = 0;
+
+    while (node) {
+        if (node->len <= mask_len &&
+                ext_prefix_match(&node->prefix, prefix, node->len))
+            nodes[count++] = node;
+
+        node = ext_get_bit(prefix, level) ? node->rchild : node->lchild;
+        level++;
+    }
+
+    return count;
+}
+
+/*
+ * Same matching rule as pfx_table_validate() for the covering nodes of a
+ * route. Additionally the records of an invalid route are checked for a
+ * different asn and a too long prefix, like Reason.as_invalid and
+ * length_invalid.
+ */
+static uint8_t ext_origin_state(const struct ext_trie_node **nodes,
+                                unsigned int count,
+                                uint32_t asn,
+                                uint8_t mask_len)
+{
+    const struct ext_node_data *data;
+    const struct ext_data_elem *elem;
+    unsigned int n;
+    unsigned int i;
+    uint8_t flags = 0;
+    int found = 0;
+
+    for (n = 0; n < count; n++) {
+        data = nodes[n]->data;
+        for (i = 0; i < data->len; i++) {
+            elem = &data->ary[i];
+            if (elem->asn != 0 && elem->asn == asn && mask_len <= elem->max_len)
+                return BGP_PFXV_STATE_VALID;
+
+            found = 1;
+            if (elem->asn != asn)
+                flags |= EXT_STATE_AS_INVALID;
+            if (mask_len > elem->max_len)
+                flags |= EXT_STATE_LENGTH_INVALID;
+        }
+    }
+
+    return found ? BGP_PFXV_STATE_INVALID | flags : BGP_PFXV_STATE_NOT_FOUND;
+}
+
+static uint8_t ext_validate(const struct ext_trie_node *node,
+                            uint32_t asn,
+                            const struct lrtr_ip_addr *prefix,
+                            uint8_t mask_len)
+{
+    const struct ext_trie_node *nodes[EXT_MAX_PATH];
+    unsigned int count;
+
+    count = ext_covering_nodes(node, prefix, mask_len, nodes);
+    return ext_origin_state(nodes, count, asn, mask_len);
+}
+
+int pfx_table_validate_batch(struct pfx_table *pfx_table,
+                             const uint32_t *asns,
+                             const struct lrtr_ip_addr *prefixes,
+                             const uint8_t *mask_lens,
+                             const unsigned int len,
+                             uint8_t *results,
+                             const uint8_t code_mask)
+{
+    unsigned int i;
+
+    for (i = 0; i < len; i++) {
+        if (mask_lens[i] > ext_addr_bits(&prefixes[i]))
+            return PFX_ERROR;
+    }
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    for (i = 0; i < len; i++)
+        results[i] = ext_validate(ext_root(pfx_table, &prefixes[i]),
+                                  asns[i],
+                                  &prefixes[i],
+                                  mask_lens[i]) & code_mask;
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    return PFX_SUCCESS;
+}
+
+int pfx_table_validate_origins(struct pfx_table *pfx_table,
+                               const struct lrtr_ip_addr *prefix,
+                               const uint8_t mask_len,
+                               const uint32_t *asns,
+                               const unsigned int len,
+                               uint8_t *results,
+                               const uint8_t code_mask)
+{
+    const struct ext_trie_node *nodes[EXT_MAX_PATH];
+    unsigned int count;
+    unsigned int i;
+
+    if (mask_len > ext_addr_bits(prefix))
+        return PFX_ERROR;
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    count = ext_covering_nodes(ext_root(pfx_table, prefix), prefix, mask_len, nodes);
+    for (i = 0; i < len; i++)
+        results[i] = ext_origin_state(nodes, count, asns[i], mask_len) & code_mask;
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    return PFX_SUCCESS;
+}
+
+struct ext_route_key {
+    const struct lrtr_ip_addr *prefix;
+    uint8_t mask_len;
+    unsigned int index;
+};
+
+/* Order routes by ip version, address and mask_len, equal routes by index. */
+static int ext_compare_routes(const void *a, const void *b)
+{
+    const struct ext_route_key *x = a;
+    const struct ext_route_key *y = b;
+    unsigned int word;
+
+    if (x->prefix->ver != y->prefix->ver)
+        return x->prefix->ver < y->prefix->ver ? -1 : 1;
+
+    if (x->prefix->ver == LRTR_IPV4) {
+        if (x->prefix->u.addr4.addr != y->prefix->u.addr4.addr)
+            return x->prefix->u.addr4.addr < y->prefix->u.addr4.addr ? -1 : 1;
+    } else {
+        for (word = 0; word < 4; word++) {
+            if (x->prefix->u.addr6.addr[word] != y->prefix->u.addr6.addr[word])
+                return x->prefix->u.addr6.addr[word] < y->prefix->u.addr6.addr[word] ? -1 : 1;
+        }
+    }
+
+    if (x->mask_len != y->mask_len)
+        return x->mask_len < y->mask_len ? -1 : 1;
+    return x->index < y->index ? -1 : x->index > y->index;
+}
+
+int pfx_table_validate_grouped(struct pfx_table *pfx_table,
+                               const uint32_t *asns,
+                               const struct lrtr_ip_addr *prefixes,
+                               const uint8_t *mask_lens,
+                               const unsigned int len,
+                               uint8_t *results,
+                               const uint8_t code_mask)
+{
+    const struct ext_trie_node *nodes[EXT_MAX_PATH];
+    struct ext_route_key *keys;
+    unsigned int count = 0;
+    unsigned int i;
+
+    for (i = 0; i < len; i++) {
+        if (mask_lens[i] > ext_addr_bits(&prefixes[i]))
+            return PFX_ERROR;
+    }
+    if (len == 0)
+        return PFX_SUCCESS;
+
+    keys = malloc(sizeof(*keys) * len);
+    if (!keys)
+        return PFX_ERROR;
+    for (i = 0; i < len; i++) {
+        keys[i].prefix = &prefixes[i];
+        keys[i].mask_len = mask_lens[i];
+        keys[i].index = i;
+    }
+    qsort(keys, len, sizeof(*keys), ext_compare_routes);
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    for (i = 0; i < len; i++) {
+        /* routes of one prefix are adjacent and share the covering nodes */
+        if (i == 0 || keys[i].mask_len != keys[i - 1].mask_len ||
+                !ext_prefix_match(keys[i].prefix, keys[i - 1].prefix, keys[i].mask_len))
+            count = ext_covering_nodes(ext_root(pfx_table, keys[i].prefix),
+                                       keys[i].prefix, keys[i].mask_len, nodes);
+        results[keys[i].index] = ext_origin_state(nodes, count,
+                                                  asns[keys[i].index],
+                                                  keys[i].mask_len) & code_mask;
+    }
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    free(keys);
+    return PFX_SUCCESS;
+}
+
+static void ext_free_trie(struct ext_trie_node *node)
+{
+    struct ext_node_data *data;
+
+    while (node) {
+        struct ext_trie_node *rchild = node->rchild;
+
+        ext_free_trie(node->lchild);
+        data = node->data;
+        if (data) {
+            free(data->ary);
+            free(data);
+        }
+        free(node);
+        node = rchild;
+    }
+}
+
+static struct ext_trie_node *ext_clone_trie(const struct ext_trie_node *node,
+                                            struct ext_trie_node *parent,
+                                            int *error)
+{
+    const struct ext_node_data *data;
+    struct ext_node_data *data_copy;
+    struct ext_trie_node *copy;
+
+    if (!node || *error)
+        return NULL;
+
+    copy = calloc(1, sizeof(*copy));
+    data_copy = calloc(1, sizeof(*data_copy));
+    data = node->data;
+    if (!copy || !data_copy)
+        goto err;
+
+    data_copy->ary = malloc(data->len * sizeof(*data->ary));
+    if (!data_copy->ary && data->len)
+        goto err;
+    memcpy(data_copy->ary, data->ary, data->len * sizeof(*data->ary));
+    data_copy->len = data->len;
+
+    copy->prefix = node->prefix;
+    copy->len = node->len;
+    copy->parent = parent;
+    copy->data = data_copy;
+    copy->lchild = ext_clone_trie(node->lchild, copy, error);
+    copy->rchild = ext_clone_trie(node->rchild, copy, error);
+    return copy;
+
+err:
+    *error = 1;
+    free(data_copy);
+    free(copy);
+    return NULL;
+}
+
+int pfx_table_clone(struct pfx_table *pfx_table, struct pfx_table *copy)
+{
+    struct ext_trie_node *ipv4;
+    struct ext_trie_node *ipv6;
+    int error = 0;
+
+    pthread_rwlock_rdlock(&pfx_table->lock);
+    ipv4 = ext_clone_trie((struct ext_trie_node *)pfx_table->ipv4, NULL, &error);
+    ipv6 = ext_clone_trie((struct ext_trie_node *)pfx_table->ipv6, NULL, &error);
+    pthread_rwlock_unlock(&pfx_table->lock);
+
+    if (error) {
+        ext_free_trie(ipv4);
+        ext_free_trie(ipv6);
+        return PFX_ERROR;
+    }
+
+    pthread_rwlock_wrlock(&copy->lock);
+    copy->ipv4 = (void *)ipv4;
+    copy->ipv6 = (void *)ipv6;
+    pthread_rwlock_unlock(&copy->lock);
+
+    return PFX_SUCCESS;
+}
+
+int pfx_records_format(const struct pfx_record *records,
+                       const unsigned int len,
+                       const char **parts,
+                       const bool separate_first,
+                       char *out,
+                       const size_t out_len,
+                       unsigned int *formatted)
+{
+    char address[128];
+    size_t pos = 0;
+    unsigned int i;
+    int n;
+
+    for (i = 0; i < len; i++) {
+        const struct pfx_record *record = &records[i];
+
+        if (lrtr_ip_addr_to_str(&record->prefix, address, sizeof(address)) != 0)
+            return -1;
+
+        n = snprintf(out + pos, out_len - pos, "%s%s%u%s%s/%u%s%u%s",
+                     i > 0 || separate_first ? parts[0] : "",
+                     parts[1], record->asn,
+                     parts[2], address, record->min_len,
+                     parts[3], record->max_len,
+                     parts[4]);
+        if (n < 0)
+            return -1;
+        if ((size_t)n >= out_len - pos)
+            break;
+        pos += n;
+    }
+
+    *formatted = i;
+    return (int)pos;
+}
+
+int rtr_monotonic_time(time_t *seconds)
+{
+    struct timespec now;
+
+    if (clock_gettime(CLOCK_MONOTONIC, &now) != 0)
+        return -1;
+    *seconds = now.tv_sec;
+    return 0;
+}
@@ -42,5 +42,8 @@ setup(
         "six",
         'enum34; python_version < "3.4.0"'
     ],
+    extras_require={
+        "vector": ["numpy"],
+    },
     test_suite="tests.suite"
 )
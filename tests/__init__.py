@@ -1,10 +1,42 @@
 import unittest
 from .test_pfx_table import PfxTableTest
+from .test_dispatch import CallbackDispatcherTest
+from .test_tracing import SyncTracerTest
+from .test_session_state import SessionStateTest
+from .test_report import ValidationReportTest
+from .test_daemon import ValidationDaemonTest
+from .test_profiling import ProfilerTest
+from .test_churn import ChurnMonitorTest
+from .test_update_log import UpdateLogTest
+from .test_compaction import CompactionTest
+from .test_vector import VectorEngineTest
+from .test_prefilter import CoverageFilterTest
+from .test_sharding import ShardedPfxTableTest
+from .test_bmp import BMPCollectorTest
+from .test_overlay import WhatIfOverlayTest
+from .test_history import HistoryStoreTest
+from .test_moas import MOASValidationTest
 
 
 def suite():
     loader = unittest.TestLoader()
     s = loader.loadTestsFromTestCase(PfxTableTest)
+    s.addTests(loader.loadTestsFromTestCase(CallbackDispatcherTest))
+    s.addTests(loader.loadTestsFromTestCase(SyncTracerTest))
+    s.addTests(loader.loadTestsFromTestCase(SessionStateTest))
+    s.addTests(loader.loadTestsFromTestCase(ValidationReportTest))
+    s.addTests(loader.loadTestsFromTestCase(ValidationDaemonTest))
+    s.addTests(loader.loadTestsFromTestCase(ProfilerTest))
+    s.addTests(loader.loadTestsFromTestCase(ChurnMonitorTest))
+    s.addTests(loader.loadTestsFromTestCase(UpdateLogTest))
+    s.addTests(loader.loadTestsFromTestCase(CompactionTest))
+    s.addTests(loader.loadTestsFromTestCase(VectorEngineTest))
+    s.addTests(loader.loadTestsFromTestCase(CoverageFilterTest))
+    s.addTests(loader.loadTestsFromTestCase(ShardedPfxTableTest))
+    s.addTests(loader.loadTestsFromTestCase(BMPCollectorTest))
+    s.addTests(loader.loadTestsFromTestCase(WhatIfOverlayTest))
+    s.addTests(loader.loadTestsFromTestCase(HistoryStoreTest))
+    s.addTests(loader.loadTestsFromTestCase(MOASValidationTest))
     return s
 
 
@@ -0,0 +1,184 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_bmp
+--------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from six.moves import queue
+
+from rtrlib import PfxTable, PfxvState
+from rtrlib.bmp import (INITIATION, ROUTE_MONITORING, BMPCollector, BMPError,
+                        BMPReplayClient, encode_message, parse_update, route_monitoring)
+from rtrlib.dispatch import OverflowPolicy
+
+
+def _routes(collector, count):
+    routes = []
+    while len(routes) < count:
+        routes.extend(collector.get(timeout=5))
+    return routes
+
+
+class BMPCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pfx_table = PfxTable()
+        self.addCleanup(self.pfx_table.close)
+        self.pfx_table.add_record(10010, '110.1.0.0', 16, 24)
+        self.pfx_table.add_record(10030, '2001:db8::', 32, 48)
+
+    def test_parse_update(self):
+        """
+        - The origin is the last AS of the AS_PATH, IPv6 comes from MP_REACH
+        """
+        message = route_monitoring('192.0.2.1', 65000, [65000, 10010],
+                                   [('110.1.2.0', 24), ('2001:db8:1::', 48)])
+        origin, routes, withdrawn = parse_update(message[6 + 42:])
+
+        self.assertEqual(origin, 10010)
+        self.assertEqual([(version, mask_len) for version, _, mask_len in routes],
+                         [(6, 48), (4, 24)])
+        self.assertEqual(withdrawn, 0)
+        self.assertEqual(parse_update(route_monitoring('192.0.2.1', 65000, [], [])[48:],
+                                      peer_asn=65000)[0], 65000)
+        self.assertRaises(BMPError, parse_update, b'\xff' * 16 + struct.pack('!HB', 23, 4))
+
+    def test_malformed(self):
+        """
+        - Truncated and inconsistent UPDATEs raise BMPError and count as errors
+        """
+        message = route_monitoring('192.0.2.1', 65000, [65000, 10010],
+                                   [('110.1.2.0', 24), ('2001:db8:1::', 48)])
+        update = message[6 + 42:]
+
+        for size in range(len(update)):
+            truncated = bytearray(update[:size])
+            if size >= 18:
+                truncated[16:18] = struct.pack('!H', size)
+            try:
+                parse_update(bytes(truncated))
+            except BMPError:
+                pass
+
+        def patched(offset, value):
+            data = bytearray(update)
+            data[offset:offset + 2] = struct.pack('!H', value)
+            return bytes(data)
+
+        attributes_len = struct.unpack_from('!H', update, 21)[0]
+        # the last attribute would overrun into the NLRI
+        self.assertRaises(BMPError, parse_update, patched(21, attributes_len - 1))
+        self.assertRaises(BMPError, parse_update, patched(19, 0xffff))
+        self.assertRaises(BMPError, parse_update, patched(16, 10))
+
+        collector = BMPCollector(self.pfx_table, flush_interval=0.01)
+        collector.start()
+        self.addCleanup(collector.stop)
+        with BMPReplayClient(*collector.address, timeout=5) as client:
+            client.send([encode_message(ROUTE_MONITORING, message[6:-1]),
+                         encode_message(ROUTE_MONITORING,
+                                        message[6:6 + 42] + patched(21, attributes_len - 1)),
+                         route_monitoring('192.0.2.1', 65000, [65000, 10010],
+                                          [('110.1.2.0', 24)])])
+        self.assertEqual([route.prefix for route in _routes(collector, 1)], ['110.1.2.0'])
+        stats = collector.stats()
+        self.assertEqual((stats['messages'], stats['errors']), (3, 2))
+
+    def test_collector(self):
+        """
+        - Announcements of several routers are validated and annotated
+        """
+        collector = BMPCollector(self.pfx_table, batch_size=2, flush_interval=0.01)
+        collector.start()
+        self.addCleanup(collector.stop)
+
+        with BMPReplayClient(*collector.address, timeout=5) as client:
+            client.send([encode_message(INITIATION, b''),
+                         route_monitoring('192.0.2.1', 65001, [65001, 10010],
+                                          [('110.1.2.0', 24), ('110.1.2.0', 25)],
+                                          timestamp=1500000000.5),
+                         route_monitoring('2001:db8::1', 65002, [65002, 10020],
+                                          [('2001:db8:1::', 48), ('2001:db9::', 32)])])
+        routes = _routes(collector, 4)
+
+        by_prefix = dict(((route.prefix, route.mask_len), route) for route in routes)
+        self.assertEqual(by_prefix[('110.1.2.0', 24)].state, PfxvState.valid)
+        self.assertEqual(by_prefix[('110.1.2.0', 25)].state, PfxvState.invalid)
+        self.assertEqual(by_prefix[('2001:db8:1::', 48)].state, PfxvState.invalid)
+        self.assertEqual(by_prefix[('2001:db9::', 32)].state, PfxvState.not_found)
+
+        route = by_prefix[('110.1.2.0', 24)]
+        self.assertEqual((route.peer_address, route.peer_asn, route.origin, route.timestamp),
+                         ('192.0.2.1', 65001, 10010, 1500000000.5))
+        self.assertEqual(by_prefix[('2001:db9::', 32)].peer_address, '2001:db8::1')
+
+        stats = collector.stats()
+        self.assertEqual((stats['messages'], stats['route_monitoring'], stats['validated']),
+                         (3, 2, 4))
+
+    def test_replay_file(self):
+        """
+        - A capture is replayed, a full result queue drops the oldest batch
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'capture.bmp')
+        with open(path, 'wb') as capture:
+            for i in range(10):
+                capture.write(route_monitoring('192.0.2.1', 65001, [10010],
+                                               [('110.1.%d.0' % i, 24)]))
+
+        collector = BMPCollector(self.pfx_table, batch_size=1, maxsize=2,
+                                 overflow=OverflowPolicy.drop_oldest)
+        collector.start()
+        with BMPReplayClient(*collector.address) as client:
+            self.assertEqual(client.replay_file(path), 10)
+        # wait until the collector read the connection
+        while collector.stats()['validated'] < 10:
+            time.sleep(0.01)
+        collector.stop()
+
+        self.assertEqual(collector.stats()['dropped'], 8)
+        self.assertEqual([route.prefix for route in _routes(collector, 2)],
+                         ['110.1.8.0', '110.1.9.0'])
+        self.assertRaises(queue.Empty, collector.get, 0)
+
+    def test_stop_unconsumed(self):
+        """
+        - A blocking collector stops although nobody consumes its results
+        """
+        collector = BMPCollector(self.pfx_table, batch_size=1, maxsize=2,
+                                 flush_interval=0.01)
+        collector.start()
+        with BMPReplayClient(*collector.address) as client:
+            client.send([route_monitoring('192.0.2.1', 65001, [10010],
+                                          [('110.1.%d.0' % i, 24)]) for i in range(10)])
+        # two batches fill the result queue, the worker blocks on the third
+        while collector.stats()['validated'] < 3:
+            time.sleep(0.01)
+
+        stopper = threading.Thread(target=collector.stop)
+        stopper.daemon = True
+        stopper.start()
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+
+        stats = collector.stats()
+        self.assertEqual(stats['dropped'], stats['validated'] - 2)
+        self.assertEqual(len(_routes(collector, 2)), 2)
+        self.assertRaises(queue.Empty, collector.get, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
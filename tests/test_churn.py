@@ -0,0 +1,104 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_churn
+----------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+from _rtrlib import ffi
+
+from rtrlib.churn import ChurnMonitor, CountMinSketch
+from rtrlib.records import PFXRecord, create_pfx_record
+from rtrlib.rtr_socket import RTRSocket, RTRSocketState
+
+
+class ChurnMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.alerts = []
+        self.monitor = ChurnMonitor(window=10,
+                                    resolution=5,
+                                    top_k=3,
+                                    storm_rate=5,
+                                    origin_storm_rate=2,
+                                    alert_callback=lambda *alert: self.alerts.append(alert),
+                                    clock=lambda: self.now)
+        self.socket = ffi.new('struct rtr_socket *')
+
+    def _state(self, state):
+        self.socket.state = state.value
+        self.monitor.status_update(None, None, RTRSocket(self.socket))
+
+    def _update(self, asn, added=True, count=1):
+        record = create_pfx_record(asn, '110.1.0.0', 20, 24, self.socket)
+        for _ in range(count):
+            self.monitor.pfx_update(PFXRecord(record), added)
+
+    def test_rates(self):
+        """
+        - Count adds and removes per socket and origin in a sliding window
+        """
+        self._state(RTRSocketState.RESET)
+        self._update(1, count=100)
+        self._state(RTRSocketState.SYNC)
+        self._update(1, count=100)
+        self._state(RTRSocketState.ESTABLISHED)
+
+        self._update(10, count=30)
+        self._update(20, added=False, count=10)
+        self._update(30)
+
+        self.assertEqual(self.monitor.rates(), {'adds': 3.1, 'removes': 1.0, 'resync': 20.0})
+        self.assertEqual(list(self.monitor.socket_rates().values()),
+                         [{'adds': 3.1, 'removes': 1.0}])
+        self.assertEqual(self.monitor.origin_rate(10), 3.0)
+        self.assertEqual(self.monitor.top_origins(2), [(10, 3.0), (20, 1.0)])
+
+        self.now += 6
+        self._update(20, added=False, count=10)
+        self.assertEqual(self.monitor.origin_rate(20), 2.0)
+
+        self.now += 6
+        self.assertEqual(self.monitor.rates(), {'adds': 0.0, 'removes': 1.0, 'resync': 0.0})
+        self.assertEqual(self.monitor.origin_rate(10), 0.0)
+        self.assertEqual(self.monitor.top_origins(), [(20, 1.0)])
+
+    def test_alerts(self):
+        """
+        - Alert once when a rate exceeds its threshold
+        """
+        self._update(10, count=30)
+        self._update(20, count=30)
+
+        self.assertEqual(self.alerts, [('origin', 10, 2.1), ('global', None, 5.1),
+                                       ('origin', 20, 2.1)])
+        self.assertEqual(self.monitor.alerts(), [('global', None), ('origin', 10),
+                                                 ('origin', 20)])
+
+        self.now += 20
+        self.assertEqual(self.monitor.alerts(), [])
+
+    def test_count_min_sketch(self):
+        """
+        - Estimates are upper bounds in fixed memory
+        """
+        sketch = CountMinSketch(width=16, depth=3)
+        for key in range(100):
+            sketch.add(key, key)
+        for key in range(100):
+            self.assertTrue(sketch.estimate(key) >= key)
+
+        other = CountMinSketch(width=16, depth=3)
+        other.add(99, 99)
+        sketch.subtract(other)
+        sketch.clear()
+        self.assertEqual(sketch.estimate(99), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_compaction
+---------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+from rtrlib import PfxTable
+from rtrlib.compaction import analyze, compact, probe_routes, verify
+
+
+class CompactionTest(unittest.TestCase):
+
+    KEPT = [
+        (10010, '110.1.0.0', 16, 24),
+        (10020, '110.1.3.0', 24, 24),
+        (10010, '110.2.0.0', 24, 28),
+        (10010, '110.1.4.0', 24, 25),
+        (10030, '130::', 32, 64),
+    ]
+
+    REDUNDANT = [
+        ((10010, '110.1.2.0', 24, 24), (10010, '110.1.0.0', 16, 24)),
+        ((10010, '110.1.0.0', 16, 20), (10010, '110.1.0.0', 16, 24)),
+        ((10030, '130::', 48, 48), (10030, '130::', 32, 64)),
+    ]
+
+    def setUp(self):
+        self.table = PfxTable()
+        for record in self.KEPT + [record for record, _ in self.REDUNDANT]:
+            self.table.add_record(*record)
+
+    def tearDown(self):
+        self.table.close()
+
+    def test_analyze(self):
+        """
+        - Find records covered by a record of the same asn with a longer max_len
+        """
+        report = analyze(self.table.snapshot())
+
+        self.assertEqual(sorted(report.redundant), sorted(self.REDUNDANT))
+        self.assertEqual(sorted(report.kept), sorted(self.KEPT))
+        self.assertEqual((report.nodes_before, report.nodes_after), (7, 5))
+        self.assertTrue(report.bytes_after < report.bytes_before)
+
+    def test_compact(self):
+        """
+        - The minimal table validates all probe routes like the table
+        """
+        minimal, report = compact(self.table)
+
+        self.assertEqual(report.mismatches, [])
+        self.assertEqual(report.as_dict()['records_after'], len(self.KEPT))
+        self.assertEqual(len(list(minimal.snapshot())), len(self.KEPT))
+
+        broken = PfxTable()
+        broken.reload(self.KEPT[1:])
+        mismatches, _, _ = verify(self.table.pfx_table, broken.pfx_table,
+                                  probe_routes(self.KEPT))
+        self.assertEqual(mismatches[0], ((10010, '110.1.0.0', 16), 0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_daemon
+-----------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from rtrlib import PfxTable
+from rtrlib.daemon import ValidationClient, ValidationServer
+from rtrlib.exceptions import IpConversionException, PFXException
+from rtrlib.rtr_manager import PfxvState
+
+
+class ValidationDaemonTest(unittest.TestCase):
+
+    RECORDS = [
+        (10010, '110.1.0.0', 20, 24),
+        (10020, '120.1.0.0', 20, 32),
+        (10030, '130::', 64, 64)
+    ]
+
+    def setUp(self):
+        self.pfx_table = PfxTable()
+        for record in self.RECORDS:
+            self.pfx_table.add_record(*record)
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = ValidationServer(self.pfx_table, os.path.join(self.tmp_dir, 'sock'))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = ValidationClient(self.server.path, timeout=5, window=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        shutil.rmtree(self.tmp_dir)
+        self.pfx_table.close()
+
+    def test_validate(self):
+        """
+        - Validate single routes through the daemon
+        """
+        self.assertEqual(self.client.validate(10010, '110.1.0.0', 20).state, PfxvState.valid)
+        self.assertEqual(self.client.validate(10011, '110.1.0.0', 20).state, PfxvState.invalid)
+        self.assertEqual(self.client.validate(10030, '130::', 62).state, PfxvState.not_found)
+
+    def test_validate_many(self):
+        """
+        - Validate more routes than fit into the request window
+        """
+        routes = [(10010, '110.1.0.0', 24), (10010, '110.1.0.0', 30),
+                  (10030, '130::', 64), (10020, '140.1.0.0', 24)] * 10
+        results = self.client.validate_many(routes, batch_size=3)
+
+        self.assertEqual([r.state for r in results],
+                         [self.pfx_table.validate(*route).state for route in routes])
+
+    def test_rejected(self):
+        """
+        - A rejected request does not break the connection
+        """
+        self.assertRaises(PFXException, self.client.validate_many,
+                          [(10010, '110.1.0.0', 20), (10010, '110.1.0.0', 40)] * 5,
+                          batch_size=2)
+        self.assertTrue(self.client.validate(10010, '110.1.0.0', 20).is_valid)
+
+    def test_invalid_route(self):
+        """
+        - An invalid route in a later batch leaves no response unread
+        """
+        routes = [(10010, '110.1.0.0', 20)] * 5 + [(10010, '110.1.0', 20)]
+        self.assertRaises(IpConversionException, self.client.validate_many, routes,
+                          batch_size=2)
+        self.assertRaises(TypeError, self.client.validate_many,
+                          routes[:5] + [('10010', '110.1.0.0', 20)], batch_size=2)
+        self.assertEqual(self.client.validate(10011, '110.1.0.0', 20).state,
+                         PfxvState.invalid)
+
+    def test_socket_path(self):
+        """
+        - Only the socket file of a server that is gone is replaced
+        """
+        self.assertRaises(OSError, ValidationServer, self.pfx_table, self.server.path)
+        self.assertTrue(self.client.validate(10010, '110.1.0.0', 20).is_valid)
+
+        path = os.path.join(self.tmp_dir, 'file')
+        with open(path, 'w') as other:
+            other.write('data')
+        self.assertRaises(OSError, ValidationServer, self.pfx_table, path)
+        self.assertTrue(os.path.isfile(path))
+
+        path = os.path.join(self.tmp_dir, 'stale')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = ValidationServer(self.pfx_table, path)
+        server.close()
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
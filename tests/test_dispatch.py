@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_dispatch
+-------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+import unittest
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from rtrlib.dispatch import CallbackDispatcher, OverflowPolicy
+
+
+class CallbackDispatcherTest(unittest.TestCase):
+
+    def test_order(self):
+        """
+        - Callbacks run on the worker thread in submission order
+        """
+        calls = []
+        dispatcher = CallbackDispatcher()
+        dispatcher.start()
+        for i in range(100):
+            dispatcher.submit(lambda i: calls.append((i, threading.current_thread())), i)
+        dispatcher.stop()
+
+        self.assertEqual([i for i, _ in calls], list(range(100)))
+        self.assertTrue(all(t is not threading.current_thread() for _, t in calls))
+        self.assertEqual(dispatcher.stats()['processed'], 100)
+
+    def test_drop_new(self):
+        """
+        - Callbacks are discarded while the queue is full
+        """
+        calls = []
+        dispatcher = CallbackDispatcher(maxsize=5, overflow=OverflowPolicy.drop_new)
+        for i in range(8):
+            dispatcher.submit(calls.append, i)
+        dispatcher.start()
+        dispatcher.stop()
+
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        stats = dispatcher.stats()
+        self.assertEqual(stats['dropped'], 3)
+        self.assertEqual(stats['max_depth'], 5)
+
+    def test_drop_oldest(self):
+        """
+        - The oldest callbacks are discarded while the queue is full
+        """
+        calls = []
+        dispatcher = CallbackDispatcher(maxsize=5, overflow=OverflowPolicy.drop_oldest)
+        for i in range(8):
+            dispatcher.submit(calls.append, i)
+        dispatcher.start()
+        dispatcher.stop()
+
+        self.assertEqual(calls, [3, 4, 5, 6, 7])
+        self.assertEqual(dispatcher.stats()['dropped'], 3)
+
+    def test_failing_callback(self):
+        """
+        - An exception in a callback does not stop the worker
+        """
+        calls = []
+        dispatcher = CallbackDispatcher()
+        dispatcher.start()
+        dispatcher.submit(lambda: 1 / 0)
+        dispatcher.submit(calls.append, 1)
+        dispatcher.stop()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    @unittest.skipIf(ThreadPoolExecutor is None, "concurrent.futures is not available")
+    def test_executor(self):
+        """
+        - Callbacks run by an executor are counted when they are done
+        - Stopping waits for the callbacks handed to the executor
+        """
+        calls = []
+
+        def slow(value):
+            time.sleep(0.2)
+            calls.append(value)
+
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        dispatcher = CallbackDispatcher(executor=executor)
+        dispatcher.start()
+        dispatcher.submit(lambda: 1 / 0)
+        dispatcher.submit(slow, 1)
+        dispatcher.stop()
+
+        self.assertEqual(calls, [1])
+        stats = dispatcher.stats()
+        self.assertEqual((stats['processed'], stats['failed']), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
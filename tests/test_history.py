@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_history
+------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+import random
+import shutil
+import socket
+import struct
+import tempfile
+
+from _rtrlib import lib
+
+from rtrlib import PfxTable, RTRManager
+from rtrlib.history import HistoryStore
+from rtrlib.records import PFXRecord, create_pfx_record
+from rtrlib.update_log import UpdateLogWriter
+
+
+def _record(rnd):
+    if rnd.random() < 0.2:
+        length = rnd.choice([32, 40, 48])
+        value = (0x20010db8 << 96 | rnd.getrandbits(16) << 80) >> (128 - length) << (128 - length)
+        prefix = socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', value >> 64,
+                                                               value & (2 ** 64 - 1)))
+        return rnd.randint(0, 3), prefix, length, length + rnd.choice([0, 8])
+    length = rnd.choice([8, 12, 16, 20, 24])
+    value = (0x6E000000 | rnd.getrandbits(16) << 8) >> (32 - length) << (32 - length)
+    return (rnd.randint(0, 3), socket.inet_ntoa(struct.pack('!I', value)),
+            length, length + rnd.choice([0, 4]))
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def test_validate_at(self):
+        """
+        - Past states match a table that saw the updates up to that time
+        """
+        rnd = random.Random(0)
+        history = HistoryStore(checkpoint_every=40)
+        present = []
+        states = []
+
+        for step in range(600):
+            if present and rnd.random() < 0.45:
+                record = present.pop(rnd.randrange(len(present)))
+                history.add_update(step, False, *record)
+            else:
+                if present and rnd.random() < 0.1:
+                    # a second copy keeps the record after one removal
+                    record = rnd.choice(present)
+                else:
+                    record = _record(rnd)
+                present.append(record)
+                history.add_update(step, True, *record)
+            if step % 50 == 7:
+                states.append((step, sorted(set(present))))
+
+        self.assertGreater(history.stats()['checkpoints'], 3)
+        # AS0 records and routes of origin 0 are included
+        routes = [(rnd.randint(0, 3), record[1], record[3]) for record in
+                  [_record(rnd) for _ in range(100)]]
+        for step, records in states:
+            self.assertEqual(sorted(history.records_at(step)), records)
+            table = PfxTable()
+            self.addCleanup(table.close)
+            table.reload(records)
+            for route in routes:
+                self.assertEqual(history.validate_at(step, *route).state,
+                                 table.validate(*route).state, (step, route))
+            self.assertEqual(sorted(history.covering_at(step, '110.0.0.0', 24)),
+                             sorted((r.asn, r.prefix, r.min_len, r.max_len)
+                                    for r in table.covering('110.0.0.0', 24)))
+
+        self.assertEqual(history.records_at(-1), [])
+        self.assertRaises(ValueError, history.covering_at, 0, '110.0.0.0', 33)
+
+    def test_sources(self):
+        """
+        - A manager and an update log feed the history
+        """
+        now = [100.0]
+        history = HistoryStore(clock=lambda: now[0])
+        mgr = RTRManager('localhost', 8282, history=history)
+        record = create_pfx_record(10010, '110.1.0.0', 16, 24, socket=mgr.rtr_socketp[0])
+        lib.pfx_table_add(mgr.pfx_table, record)
+        now[0] = 200.0
+        lib.pfx_table_remove(mgr.pfx_table, record)
+
+        self.assertTrue(history.validate_at(150, 10010, '110.1.2.0', 24).is_valid)
+        self.assertTrue(history.validate_at(200, 10010, '110.1.2.0', 24).not_found)
+        self.assertTrue(history.validate_at(99, 10010, '110.1.2.0', 24).not_found)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'updates.log')
+        with UpdateLogWriter(path, clock=lambda: 300.0) as log:
+            log.pfx_update(PFXRecord(create_pfx_record(10020, '2001:db8::', 32, 48)), True)
+
+        self.assertEqual(history.load_update_log(path), 1)
+        self.assertTrue(history.validate_at(300, 10020, '2001:db8:1::', 48).is_valid)
+        table = history.table_at(150)
+        self.addCleanup(table.close)
+        self.assertTrue(table.validate(10010, '110.1.2.0', 24).is_valid)
+        self.assertEqual(history.stats()['deltas'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
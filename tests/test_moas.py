@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_moas
+---------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import socket
+import struct
+import unittest
+
+from _rtrlib import lib
+
+from rtrlib import PfxTable, PfxvState, RTRManager
+from rtrlib.batch import prepare_routes, validate_origins, validate_routes
+from rtrlib.exceptions import PFXException
+from rtrlib.records import create_pfx_record
+
+
+def _random_prefix(rnd, ipv6, length):
+    bits = 128 if ipv6 else 32
+    value = (rnd.getrandbits(3) << (bits - 3)) | rnd.getrandbits(bits - 3)
+    value &= ~((1 << (bits - length)) - 1)
+    if ipv6:
+        return socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', value >> 64,
+                                                             value & (2 ** 64 - 1)))
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+class MOASValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(7)
+        records = set()
+        while len(records) < 400:
+            ipv6 = rnd.random() < 0.3
+            min_len = rnd.choice([4, 8, 12, 16, 20, 24] + ([32, 48] if ipv6 else []))
+            records.add((rnd.choice([0, 1, 2, 3, 4]), _random_prefix(rnd, ipv6, min_len),
+                         min_len, min_len + rnd.choice([0, 0, 2, 8])))
+        self.table = PfxTable()
+        self.addCleanup(self.table.close)
+        self.table.reload(sorted(records))
+
+        self.prefixes = []
+        for asn, prefix, min_len, max_len in sorted(records):
+            self.prefixes.append((prefix, max_len))
+            self.prefixes.append((prefix, min(128 if ':' in prefix else 32, max_len + 1)))
+        for _ in range(500):
+            ipv6 = rnd.random() < 0.3
+            mask_len = rnd.randint(0, 64 if ipv6 else 32)
+            self.prefixes.append((_random_prefix(rnd, ipv6, mask_len), mask_len))
+        self.rnd = rnd
+
+    def test_validate_origins(self):
+        """
+        - Every origin of a prefix gets the code of its own route
+        """
+        asns = [0, 1, 2, 3, 4, 5]
+        for prefix, mask_len in self.prefixes:
+            expected = validate_routes(self.table.pfx_table,
+                                       [(asn, prefix, mask_len) for asn in asns])
+            self.assertEqual(validate_origins(self.table.pfx_table, prefix, mask_len, asns),
+                             expected, (prefix, mask_len))
+
+        results = self.table.validate_origins('10.0.0.0', 8, [1, 2])
+        self.assertEqual([result.state for result in results],
+                         [self.table.validate(asn, '10.0.0.0', 8).state for asn in (1, 2)])
+        self.assertEqual(validate_origins(self.table.pfx_table, '10.0.0.0', 8, []),
+                         bytearray())
+        self.assertRaises(PFXException, validate_origins, self.table.pfx_table,
+                          '10.0.0.0', 33, [1])
+        self.assertRaises(TypeError, validate_origins, self.table.pfx_table,
+                          '10.0.0.0', 8, ['1'])
+
+    def test_grouped(self):
+        """
+        - Grouping routes by prefix keeps the codes and their order
+        """
+        routes = []
+        for prefix, mask_len in self.prefixes:
+            for asn in self.rnd.sample(range(6), self.rnd.randint(1, 4)):
+                routes.append((asn, prefix, mask_len))
+        self.rnd.shuffle(routes)
+        prepared = prepare_routes(routes)
+
+        expected = validate_routes(self.table.pfx_table, prepared)
+        self.assertEqual(validate_routes(self.table.pfx_table, prepared, group=True),
+                         expected)
+        self.assertEqual(self.table.validate_codes(routes, flags=False, group=True),
+                         validate_routes(self.table.pfx_table, prepared, flags=False))
+        self.assertEqual(validate_routes(self.table.pfx_table, [], group=True), bytearray())
+        self.assertRaises(PFXException, validate_routes, self.table.pfx_table,
+                          [(1, '10.0.0.0', 33)], group=True)
+
+    def test_manager(self):
+        """
+        - The manager validates origins with its prefilter
+        """
+        mgr = RTRManager('localhost', 8282, prefilter=True)
+        rtr_socket = mgr.rtr_socketp[0]
+        for record in [(10010, '110.1.0.0', 16, 24), (10020, '110.1.0.0', 16, 16)]:
+            lib.pfx_table_add(mgr.pfx_table, create_pfx_record(*record, socket=rtr_socket))
+
+        results = mgr.validate_origins('110.1.2.0', 24, [10010, 10020, 10030])
+        self.assertEqual([result.state for result in results],
+                         [PfxvState.valid, PfxvState.invalid, PfxvState.invalid])
+        self.assertTrue(results[1].length_invalid)
+        self.assertEqual([result.state for result in
+                          mgr.validate_origins('120.1.0.0', 16, [10010, 10020])],
+                         [PfxvState.not_found] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_overlay
+------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+import random
+import socket
+import struct
+
+from rtrlib import PfxTable, PfxvState
+from rtrlib.overlay import RouteIndex, WhatIfOverlay
+
+
+def _ipv4(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+class WhatIfOverlayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pfx_table = PfxTable()
+        self.addCleanup(self.pfx_table.close)
+        self.pfx_table.add_record(10010, '110.1.0.0', 16, 24)
+        self.pfx_table.add_record(10020, '110.1.2.0', 24, 24)
+        self.pfx_table.add_record(10030, '2001:db8::', 32, 48)
+
+    def test_validate(self):
+        """
+        - The overlay validates with its changes, the base is unchanged
+        """
+        overlay = WhatIfOverlay(self.pfx_table)
+        overlay.remove_record(10010, '110.1.0.0', 16, 24)
+        overlay.add_record(10040, '110.1.3.0', 24, 24)
+        overlay.add_record(10050, '2001:db8::', 32, 64)
+
+        self.assertTrue(overlay.validate(10010, '110.1.1.0', 24).not_found)
+        self.assertTrue(overlay.validate(10010, '110.1.3.0', 24).is_invalid)
+        self.assertTrue(overlay.validate(10050, '2001:db8:1::', 56).is_valid)
+        self.assertTrue(self.pfx_table.validate(10010, '110.1.1.0', 24).is_valid)
+
+        overlay.add_record(10010, '110.1.0.0', 16, 24)
+        self.assertEqual(overlay.removed, [])
+        self.assertTrue(overlay.validate(10010, '110.1.1.0', 24).is_valid)
+        self.assertRaises(ValueError, overlay.add_record, 1, '110.1.0.0', 24, 16)
+
+    def test_impact(self):
+        """
+        - Only routes whose state changes are reported, like a modified copy
+        """
+        rnd = random.Random(0)
+        routes = []
+        for _ in range(2000):
+            mask_len = rnd.choice([16, 22, 24, 26])
+            address = 0x6E010000 | rnd.getrandbits(10) << 6
+            routes.append((rnd.choice([10010, 10020, 10040]),
+                           _ipv4(address >> (32 - mask_len) << (32 - mask_len)), mask_len))
+        routes.extend([(0, '110.2.1.0', 24), (10010, '110.2.1.0', 24),
+                       (10030, '2001:db8:1::', 48)])
+        index = RouteIndex(routes)
+
+        overlay = WhatIfOverlay(self.pfx_table)
+        overlay.remove_record(10020, '110.1.2.0', 24, 24)
+        overlay.add_record(10040, '110.1.0.0', 20, 26)
+        overlay.remove_record(10030, '2001:db8::', 32, 48)
+        # an AS0 record invalidates the routes it covers, also those of origin 0
+        overlay.add_record(0, '110.2.0.0', 16, 24)
+
+        changed = self.pfx_table.copy()
+        self.addCleanup(changed.close)
+        changed.reload_changes(overlay.added, overlay.removed)
+
+        expected = [(route, self.pfx_table.validate(*route).state, changed.validate(*route).state)
+                    for route in routes]
+        expected = [change for change in expected if change[1] != change[2]]
+        impact = overlay.impact(index)
+
+        self.assertTrue(expected)
+        self.assertIn(((0, '110.2.1.0', 24), PfxvState.not_found, PfxvState.invalid), expected)
+        self.assertEqual([((c.asn, c.prefix, c.mask_len), c.before, c.after) for c in impact],
+                         expected)
+        self.assertEqual(impact[-1].after, PfxvState.not_found)
+        self.assertEqual(len(overlay.impact(routes)), len(impact))
+
+        overlay.clear()
+        self.assertEqual(overlay.impact(index), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
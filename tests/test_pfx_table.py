@@ -9,7 +9,20 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
 
-from rtrlib import PfxTable
+import functools
+import gzip
+import io
+import json
+import shutil
+import tempfile
+
+from _rtrlib import lib
+
+from rtrlib import PfxTable, PfxvState, RTRManager
+from rtrlib.exceptions import IpConversionException, NotEnabledError, RoaFileError
+from rtrlib.records import create_pfx_record
+from rtrlib.roa_file import write_roa_file
+from rtrlib.rtr_manager import ValidationResult
 
 # flag constants for asserting the validation result
 VALID = 1 << 0
@@ -94,6 +107,297 @@ class PfxTableTest(unittest.TestCase):
 
         self._assert(10010, '110.1.0.0', 20, UNKNOWN)
 
+    def test_covering(self):
+        """
+        - Query records covering a prefix
+        """
+        self._fill_table(self.DEFAULT_RECORDS)
+        self._fill_table([(10040, '110.0.0.0', 8, 24),
+                          (10050, '110.1.8.0', 22, 24)])
+
+        self._assert_records(self.pfx_table.covering('110.1.8.0', 24),
+                             [(10010, '110.1.0.0', 20, 24),
+                              (10040, '110.0.0.0', 8, 24),
+                              (10050, '110.1.8.0', 22, 24)])
+        self._assert_records(self.pfx_table.covering('110.1.0.0', 16),
+                             [(10040, '110.0.0.0', 8, 24)])
+        self._assert_records(self.pfx_table.covering('130::', 64),
+                             [(10030, '130::', 64, 64)])
+        self._assert_records(self.pfx_table.covering('130::', 48), [])
+
+    def test_more_specifics(self):
+        """
+        - Query records equal to or more specific than a prefix
+        """
+        self._fill_table(self.DEFAULT_RECORDS)
+        self._fill_table([(10040, '110.0.0.0', 8, 24),
+                          (10050, '110.1.8.0', 22, 24)])
+
+        self._assert_records(self.pfx_table.more_specifics('110.0.0.0', 8),
+                             [(10010, '110.1.0.0', 20, 24),
+                              (10040, '110.0.0.0', 8, 24),
+                              (10050, '110.1.8.0', 22, 24)])
+        self._assert_records(self.pfx_table.more_specifics('110.1.8.0', 21),
+                             [(10050, '110.1.8.0', 22, 24)])
+        self._assert_records(self.pfx_table.more_specifics('0.0.0.0', 0),
+                             [(10010, '110.1.0.0', 20, 24),
+                              (10020, '120.1.0.0', 20, 32),
+                              (10040, '110.0.0.0', 8, 24),
+                              (10050, '110.1.8.0', 22, 24)])
+        self._assert_records(self.pfx_table.more_specifics('130::', 16),
+                             [(10030, '130::', 64, 64)])
+
+    def test_min_len(self):
+        """
+        - Queried records carry the prefix length of their trie node as min_len
+        """
+        records = [(10010 + i, '110.0.0.0', 8 + i, 24) for i in range(0, 16, 3)]
+        self._fill_table(records)
+
+        for queried in (self.pfx_table.covering('110.0.0.0', 24),
+                        self.pfx_table.more_specifics('110.0.0.0', 8),
+                        self.pfx_table.snapshot()):
+            self.assertEqual(sorted((r.asn, r.min_len) for r in queried),
+                             [(asn, min_len) for asn, _, min_len, _ in records])
+
+    def test_manager_queries(self):
+        """
+        - A manager queries covering and more specific records of its table
+        """
+        mgr = RTRManager('localhost', 8282)
+        for record in [(10010, '110.1.0.0', 20, 24), (10040, '110.0.0.0', 8, 24)]:
+            lib.pfx_table_add(mgr.pfx_table,
+                              create_pfx_record(*record, socket=mgr.rtr_socketp[0]))
+
+        self._assert_records(mgr.covering('110.1.8.0', 24),
+                             [(10010, '110.1.0.0', 20, 24),
+                              (10040, '110.0.0.0', 8, 24)])
+        self._assert_records(mgr.more_specifics('110.1.0.0', 16),
+                             [(10010, '110.1.0.0', 20, 24)])
+
+    def test_asn_index(self):
+        """
+        - Look up the records of an ASN in the asn index
+        """
+        pfx_table = PfxTable(asn_index=True)
+        self.addCleanup(pfx_table.close)
+
+        for record in self.DEFAULT_RECORDS + [(10010, '140.1.0.0', 16, 16)]:
+            pfx_table.add_record(*record)
+        pfx_table.add_record(*self.DEFAULT_RECORDS[0])
+        pfx_table.remove_record(10020, '120.1.0.0', 20, 32)
+
+        self._assert_records(pfx_table.records_for_asn(10010),
+                             [(10010, '110.1.0.0', 20, 24),
+                              (10010, '140.1.0.0', 16, 16)])
+        self._assert_records(pfx_table.records_for_asn(10020), [])
+
+        records = pfx_table.records_for_asns([10020, 10030])
+        self.assertEqual(sorted(records), [10020, 10030])
+        self._assert_records(records[10030], [(10030, '130::', 64, 64)])
+
+        self.assertRaises(NotEnabledError, self.pfx_table.records_for_asn, 10010)
+
+    def test_snapshot(self):
+        """
+        - Iterate over a point-in-time copy of the prefix table
+        """
+        self._fill_table(self.DEFAULT_RECORDS)
+        snapshot = self.pfx_table.snapshot()
+        self.pfx_table.remove_record(10010, '110.1.0.0', 20, 24)
+        self.pfx_table.add_record(10040, '140.1.0.0', 16, 16)
+
+        self.assertEqual(len(snapshot), 3)
+        self._assert_records(snapshot, self.DEFAULT_RECORDS)
+        self._assert_records(snapshot.ipv4_records(), self.DEFAULT_RECORDS[:2])
+        self._assert_records(snapshot.ipv6_records(), self.DEFAULT_RECORDS[2:])
+
+        self._assert_records(self.pfx_table.snapshot(ipv4=False),
+                             [(10030, '130::', 64, 64)])
+
+    def test_reload(self):
+        """
+        - Replace the content of the table and copy it
+        """
+        pfx_table = PfxTable(asn_index=True)
+        self.addCleanup(pfx_table.close)
+        pfx_table.reload(self.DEFAULT_RECORDS)
+        copy = pfx_table.copy()
+        self.addCleanup(copy.close)
+
+        pfx_table.reload_changes(added=[(10040, '140.1.0.0', 16, 16)],
+                                 removed=[self.DEFAULT_RECORDS[0]])
+        self._assert_records(pfx_table.snapshot(),
+                             self.DEFAULT_RECORDS[1:] + [(10040, '140.1.0.0', 16, 16)])
+        self._assert_records(pfx_table.records_for_asn(10040), [(10040, '140.1.0.0', 16, 16)])
+        self._assert_records(pfx_table.records_for_asn(10010), [])
+
+        self._assert_records(copy.snapshot(), self.DEFAULT_RECORDS)
+        self._assert_records(copy.records_for_asn(10010), self.DEFAULT_RECORDS[:1])
+        self.assertTrue(copy.validate(10010, '110.1.0.0', 24).is_valid)
+
+        self.assertRaises(IpConversionException, pfx_table.reload,
+                          [(10040, '140.1.0.0', 16, 16), (10050, '150.1.0', 16, 16)])
+        self._assert_records(pfx_table.snapshot(),
+                             self.DEFAULT_RECORDS[1:] + [(10040, '140.1.0.0', 16, 16)])
+        self.assertRaises(IpConversionException, pfx_table.add_record,
+                          10050, '150.1.0', 16, 16)
+
+        pfx_table.reload([])
+        self.assertEqual(len(pfx_table.snapshot()), 0)
+
+    def test_load_roa_file(self):
+        """
+        - Load the ROAs of JSON and CSV exports
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        roas = [{'asn': 'AS10010', 'prefix': '110.1.0.0/20', 'maxLength': 24},
+                {'asn': 10030, 'prefix': '130::/64', 'maxLength': 64}]
+        expected = [(10010, '110.1.0.0', 20, 24), (10030, '130::', 64, 64)]
+
+        json_path = os.path.join(tmp_dir, 'roas.json')
+        with open(json_path, 'w') as roa_file:
+            json.dump({'metadata': {}, 'roas': roas}, roa_file)
+        self.pfx_table.load_roa_file(json_path)
+        self._assert_records(self.pfx_table.snapshot(), expected)
+
+        csv_path = os.path.join(tmp_dir, 'roas.csv')
+        with open(csv_path, 'w') as roa_file:
+            roa_file.write('ASN,IP Prefix,Max Length,Trust Anchor\n'
+                           'AS10020,120.1.0.0/20,32,ripe\n')
+        self.pfx_table.load_roa_file(csv_path)
+        self._assert_records(self.pfx_table.snapshot(), [(10020, '120.1.0.0', 20, 32)])
+
+        for content in [{'roas': [{'asn': 10010, 'prefix': '110.1.0.0/20'}]},
+                        {'roas': [{'asn': 10010, 'prefix': 20, 'maxLength': 24}]},
+                        {'roas': [None]}, {'roas': 1}, {'metadata': {}},
+                        {'roas': roas + [{'asn': 10040, 'prefix': '140.1.x.0/24',
+                                          'maxLength': 24}]}]:
+            with open(json_path, 'w') as roa_file:
+                json.dump(content, roa_file)
+            self.assertRaises(RoaFileError, self.pfx_table.load_roa_file, json_path)
+        self._assert_records(self.pfx_table.snapshot(), [(10020, '120.1.0.0', 20, 32)])
+
+    def test_export(self):
+        """
+        - Write JSON and CSV exports that load into the same records
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        records = self.DEFAULT_RECORDS + [(10040 + i, '140.1.{}.0'.format(i), 24, 24)
+                                          for i in range(50)]
+        self._fill_table(records)
+
+        for file_format in ('json', 'csv'):
+            path = os.path.join(tmp_dir, 'roas.' + file_format)
+            self.assertEqual(self.pfx_table.export(path, format=file_format), len(records))
+            copy = PfxTable()
+            self.addCleanup(copy.close)
+            copy.load_roa_file(path)
+            self._assert_records(copy.snapshot(), records)
+
+        with open(os.path.join(tmp_dir, 'roas.json')) as roa_file:
+            self.assertEqual(json.load(roa_file)['roas'][0]['ta'], 'rtr')
+
+        # chunks of a few records
+        out = io.BytesIO()
+        write_roa_file(self.pfx_table.pfx_table, out, 'csv', trust_anchor='a,b',
+                       chunk_size=100)
+        lines = out.getvalue().decode('utf8').splitlines()
+        self.assertEqual(len(lines), len(records) + 1)
+        self.assertTrue(lines[1].endswith(',"a,b"'))
+
+        out = io.BytesIO()
+        self.pfx_table.export(out, compression='gzip')
+        roas = json.loads(gzip.GzipFile(fileobj=io.BytesIO(out.getvalue())).read().decode('utf8'))
+        self.assertEqual(len(roas['roas']), len(records))
+
+        self.assertRaises(ValueError, self.pfx_table.export, out, format='xml')
+        self.assertRaises(ValueError, self.pfx_table.export, out, compression='lz4')
+        self.assertRaises(ValueError, write_roa_file, self.pfx_table.pfx_table, out,
+                          chunk_size=10)
+
+    def test_lazy_reason(self):
+        """
+        - Look up the reasons of a result when they are first accessed
+        """
+        self._fill_table(self.DEFAULT_RECORDS)
+        calls = []
+
+        def explain(*route):
+            calls.append(route)
+            return self.pfx_table.validate_r(*route)
+
+        route = (10011, '110.1.0.0', 30)
+        state = self.pfx_table.validate(*route).state.value
+        result = ValidationResult(route[1], route[2], route[0], state,
+                                  explain=functools.partial(explain, *route))
+
+        self.assertTrue(result.is_invalid)
+        self.assertEqual(calls, [])
+        self.assertTrue(result.as_invalid)
+        self.assertTrue(result.length_invalid)
+        self._assert_records([reason.record for reason in result.reason],
+                             [(10010, '110.1.0.0', 20, 24)])
+        self.assertEqual(calls, [route])
+
+    def test_manager_lazy_reason(self):
+        """
+        - Manager results look up their reasons with explain on access
+        """
+        mgr = RTRManager('localhost', 8282)
+
+        def add(*record):
+            lib.pfx_table_add(mgr.pfx_table,
+                              create_pfx_record(*record, socket=mgr.rtr_socketp[0]))
+
+        add(10010, '110.1.0.0', 20, 24)
+        result = mgr.validate(10011, '110.1.0.0', 30)
+        results = mgr.validate_origins('110.1.0.0', 30, [10010, 10011])
+        # reasons reflect the table when they are first accessed
+        add(10020, '110.0.0.0', 8, 16)
+
+        expected = [(10010, '110.1.0.0', 20, 24), (10020, '110.0.0.0', 8, 16)]
+        for asn, lazy in [(10011, result)] + list(zip([10010, 10011], results)):
+            self.assertTrue(lazy.is_invalid)
+            self.assertTrue(lazy.length_invalid)
+            explained = mgr.explain(asn, '110.1.0.0', 30)
+            self.assertEqual(lazy.as_invalid, explained.as_invalid)
+            self._assert_records([reason.record for reason in lazy.reason],
+                                 [(reason.record.asn, reason.record.prefix,
+                                   reason.record.min_len, reason.record.max_len)
+                                  for reason in explained.reason])
+            self._assert_records([reason.record for reason in lazy.reason], expected)
+
+    def test_validator(self):
+        """
+        - Validate with a reusable handle that follows reloads
+        """
+        self._fill_table(self.DEFAULT_RECORDS)
+        validator = self.pfx_table.validator()
+
+        for route in [(10010, '110.1.0.0', 20), (10010, '110.1.0.0', 30),
+                      (10030, '130::', 64), (10030, '130::', 65),
+                      (10040, '140.1.0.0', 24)]:
+            self.assertEqual(validator.validate(*route),
+                             self.pfx_table.validate(*route).state)
+        self.assertEqual(validator.validate(10010, b'110.1.0.0', 30), PfxvState.invalid)
+
+        self.pfx_table.reload([(10040, '140.1.0.0', 24, 24)])
+        self.assertEqual(validator.validate(10040, '140.1.0.0', 24), PfxvState.valid)
+
+        with self.assertRaises(IpConversionException):
+            validator.validate(10010, '110.1.0', 20)
+
+    def _assert_records(self, act_records, exp_records):
+        """
+        Compare a list of PFXRecords with a list of record tuples
+        regardless of order
+        """
+        act = sorted((r.asn, r.prefix, r.min_len, r.max_len) for r in act_records)
+        self.assertEqual(act, sorted(exp_records))
+
     def _fill_table(self, records):
         """
         Adds a list of record tuples to the prefix talbe.
@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_prefilter
+--------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+import random
+import socket
+import struct
+
+from rtrlib import PfxTable, PfxvState
+from rtrlib.prefilter import CoverageFilter
+from rtrlib.records import PFXRecord, create_pfx_record
+
+
+def _ipv4(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+class CoverageFilterTest(unittest.TestCase):
+
+    def test_updates(self):
+        """
+        - Blocks stay covered until the last record covering them is removed
+        """
+        rnd = random.Random(0)
+        prefilter = CoverageFilter()
+        present = []
+
+        for _ in range(400):
+            if present and rnd.random() < 0.4:
+                network, length = present.pop(rnd.randrange(len(present)))
+                added = False
+            else:
+                length = rnd.choice([8, 12, 16, 20, 22, 24, 28, 32])
+                network = rnd.getrandbits(8) << 24 | rnd.getrandbits(4) << 20
+                network &= ~((1 << (32 - length)) - 1) & 0xFFFFFFFF
+                present.append((network, length))
+                added = True
+            record = create_pfx_record(10010, _ipv4(network), length, 32)
+            prefilter.update(PFXRecord(record), added)
+
+            for _ in range(20):
+                address = rnd.getrandbits(8) << 24 | rnd.getrandbits(24)
+                # a /24 block is covered by or contains the record
+                expected = any(address >> (32 - min(length, 24)) ==
+                               network >> (32 - min(length, 24))
+                               for network, length in present)
+                self.assertEqual(prefilter.may_cover(_ipv4(address)), expected)
+
+    def test_ipv6(self):
+        """
+        - IPv6 blocks are covered by shorter records and contain longer ones
+        """
+        for block in (32, 48):
+            prefilter = CoverageFilter(ipv6_block=block)
+            for record in [(1, '2001:db8::', 32, 48), (2, '2a00:1:2:3::', 64, 64)]:
+                prefilter.update(PFXRecord(create_pfx_record(*record)), True)
+
+            self.assertTrue(prefilter.may_cover('2001:db8:ffff::'))
+            self.assertTrue(prefilter.may_cover('2a00:1:2:ffff::'))
+            self.assertEqual(prefilter.may_cover('2a00:1:3::'), block == 32)
+            self.assertFalse(prefilter.may_cover('2001:db9::'))
+
+        self.assertRaises(ValueError, CoverageFilter, 40)
+
+    def test_pfx_table(self):
+        """
+        - Filtered routes are not found, the others are validated by rtrlib
+        """
+        pfx_table = PfxTable(prefilter=True)
+        self.addCleanup(pfx_table.close)
+        pfx_table.add_record(10010, '110.1.0.0', 20, 24)
+        pfx_table.add_record(10030, '130::', 64, 64)
+
+        self.assertTrue(pfx_table.validate(10010, '110.1.0.0', 24).is_valid)
+        self.assertTrue(pfx_table.validate(10010, '110.1.0.0', 28).is_invalid)
+        self.assertTrue(pfx_table.validate(10010, '110.2.0.0', 24).not_found)
+        self.assertTrue(pfx_table.validate_r(10030, '131::', 64).not_found)
+        self.assertEqual(pfx_table.validator(prefilter=True).validate(10010, b'110.3.0.0', 24),
+                         PfxvState.not_found)
+        # the prefilter is opt-in for a validator
+        self.assertEqual(pfx_table.validator().validate(10010, b'110.4.0.0', 24),
+                         PfxvState.not_found)
+        self.assertEqual(pfx_table.prefilter.stats(),
+                         {'lookups': 5, 'filtered': 3, 'hit_rate': 0.6})
+
+        pfx_table.remove_record(10010, '110.1.0.0', 20, 24)
+        self.assertFalse(pfx_table.prefilter.may_cover('110.1.0.0'))
+
+        pfx_table.reload([(10040, '140.1.0.0', 16, 16)])
+        self.assertTrue(pfx_table.validate(10040, '140.1.2.0', 24).is_invalid)
+        self.assertEqual(pfx_table.prefilter.lookups, 6)
+
+        copy = pfx_table.copy()
+        self.addCleanup(copy.close)
+        self.assertTrue(copy.prefilter.may_cover('140.1.0.0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_profiling
+--------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+from rtrlib import PfxTable, profiling
+from rtrlib.profiling import Profiler, compare_reports
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pfx_table = PfxTable()
+        self.pfx_table.add_record(10010, '110.1.0.0', 20, 24)
+
+    def tearDown(self):
+        self.pfx_table.close()
+
+    def test_phases(self):
+        """
+        - Split sampled calls into phases
+        """
+        with Profiler() as profiler:
+            for _ in range(10):
+                self.pfx_table.validate(10010, '110.1.0.0', 20)
+                self.pfx_table.validate_r(10011, '110.1.0.0', 20)
+        self.pfx_table.validate(10010, '110.1.0.0', 20)
+        self.assertIsNone(profiling.ACTIVE)
+
+        functions = profiler.report()['functions']
+        self.assertEqual(sorted(functions), ['PfxTable.validate', 'PfxTable.validate_r'])
+        self.assertEqual(sorted(functions['PfxTable.validate']), ['c_call', 'parse', 'result'])
+        self.assertEqual(functions['PfxTable.validate']['parse']['count'], 10)
+
+        rows = compare_reports(profiler.report(), {'functions': {}})
+        self.assertEqual(len(rows), 6)
+        self.assertIsNone(rows[0][3])
+
+    def test_sampling(self):
+        """
+        - Calls that are not sampled are not timed
+        """
+        with Profiler(sample_rate=0) as profiler:
+            self.pfx_table.validate(10010, '110.1.0.0', 20)
+
+        self.assertEqual(profiler.report()['functions'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_report
+-----------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import array
+import pickle
+import unittest
+
+from rtrlib import PfxTable
+from rtrlib.batch import AS_INVALID, LENGTH_INVALID, prepare_routes, validate_routes
+from rtrlib.report import SpaceSaving, ValidationReport
+
+VALID = 0
+NOT_FOUND = 1
+INVALID = 2
+
+
+class ValidationReportTest(unittest.TestCase):
+
+    RECORDS = [
+        (10010, '110.1.0.0', 20, 24),
+        (10020, '120.1.0.0', 20, 32),
+        (10030, '130::', 64, 64)
+    ]
+
+    ROUTES = [
+        (10010, '110.1.0.0', 20),
+        (10010, '110.1.0.0', 18),
+        (10010, '110.1.0.0', 30),
+        (10011, '110.1.0.0', 20),
+        (10011, '110.1.0.0', 30),
+        (10030, '130::', 66),
+    ]
+
+    def setUp(self):
+        self.pfx_table = PfxTable()
+        for record in self.RECORDS:
+            self.pfx_table.add_record(*record)
+
+    def tearDown(self):
+        self.pfx_table.close()
+
+    def test_validate_routes(self):
+        """
+        - Validate a batch of routes with state and invalid causes
+        """
+        codes = validate_routes(self.pfx_table.pfx_table, self.ROUTES)
+        self.assertEqual(list(codes), [VALID,
+                                       NOT_FOUND,
+                                       INVALID | LENGTH_INVALID,
+                                       INVALID | AS_INVALID,
+                                       INVALID | AS_INVALID | LENGTH_INVALID,
+                                       INVALID | LENGTH_INVALID])
+
+        for route, code in zip(self.ROUTES, codes):
+            result = self.pfx_table.validate_r(*route)
+            self.assertEqual(result.state.value, code & 3)
+            self.assertEqual(result.as_invalid, bool(code & AS_INVALID))
+            self.assertEqual(result.length_invalid, bool(code & LENGTH_INVALID))
+
+    def test_validate_routes_out(self):
+        """
+        - Write codes into caller buffers, with and without flags
+        """
+        expected = validate_routes(self.pfx_table.pfx_table, self.ROUTES)
+        routes = prepare_routes(self.ROUTES)
+
+        out = bytearray(len(routes) + 1)
+        self.assertIs(self.pfx_table.validate_codes(routes, out=out), out)
+        self.assertEqual(out[:-1], expected)
+
+        out = array.array('b', [0] * len(routes))
+        self.pfx_table.validate_codes(routes, out=out, flags=False)
+        self.assertEqual(list(out), [code & 3 for code in expected])
+
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            out = numpy.zeros(len(routes), dtype=numpy.int8)
+            self.pfx_table.validate_codes(self.ROUTES, out=out)
+            self.assertEqual(out.tolist(), list(expected))
+
+        with self.assertRaises(ValueError):
+            self.pfx_table.validate_codes(routes, out=bytearray(2))
+        with self.assertRaises(TypeError):
+            self.pfx_table.validate_codes(routes, out=bytes(len(routes)))
+
+    def test_report(self):
+        """
+        - Aggregate routes and merge reports
+        """
+        report = ValidationReport(top_k=3)
+        report.update(self.pfx_table.pfx_table, iter(self.ROUTES), batch_size=4)
+        other = ValidationReport(top_k=3)
+        other.update(self.pfx_table.pfx_table, self.ROUTES[:1])
+        report.merge(pickle.loads(pickle.dumps(other)))
+
+        self.assertEqual(report.routes, 7)
+        self.assertEqual(report.states, {4: [2, 1, 3], 6: [0, 0, 1]})
+        self.assertEqual(report.lengths[4][30], [0, 0, 2])
+        self.assertEqual((report.as_invalid, report.length_invalid,
+                          report.as_and_length_invalid), (1, 2, 1))
+        self.assertEqual(report.invalid_share_by_origin(1)[0][:3], (10011, 2, 2))
+        self.assertEqual(report.as_dict()['states'][6]['invalid'], 1)
+
+    def test_space_saving(self):
+        """
+        - Keep the heaviest keys in bounded memory
+        """
+        counts = {1: 30, 2: 5, 3: 20}
+        counter = SpaceSaving(5)
+        for key in [1] * 30 + [2] * 5 + list(range(100, 120)) + [3] * 20:
+            counter.add(key)
+
+        self.assertEqual(len(counter), 5)
+        self.assertEqual(set(key for key, _, _ in counter.top(2)), set([1, 3]))
+        for key, count, error in counter.top():
+            self.assertTrue(count - error <= counts.get(key, 1) <= count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_session_state
+------------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+
+from _rtrlib import ffi, lib
+
+from rtrlib import PfxTable
+from rtrlib.records import create_pfx_record
+from rtrlib.session_state import load_session_state, save_session_state
+
+
+def _monotonic_time():
+    seconds = ffi.new('time_t *')
+    lib.rtr_monotonic_time(seconds)
+    return seconds[0]
+
+
+class SessionStateTest(unittest.TestCase):
+
+    RECORDS = [
+        (10010, '110.1.0.0', 20, 24),
+        (10020, '120.1.0.0', 20, 32),
+        (10030, '130::', 64, 64)
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _session(self):
+        """
+        Create a socket with its own prefix table
+        """
+        pfx_table = PfxTable()
+        self.addCleanup(pfx_table.close)
+        socket = ffi.new('struct rtr_socket *')
+        socket.pfx_table = pfx_table.pfx_table
+        socket.expire_interval = 7200
+        socket.version = 1
+        socket.request_session_id = True
+        return pfx_table, socket
+
+    def _records(self, pfx_table):
+        return sorted((r.asn, r.prefix, r.min_len, r.max_len)
+                      for r in pfx_table.snapshot())
+
+    def test_roundtrip(self):
+        """
+        - Restore the records and the session of a saved socket
+        """
+        pfx_table, socket = self._session()
+        socket.state = lib.RTR_ESTABLISHED
+        socket.session_id = 42
+        socket.serial_number = 1234
+        socket.last_update = _monotonic_time() - 10
+        for record in self.RECORDS:
+            lib.pfx_table_add(socket.pfx_table, create_pfx_record(*record, socket=socket))
+        # records of other sockets are not saved
+        pfx_table.add_record(10040, '140.1.0.0', 16, 16)
+
+        self.assertTrue(save_session_state(self.path, 'localhost', '8282', socket))
+
+        restored_table, restored = self._session()
+        self.assertTrue(load_session_state(self.path, 'localhost', '8282', restored))
+        self.assertEqual(self._records(restored_table), sorted(self.RECORDS))
+        self.assertEqual(restored.session_id, 42)
+        self.assertEqual(restored.serial_number, 1234)
+        self.assertFalse(restored.request_session_id)
+        # the age of the last update is kept on the monotonic clock
+        self.assertAlmostEqual(_monotonic_time() - restored.last_update, 10, delta=2)
+
+    def test_rejected(self):
+        """
+        - Ignore state of unestablished sessions, other servers and expired state
+        """
+        _, socket = self._session()
+        socket.state = lib.RTR_SYNC
+        self.assertFalse(save_session_state(self.path, 'localhost', '8282', socket))
+        self.assertFalse(load_session_state(self.path, 'localhost', '8282', socket))
+
+        socket.state = lib.RTR_ESTABLISHED
+        socket.last_update = _monotonic_time() - 7201
+        self.assertTrue(save_session_state(self.path, 'localhost', '8282', socket))
+
+        restored_table, restored = self._session()
+        self.assertFalse(load_session_state(self.path, 'localhost', '8282', restored))
+
+        # time passed since the save counts towards the expiry
+        socket.last_update = _monotonic_time() - 3600
+        self.assertTrue(save_session_state(self.path, 'localhost', '8282', socket))
+        with open(self.path, 'r+b') as state_file:
+            state_file.seek(14)
+            state_file.write(struct.pack('!d', time.time() - 3601))
+        self.assertFalse(load_session_state(self.path, 'localhost', '8282', restored))
+
+        socket.last_update = _monotonic_time()
+        self.assertTrue(save_session_state(self.path, 'localhost', '8282', socket))
+        self.assertFalse(load_session_state(self.path, 'otherhost', '8282', restored))
+        self.assertTrue(restored.request_session_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_sharding
+-------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+import random
+import socket
+import struct
+
+from rtrlib import PfxTable
+from rtrlib.sharding import ShardedPfxTable
+
+
+def _records(rnd, count):
+    records = set()
+    while len(records) < count:
+        if rnd.random() < 0.3:
+            length = rnd.choice([2, 16, 32, 48])
+            value = rnd.getrandbits(16) << 112 | 0x2 << 124
+            value &= ~((1 << (128 - length)) - 1)
+            prefix = socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', value >> 64,
+                                                                   value & (2 ** 64 - 1)))
+            records.add((rnd.randint(1, 3), prefix, length, min(128, length + 16)))
+        else:
+            length = rnd.choice([1, 3, 8, 16, 24])
+            value = rnd.getrandbits(32) & ~((1 << (32 - length)) - 1) & 0xFFFFFFFF
+            records.add((rnd.randint(1, 3), socket.inet_ntoa(struct.pack('!I', value)),
+                         length, min(32, length + 4)))
+    return sorted(records)
+
+
+def _routes(records):
+    return [(asn, prefix, mask_len)
+            for asn, prefix, min_len, max_len in records
+            for asn in (asn, 4)
+            for mask_len in (min_len, max_len, max_len + 1 if max_len < 32 else max_len)]
+
+
+class ShardedPfxTableTest(unittest.TestCase):
+
+    def test_results(self):
+        """
+        - Sharded tables validate every route like one table
+        """
+        rnd = random.Random(0)
+        records = _records(rnd, 300)
+        routes = _routes(records)
+        table = PfxTable()
+        self.addCleanup(table.close)
+        table.reload(records)
+
+        for shards in (1, 4, 16):
+            sharded = ShardedPfxTable(shards)
+            self.addCleanup(sharded.close)
+            for record in records:
+                sharded.add_record(*record)
+            validator = sharded.validator()
+
+            for route in routes:
+                state = table.validate(*route).state
+                self.assertEqual(sharded.validate(*route).state, state, route)
+                self.assertEqual(validator.validate(*route), state, route)
+
+            self.assertEqual(sorted((r.asn, r.prefix, r.min_len, r.max_len)
+                                    for r in sharded.snapshot()), records)
+            self.assertEqual(len(sharded.more_specifics('0.0.0.0', 0)),
+                             len(list(table.snapshot(ipv6=False))))
+
+            for record in records[::2]:
+                sharded.remove_record(*record)
+            self.assertEqual(len(sharded.snapshot()), len(records) // 2)
+
+        self.assertRaises(ValueError, ShardedPfxTable, 3)
+
+    def test_reload(self):
+        """
+        - Reloaded shards hold the records covering them
+        """
+        sharded = ShardedPfxTable(4)
+        self.addCleanup(sharded.close)
+        sharded.reload([(10010, '110.1.0.0', 16, 24), (10020, '0.0.0.0', 1, 8)])
+
+        self.assertTrue(sharded.validate(10010, '110.1.2.0', 24).is_valid)
+        self.assertTrue(sharded.validate(10020, '64.0.0.0', 8).is_valid)
+        self.assertTrue(sharded.validate(10020, '128.0.0.0', 8).not_found)
+        self.assertEqual(len(sharded.covering('110.1.2.0', 24)), 2)
+        self.assertEqual(len(sharded.validate_r(10030, '110.1.2.0', 24).reason), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
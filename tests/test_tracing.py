@@ -0,0 +1,85 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_tracing
+------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+from _rtrlib import ffi
+
+from rtrlib.records import PFXRecord, create_pfx_record
+from rtrlib.rtr_socket import RTRSocket, RTRSocketState
+from rtrlib.tracing import SyncTracer
+
+
+class SyncTracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        self.tracer = SyncTracer(span_exporter=lambda *span: self.spans.append(span))
+        self.socket = ffi.new('struct rtr_socket *')
+
+    def _state(self, state):
+        self.socket.state = state.value
+        self.tracer.status_update(None, None, RTRSocket(self.socket))
+
+    def _update(self):
+        record = create_pfx_record(10010, '110.1.0.0', 20, 24, self.socket)
+        self.tracer.pfx_update(PFXRecord(record), True, 0.5)
+
+    def test_sync(self):
+        """
+        - A sync is traced from CONNECTING to ESTABLISHED
+        """
+        self._update()
+        self._state(RTRSocketState.CONNECTING)
+        self._state(RTRSocketState.RESET)
+        self._state(RTRSocketState.SYNC)
+        self._update()
+        self._update()
+        self._state(RTRSocketState.ESTABLISHED)
+        self._update()
+
+        syncs = list(self.tracer.syncs().values())[0]
+        self.assertEqual(len(syncs), 1)
+        self.assertTrue(syncs[0].ok)
+        self.assertEqual(syncs[0].records, 2)
+        self.assertEqual(syncs[0].callback_time, 1.0)
+        self.assertEqual([p[0] for p in syncs[0].phases], ['connect', 'reset', 'pdus'])
+        self.assertEqual([s[0] for s in self.spans],
+                         ['rtr.connect', 'rtr.reset', 'rtr.pdus', 'rtr.sync'])
+        self.assertEqual(sum(count for _, count in self.tracer.histogram()), 1)
+        self.assertEqual(len(list(self.tracer.timeline().values())[0]), 4)
+
+    def test_same_phase(self):
+        """
+        - Consecutive states of one phase continue its span
+        """
+        self._state(RTRSocketState.CONNECTING)
+        self._state(RTRSocketState.FAST_RECONNECT)
+        self._state(RTRSocketState.CONNECTING)
+        self._state(RTRSocketState.SYNC)
+        self._state(RTRSocketState.ESTABLISHED)
+
+        syncs = list(self.tracer.syncs().values())[0]
+        self.assertEqual([p[0] for p in syncs[0].phases], ['connect', 'pdus'])
+        self.assertEqual([s[0] for s in self.spans], ['rtr.connect', 'rtr.pdus', 'rtr.sync'])
+
+    def test_error(self):
+        """
+        - An error state ends a sync as failed
+        """
+        self._state(RTRSocketState.CONNECTING)
+        self._state(RTRSocketState.ERROR_TRANSPORT)
+
+        syncs = list(self.tracer.syncs().values())[0]
+        self.assertFalse(syncs[0].ok)
+        self.assertEqual(syncs[0].end_state, RTRSocketState.ERROR_TRANSPORT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_update_log
+---------------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shutil
+import tempfile
+import unittest
+
+from _rtrlib import ffi
+
+from rtrlib import PfxTable, RTRManager
+from rtrlib.exceptions import UpdateLogError
+from rtrlib.records import PFXRecord, SPKIRecord, create_pfx_record
+from rtrlib.update_log import UpdateLogWriter, read_update_log, replay_update_log
+
+
+class UpdateLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'updates.log')
+        self.socket = ffi.new('struct rtr_socket *')
+
+        now = [100.0]
+
+        def clock():
+            now[0] += 0.5
+            return now[0]
+
+        spki = ffi.new('struct spki_record *')
+        spki.asn = 10030
+        spki.ski = list(range(20))
+        spki.socket = self.socket
+
+        with UpdateLogWriter(self.path, clock=clock) as log:
+            for asn, prefix, min_len, max_len in [(10010, '110.1.0.0', 20, 24),
+                                                  (10020, '120.1.0.0', 20, 32),
+                                                  (10030, '130::', 64, 64)]:
+                log.pfx_update(PFXRecord(create_pfx_record(asn, prefix, min_len,
+                                                           max_len, self.socket)), True)
+            log.pfx_update(PFXRecord(create_pfx_record(10020, '120.1.0.0', 20, 32,
+                                                       self.socket)), False)
+            log.spki_update(SPKIRecord(spki), True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read(self):
+        """
+        - Read back the recorded updates
+        """
+        updates = list(read_update_log(self.path))
+
+        self.assertEqual([(t, a) for t, _, a, _ in updates],
+                         [(100.5, True), (101.0, True), (101.5, True),
+                          (102.0, False), (102.5, True)])
+        self.assertEqual(set(s for _, s, _, _ in updates),
+                         set([int(ffi.cast('uintptr_t', self.socket))]))
+        self.assertEqual(str(updates[2][3]), str(PFXRecord(create_pfx_record(
+            10030, '130::', 64, 64))))
+        self.assertEqual(list(updates[4][3].ski), list(range(20)))
+
+        with open(self.path, 'r+b') as log_file:
+            log_file.write(b'garbage!')
+        with self.assertRaises(UpdateLogError):
+            list(read_update_log(self.path))
+
+    def test_replay(self):
+        """
+        - Replay into a table and through the update callbacks of a manager
+        """
+        with PfxTable() as table:
+            self.assertEqual(replay_update_log(self.path, table), 5)
+            self.assertTrue(table.validate(10010, '110.1.0.0', 24).is_valid)
+            self.assertTrue(table.validate(10020, '120.1.0.0', 24).not_found)
+            self.assertTrue(table.validate(10030, '130::', 64).is_valid)
+
+        pfx_updates = []
+        spki_updates = []
+        mgr = RTRManager('localhost', 8282,
+                         pfx_update_callback=lambda r, a, d: pfx_updates.append((r.asn, a)),
+                         spki_update_callback=lambda r, a, d: spki_updates.append((r.asn, a)))
+        sleeps = []
+        replay_update_log(self.path, mgr, speed=2.0, sleep=sleeps.append, clock=lambda: 0)
+
+        self.assertEqual(pfx_updates, [(10010, True), (10020, True), (10030, True),
+                                       (10020, False)])
+        self.assertEqual(spki_updates, [(10030, True)])
+        self.assertEqual(sleeps, [0.25, 0.5, 0.75, 1.0])
+        self.assertTrue(mgr.validate(10010, '110.1.0.0', 24).is_valid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+"""
+tests.test_vector
+-----------------
+"""
+
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import socket
+import struct
+import unittest
+
+from rtrlib import PfxTable
+from rtrlib.batch import validate_routes
+
+try:
+    import numpy
+    from rtrlib.vector import VectorEngine
+except ImportError:
+    numpy = None
+
+
+def _random_prefix(rnd, ipv6, length):
+    bits = 128 if ipv6 else 32
+    # few distinct upper bits so that records nest and routes hit them
+    value = (rnd.getrandbits(4) << (bits - 4)) | rnd.getrandbits(bits - 4)
+    value &= ~((1 << (bits - length)) - 1)
+    if ipv6:
+        return socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', value >> 64,
+                                                             value & (2 ** 64 - 1)))
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def _random_records(rnd, count):
+    records = set()
+    while len(records) < count:
+        ipv6 = rnd.random() < 0.3
+        bits = 128 if ipv6 else 32
+        min_len = rnd.choice([8, 12, 16, 20, 24] +
+                             ([32, 48, 64, 72, 96, 128] if ipv6 else [28, 32]))
+        max_len = min(bits, min_len + rnd.choice([0, 0, 1, 4, 8]))
+        records.add((rnd.choice([0, 1, 2, 3, 4]), _random_prefix(rnd, ipv6, min_len),
+                     min_len, max_len))
+    return sorted(records)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class VectorEngineTest(unittest.TestCase):
+
+    def test_differential(self):
+        """
+        - Return the same result codes as the C trie for random tables and routes
+        """
+        rnd = random.Random(42)
+        for _ in range(5):
+            records = _random_records(rnd, 300)
+            routes = []
+            for asn, prefix, min_len, max_len in records:
+                bits = 128 if ':' in prefix else 32
+                for mask_len in (min_len, max_len, min(bits, max_len + 1)):
+                    routes.append((rnd.choice([asn, 1, 5]), prefix, mask_len))
+            for _ in range(2000):
+                ipv6 = rnd.random() < 0.3
+                mask_len = rnd.randint(0, 128 if ipv6 else 32)
+                routes.append((rnd.randint(0, 5), _random_prefix(rnd, ipv6, mask_len),
+                               mask_len))
+
+            table = PfxTable()
+            table.reload(records)
+            engine = VectorEngine.from_table(table)
+
+            expected = validate_routes(table.pfx_table, routes)
+            codes = engine.validate_routes(routes)
+            self.assertEqual(codes.tolist(), list(expected))
+            self.assertEqual([code & 3 for code in codes.tolist()],
+                             [table.validate(*route).state.value for route in routes])
+            self.assertEqual(set(code & 3 for code in codes.tolist()), set([0, 1, 2]))
+
+    def test_batches(self):
+        """
+        - Validate numpy arrays into a caller buffer
+        """
+        engine = VectorEngine([(10010, '110.1.0.0', 20, 24), (10030, '130::', 64, 64)])
+        address = struct.unpack('!I', socket.inet_aton('110.1.0.0'))[0]
+        out = numpy.zeros(4, dtype=numpy.uint8)
+
+        codes = engine.validate_ipv4(numpy.array([10010, 10010, 10011]),
+                                     numpy.array([address] * 3),
+                                     numpy.array([24, 25, 20]), out=out)
+        self.assertEqual(codes.tolist(), [0, 2 | 8, 2 | 4])
+        self.assertEqual(out.tolist(), [0, 10, 6, 0])
+
+        codes = engine.validate_ipv6([10030, 10030], [0x0130 << 48] * 2, [0, 1], [64, 128])
+        self.assertEqual(codes.tolist(), [0, 2 | 8])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import json
+import sys
+
+from rtrlib.profiling import compare_reports
+
+
+def _format_us(seconds):
+    return '{:10.2f}'.format(seconds * 1e6) if seconds is not None else '{:>10}'.format('-')
+
+
+def main(argv):
+    """Print the comparison of two report files."""
+    if len(argv) != 3:
+        print("Usage: {} OLD.json NEW.json".format(argv[0]))
+        return 1
+
+    with open(argv[1]) as old_file, open(argv[2]) as new_file:
+        rows = compare_reports(json.load(old_file), json.load(new_file))
+
+    print('{:35} {:12} {:>10} {:>10} {:>8}'.format('function', 'phase', 'old us', 'new us', 'change'))
+    for name, phase, old_mean, new_mean in rows:
+        change = ''
+        if old_mean and new_mean is not None:
+            change = '{:+7.1f}%'.format((new_mean - old_mean) / old_mean * 100)
+        print('{:35} {:12} {} {} {:>8}'.format(name, phase, _format_us(old_mean),
+                                               _format_us(new_mean), change))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
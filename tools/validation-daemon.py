@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import argparse
+import logging
+import signal
+import threading
+
+from rtrlib import RTRManager
+from rtrlib.daemon import ValidationServer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve route origin validation on a Unix socket")
+    parser.add_argument("hostname")
+    parser.add_argument("port", type=int)
+    parser.add_argument("socket", help="path of the Unix socket")
+    parser.add_argument(
+                        "-s", "--state-file",
+                        default=None,
+                        help="resume the RTR session from this file"
+                        )
+    parser.add_argument(
+                        "-v",
+                        default=False,
+                        action="store_true",
+                        help="Log debug messages"
+                        )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.v else logging.INFO)
+
+    mgr = RTRManager(args.hostname, args.port, state_file=args.state_file)
+    mgr.start(wait=False)
+
+    server = ValidationServer(mgr, args.socket)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        thread.join()
+        server.close()
+        mgr.stop()
+
+
+if __name__ == '__main__':
+    main()